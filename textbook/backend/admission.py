@@ -0,0 +1,134 @@
+"""
+Admission Control
+Bounded concurrency pools that shed load with 429 instead of queueing without limit
+"""
+
+import asyncio
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict
+
+from fastapi import HTTPException
+
+
+class AdmissionPool:
+    """
+    Limits concurrent work of one kind (chat, translation, auth).
+    Requests beyond max_concurrency wait in a bounded queue. A request is
+    rejected immediately when the queue is full or its estimated wait
+    exceeds the queue deadline, and rejected after waiting if no slot
+    frees up within the deadline.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._in_flight = 0
+        self._waiting = 0
+        # Exponentially weighted average time a request holds a slot
+        self._avg_service_seconds = 0.0
+        self._stats = {
+            "admitted": 0,
+            "rejected_queue_full": 0,
+            "rejected_deadline": 0,
+            "timed_out_in_queue": 0,
+            "queue_wait_seconds_total": 0.0,
+            "queue_wait_seconds_max": 0.0,
+        }
+
+    @classmethod
+    def from_env(cls, name: str, max_concurrency: int, max_queue: int, queue_timeout: float) -> "AdmissionPool":
+        """Build a pool whose limits can be overridden by <NAME>_MAX_CONCURRENCY etc."""
+        prefix = name.upper()
+        return cls(
+            name,
+            max_concurrency=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", max_concurrency)),
+            max_queue=int(os.getenv(f"{prefix}_MAX_QUEUE", max_queue)),
+            queue_timeout=float(os.getenv(f"{prefix}_QUEUE_TIMEOUT_SECONDS", queue_timeout)),
+        )
+
+    def _estimated_wait(self) -> float:
+        """Expected queue time for a request joining the back of the queue now"""
+        position = self._waiting + 1
+        return position * self._avg_service_seconds / self.max_concurrency
+
+    def _reject(self, reason: str, retry_after: float):
+        self._stats[reason] += 1
+        raise HTTPException(
+            status_code=429,
+            detail=f"Server is busy ({self.name}), please retry shortly",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    @asynccontextmanager
+    async def admit(self):
+        """Hold a slot for the duration of the block, or raise a 429 HTTPException"""
+        if self._semaphore.locked():
+            if self._waiting >= self.max_queue:
+                self._reject("rejected_queue_full", self._estimated_wait() or self.queue_timeout)
+            estimated_wait = self._estimated_wait()
+            if estimated_wait > self.queue_timeout:
+                self._reject("rejected_deadline", estimated_wait)
+
+        self._waiting += 1
+        queued_at = time.monotonic()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._reject("timed_out_in_queue", self._estimated_wait() or self.queue_timeout)
+        finally:
+            self._waiting -= 1
+
+        started = time.monotonic()
+        queue_wait = started - queued_at
+        self._stats["admitted"] += 1
+        self._stats["queue_wait_seconds_total"] += queue_wait
+        self._stats["queue_wait_seconds_max"] = max(self._stats["queue_wait_seconds_max"], queue_wait)
+        self._in_flight += 1
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+            service_time = time.monotonic() - started
+            if self._avg_service_seconds == 0.0:
+                self._avg_service_seconds = service_time
+            else:
+                self._avg_service_seconds = 0.8 * self._avg_service_seconds + 0.2 * service_time
+
+    async def slot(self):
+        """FastAPI dependency that holds a slot while the endpoint runs"""
+        async with self.admit():
+            yield
+
+    def stats(self) -> Dict:
+        admitted = self._stats["admitted"]
+        return {
+            **self._stats,
+            "queue_wait_seconds_total": round(self._stats["queue_wait_seconds_total"], 3),
+            "queue_wait_seconds_max": round(self._stats["queue_wait_seconds_max"], 3),
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "queue_timeout_seconds": self.queue_timeout,
+            "avg_service_seconds": round(self._avg_service_seconds, 3),
+            "avg_queue_wait_seconds": round(self._stats["queue_wait_seconds_total"] / admitted, 4) if admitted else 0.0,
+        }
+
+
+# Separate pools so a burst of one kind of work cannot starve the others
+chat_pool = AdmissionPool.from_env("chat", max_concurrency=8, max_queue=32, queue_timeout=10.0)
+translation_pool = AdmissionPool.from_env("translation", max_concurrency=4, max_queue=16, queue_timeout=15.0)
+auth_pool = AdmissionPool.from_env("auth", max_concurrency=4, max_queue=64, queue_timeout=5.0)
+# One slot per /chat/batch call; its completions are bounded by the RAG engine
+batch_pool = AdmissionPool.from_env("chat_batch", max_concurrency=2, max_queue=4, queue_timeout=30.0)
+
+
+def admission_stats() -> Dict[str, Dict]:
+    return {pool.name: pool.stats() for pool in (chat_pool, translation_pool, auth_pool, batch_pool)}
@@ -7,14 +7,30 @@ from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel, EmailStr
 from sqlalchemy.orm import Session
 from typing import Optional
-import bcrypt
+import os
 import uuid
 from datetime import datetime
 
 from database import get_db, UserProfile
+from admission import auth_pool
+from passwords import password_hasher
+from tokens import TokenClaims, get_token_claims, token_signer
+from cache import TTLCache
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
+# Profiles change rarely but are read on every personalized chat turn.
+# Writes on this worker go through the cache; other workers see them
+# after at most PROFILE_CACHE_TTL_SECONDS.
+profile_cache = TTLCache(
+    "profiles",
+    max_entries=int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", 10000)),
+    ttl_seconds=float(os.getenv("PROFILE_CACHE_TTL_SECONDS", 300))
+)
+
+# Background levels accepted at signup and on profile updates
+VALID_LEVELS = ["beginner", "intermediate", "advanced"]
+
 # Request/Response Models
 
 class SignupRequest(BaseModel):
@@ -46,22 +62,42 @@ class ProfileResponse(BaseModel):
 # Helper Functions
 
 def hash_password(password: str) -> str:
-    """Hash password using bcrypt"""
-    salt = bcrypt.gensalt()
-    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+    """Hash password using bcrypt (blocking; endpoints use password_hasher.hash_async)"""
+    return password_hasher.hash(password)
 
 def verify_password(password: str, hashed: str) -> bool:
-    """Verify password against hash"""
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    """Verify password against hash (blocking; endpoints use password_hasher.verify_async)"""
+    return password_hasher.verify(password, hashed)
+
+def _profile_response(user: UserProfile) -> ProfileResponse:
+    return ProfileResponse(
+        user_id=user.id,
+        email=user.email,
+        name=user.name,
+        software_background=user.software_background,
+        hardware_background=user.hardware_background
+    )
 
-def generate_token() -> str:
-    """Generate a simple session token"""
-    return str(uuid.uuid4())
+def get_cached_profile(db: Session, user_id: str) -> Optional[ProfileResponse]:
+    """Look up a profile through the cache, loading it from the database on a miss"""
+    def load() -> Optional[ProfileResponse]:
+        user = db.query(UserProfile).filter(UserProfile.id == user_id).first()
+        return _profile_response(user) if user else None
+    
+    return profile_cache.get_or_load(user_id, load)
+
+def generate_token(user_id: str, software_background: str, hardware_background: str) -> str:
+    """Generate a signed, expiring session token carrying the user's background levels"""
+    return token_signer.issue(user_id, software_background, hardware_background)
 
 # API Endpoints
 
 @router.post("/signup", response_model=AuthResponse)
-async def signup(request: SignupRequest, db: Session = Depends(get_db)):
+async def signup(
+    request: SignupRequest,
+    db: Session = Depends(get_db),
+    _slot: None = Depends(auth_pool.slot)
+):
     """
     User signup with background information collection
     Collects software and hardware experience for personalization
@@ -72,8 +108,7 @@ async def signup(request: SignupRequest, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Validate background levels
-    valid_levels = ["beginner", "intermediate", "advanced"]
-    if request.software_background not in valid_levels or request.hardware_background not in valid_levels:
+    if request.software_background not in VALID_LEVELS or request.hardware_background not in VALID_LEVELS:
         raise HTTPException(
             status_code=400,
             detail="Background levels must be: beginner, intermediate, or advanced"
@@ -81,7 +116,7 @@ async def signup(request: SignupRequest, db: Session = Depends(get_db)):
     
     # Create new user
     user_id = str(uuid.uuid4())
-    hashed_pw = hash_password(request.password)
+    hashed_pw = await password_hasher.hash_async(request.password)
     
     new_user = UserProfile(
         id=user_id,
@@ -96,9 +131,10 @@ async def signup(request: SignupRequest, db: Session = Depends(get_db)):
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
+    profile_cache.set(user_id, _profile_response(new_user))
     
     # Generate session token
-    token = generate_token()
+    token = generate_token(user_id, request.software_background, request.hardware_background)
     
     return AuthResponse(
         user_id=user_id,
@@ -110,7 +146,11 @@ async def signup(request: SignupRequest, db: Session = Depends(get_db)):
     )
 
 @router.post("/signin", response_model=AuthResponse)
-async def signin(request: SigninRequest, db: Session = Depends(get_db)):
+async def signin(
+    request: SigninRequest,
+    db: Session = Depends(get_db),
+    _slot: None = Depends(auth_pool.slot)
+):
     """User signin"""
     # Find user
     user = db.query(UserProfile).filter(UserProfile.email == request.email).first()
@@ -118,11 +158,17 @@ async def signin(request: SigninRequest, db: Session = Depends(get_db)):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # Verify password
-    if not verify_password(request.password, user.password_hash):
+    if not await password_hasher.verify_async(request.password, user.password_hash):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    # Upgrade the hash transparently if BCRYPT_ROUNDS has changed
+    if password_hasher.needs_rehash(user.password_hash):
+        user.password_hash = await password_hasher.hash_async(request.password)
+        db.commit()
+        password_hasher.record_rehash()
+    
     # Generate token
-    token = generate_token()
+    token = generate_token(user.id, user.software_background, user.hardware_background)
     
     return AuthResponse(
         user_id=user.id,
@@ -136,26 +182,34 @@ async def signin(request: SigninRequest, db: Session = Depends(get_db)):
 @router.get("/profile/{user_id}", response_model=ProfileResponse)
 async def get_profile(user_id: str, db: Session = Depends(get_db)):
     """Get user profile"""
-    user = db.query(UserProfile).filter(UserProfile.id == user_id).first()
-    if not user:
+    profile = get_cached_profile(db, user_id)
+    if not profile:
         raise HTTPException(status_code=404, detail="User not found")
     
-    return ProfileResponse(
-        user_id=user.id,
-        email=user.email,
-        name=user.name,
-        software_background=user.software_background,
-        hardware_background=user.hardware_background
-    )
+    return profile
 
 @router.put("/profile/{user_id}")
 async def update_profile(
     user_id: str,
     software_background: Optional[str] = None,
     hardware_background: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    claims: Optional[TokenClaims] = Depends(get_token_claims)
 ):
-    """Update user background preferences"""
+    """Update user background preferences (only the signed-in user may update their own)"""
+    if claims is None:
+        raise HTTPException(status_code=401, detail="Authentication required", headers={"WWW-Authenticate": "Bearer"})
+    if claims.user_id != user_id:
+        raise HTTPException(status_code=403, detail="Cannot update another user's profile")
+    
+    # Validate background levels
+    for level in (software_background, hardware_background):
+        if level is not None and level not in VALID_LEVELS:
+            raise HTTPException(
+                status_code=400,
+                detail="Background levels must be: beginner, intermediate, or advanced"
+            )
+    
     user = db.query(UserProfile).filter(UserProfile.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -167,4 +221,11 @@ async def update_profile(
     
     db.commit()
     
-    return {"message": "Profile updated successfully"}
+    # Write through so this worker never serves the old levels
+    profile_cache.set(user_id, _profile_response(user))
+    
+    # Tokens carry the background levels, so hand back one that reflects the update
+    return {
+        "message": "Profile updated successfully",
+        "token": generate_token(user.id, user.software_background, user.hardware_background)
+    }
@@ -0,0 +1,101 @@
+"""
+Micro-Batching
+Coalesces calls that arrive within a short window into one batched call,
+for blocking code running on worker threads
+"""
+
+import threading
+from typing import Callable, Dict, Generic, List, Optional, TypeVar
+
+Item = TypeVar("Item")
+Result = TypeVar("Result")
+
+
+class _Batch:
+    def __init__(self):
+        self.items: List = []
+        self.results: Optional[List] = None
+        self.error: Optional[BaseException] = None
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+
+class MicroBatcher(Generic[Item, Result]):
+    """
+    submit() blocks until its item's result is ready. The first caller of a
+    batch waits up to window_seconds (or until max_size items have joined),
+    then calls process(items) on behalf of everyone and fans the results
+    back out in order. If process raises, every caller in the batch gets the
+    exception. A window of 0 or a max_size of 1 calls process directly.
+    """
+
+    def __init__(self, process: Callable[[List[Item]], List[Result]], window_seconds: float, max_size: int):
+        self.process = process
+        self.window_seconds = window_seconds
+        self.max_size = max(1, max_size)
+        self._open: Optional[_Batch] = None
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "batches": 0, "largest_batch": 0, "full_batches": 0, "errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_seconds > 0 and self.max_size > 1
+
+    def submit(self, item: Item) -> Result:
+        if not self.enabled:
+            return self.process([item])[0]
+
+        with self._lock:
+            self._stats["calls"] += 1
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = _Batch()
+            index = len(batch.items)
+            batch.items.append(item)
+            if len(batch.items) >= self.max_size:
+                # Later arrivals start a new batch
+                self._open = None
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window_seconds)
+            with self._lock:
+                if self._open is batch:
+                    self._open = None
+            self._run(batch)
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[index]
+
+    def _run(self, batch: _Batch):
+        # Nobody can join once the batch is closed, so items is final here
+        try:
+            results = self.process(batch.items)
+            if len(results) != len(batch.items):
+                raise ValueError(f"Batch of {len(batch.items)} returned {len(results)} results")
+            batch.results = results
+        except BaseException as e:
+            batch.error = e
+            self._stats["errors"] += 1
+        finally:
+            with self._lock:
+                self._stats["batches"] += 1
+                self._stats["largest_batch"] = max(self._stats["largest_batch"], len(batch.items))
+                if len(batch.items) >= self.max_size:
+                    self._stats["full_batches"] += 1
+            batch.done.set()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        return {
+            **stats,
+            "enabled": self.enabled,
+            "window_ms": self.window_seconds * 1000,
+            "max_size": self.max_size,
+            "average_batch": round(stats["calls"] / stats["batches"], 2) if stats["batches"] else 0.0,
+        }
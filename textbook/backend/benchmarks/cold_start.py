@@ -0,0 +1,188 @@
+"""
+Cold-Start Benchmark
+Measures import time and time-to-first-response of the backend in fresh processes
+
+Usage (from textbook/backend):
+    python benchmarks/cold_start.py
+    python benchmarks/cold_start.py --app main_enhanced --runs 5 --budget-import-ms 800
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = """
+import time
+started = time.perf_counter()
+import {module}
+print((time.perf_counter() - started) * 1000)
+"""
+
+
+def measure_import(module: str) -> float:
+    """Import the app module in a fresh interpreter and return milliseconds"""
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET.format(module=module)],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(module: str, limit: int) -> List[Dict]:
+    """Top-level packages ranked by cumulative import time (-X importtime)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+    packages: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        try:
+            cumulative_us = int(cumulative.strip())
+        except ValueError:
+            continue  # Header row
+        stripped = name.rstrip()
+        depth = (len(stripped) - len(stripped.strip())) // 2
+        # Depth 1 entries are the direct imports of the interpreter command
+        if depth <= 1:
+            top = stripped.strip().split(".")[0]
+            packages[top] = max(packages.get(top, 0), cumulative_us)
+
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+    return [{"module": name, "ms": round(us / 1000, 1)} for name, us in ranked[:limit]]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, deadline: float, expect_ok: bool) -> Optional[float]:
+    """Poll url until it responds (or returns 2xx if expect_ok); return perf_counter time"""
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                response.read()
+                return time.perf_counter()
+        except urllib.error.HTTPError:
+            if not expect_ok:
+                return time.perf_counter()
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            pass
+        time.sleep(0.01)
+    return None
+
+
+def measure_first_request(module: str, path: str, timeout: float) -> Dict:
+    """
+    Start uvicorn in a fresh process and time the first successful request.
+    first_response_ms: spawn until the server answers at all
+    first_request_ms: spawn until `path` answers
+    ready_ms: spawn until /ready returns 200 (None if it never does)
+    """
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{module}:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        # Startup needs a signing key; no tokens are issued here
+        env={"AUTH_TOKEN_ALLOW_EPHEMERAL": "true", **os.environ},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = started + timeout
+        first_response = wait_for(f"{base_url}/", deadline, expect_ok=False)
+        first_request = wait_for(f"{base_url}{path}", deadline, expect_ok=False)
+        ready = wait_for(f"{base_url}/ready", deadline, expect_ok=True)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    def elapsed(mark: Optional[float]) -> Optional[float]:
+        return round((mark - started) * 1000, 1) if mark else None
+
+    return {
+        "first_response_ms": elapsed(first_response),
+        "first_request_ms": elapsed(first_request),
+        "ready_ms": elapsed(ready),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure backend import and cold-start latency")
+    parser.add_argument("--app", default="main", help="App module to benchmark (main or main_enhanced)")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh processes per measurement")
+    parser.add_argument("--path", default="/health", help="Endpoint timed as the first request")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for the server")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to list")
+    parser.add_argument("--skip-server", action="store_true", help="Only measure import time")
+    parser.add_argument("--budget-import-ms", type=float, help="Fail if median import time exceeds this")
+    parser.add_argument("--budget-first-request-ms", type=float, help="Fail if median first request exceeds this")
+    parser.add_argument("--json", dest="json_path", help="Write the report to this file")
+    args = parser.parse_args()
+
+    import_times = [measure_import(args.app) for _ in range(args.runs)]
+    report = {
+        "app": args.app,
+        "runs": args.runs,
+        "import_ms": {
+            "median": round(statistics.median(import_times), 1),
+            "min": round(min(import_times), 1),
+            "max": round(max(import_times), 1),
+        },
+        "slowest_imports": slowest_imports(args.app, args.top),
+    }
+
+    if not args.skip_server:
+        server_runs = [measure_first_request(args.app, args.path, args.timeout) for _ in range(args.runs)]
+        report["server"] = {}
+        for key in ("first_response_ms", "first_request_ms", "ready_ms"):
+            values = [run[key] for run in server_runs if run[key] is not None]
+            report["server"][key] = round(statistics.median(values), 1) if values else None
+
+    print(json.dumps(report, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    failures = []
+    if args.budget_import_ms is not None and report["import_ms"]["median"] > args.budget_import_ms:
+        failures.append(f"import {report['import_ms']['median']}ms > {args.budget_import_ms}ms")
+    if args.budget_first_request_ms is not None:
+        first_request = report.get("server", {}).get("first_request_ms")
+        if first_request is None or first_request > args.budget_first_request_ms:
+            failures.append(f"first request {first_request}ms > {args.budget_first_request_ms}ms")
+
+    if failures:
+        print("❌ Cold-start budget exceeded: " + "; ".join(failures))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
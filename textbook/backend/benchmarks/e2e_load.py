@@ -0,0 +1,439 @@
+"""
+End-to-End Load Test
+Starts the backend against local stand-ins for every dependency and drives
+/chat, /translate, /auth/* and /session/* at a fixed concurrency, reporting
+per-endpoint latency percentiles, throughput and error rates
+
+Stand-ins: benchmarks/fake_openai.py for OpenRouter, embedded Qdrant
+(QDRANT_PATH) seeded from textbook/docs with the same hashed embeddings,
+SQLite for Neon, and the local translation backend. Pass --database-url or
+--qdrant-url to use a local Postgres or Qdrant server instead.
+
+Usage (from textbook/backend):
+    python benchmarks/e2e_load.py
+    python benchmarks/e2e_load.py --app main_enhanced --requests 500 --concurrency 32 --mix chat=4,stream=2
+    python benchmarks/e2e_load.py --llm-latency-ms 800 --budget-p95-ms 2500 --max-error-rate 0.01
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DOCS_DIR = BACKEND_DIR.parent / "docs"
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+from benchmarks.cold_start import free_port, wait_for  # noqa: E402
+from benchmarks.fake_openai import DEFAULT_DIMENSIONS, hash_embedding  # noqa: E402
+
+COLLECTION = "physical_ai_textbook"
+
+QUESTIONS = [
+    "What is a ROS 2 node?",
+    "How do topics differ from services in ROS 2?",
+    "How do I launch a robot in Gazebo?",
+    "What sensors can Gazebo simulate?",
+    "What is NVIDIA Isaac Sim used for?",
+    "How does Isaac ROS accelerate perception?",
+    "What is a Vision-Language-Action model?",
+    "How do humanoid robots keep their balance?",
+    "What is URDF and why do I need it?",
+    "How do I write a publisher in rclpy?",
+    "What is sim-to-real transfer?",
+    "How does Nav2 plan a path?",
+]
+
+TRANSLATE_TEXTS = [
+    "ROS 2 is the industry-standard middleware for robotics development.",
+    "Nodes communicate through topics, services and actions.",
+    "Run `ros2 topic list` to see the active topics.",
+    "Gazebo simulates physics, sensors and actuators so controllers can be tested safely.",
+]
+
+# Scenario weights; a scenario may issue several requests
+DEFAULT_MIX = "chat=5,translate=2,auth=1,session=2"
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 1) if ordered else 0.0
+
+
+def server_counters(text: str) -> Dict[str, float]:
+    """Error and fallback counters from the app's /metrics output"""
+    counters = {}
+    for line in text.splitlines():
+        if line.startswith(("textbook_errors_total", "textbook_fallbacks_total")):
+            name, _, value = line.rpartition(" ")
+            counters[name] = float(value)
+    return counters
+
+
+def seed_qdrant(client, docs_dir: Path, dimensions: int, chunk_words: int = 200) -> int:
+    """Chunk the docs and store them with hashed embeddings; returns the point count"""
+    from qdrant_client.models import Distance, PointStruct, VectorParams
+
+    if not client.collection_exists(COLLECTION):
+        client.create_collection(COLLECTION, vectors_config=VectorParams(size=dimensions, distance=Distance.COSINE))
+
+    points = []
+    paths = sorted(p for p in docs_dir.rglob("*") if p.suffix in (".md", ".mdx")) if docs_dir.is_dir() else []
+    for path in paths:
+        words = path.read_text(encoding="utf-8").split()
+        for start in range(0, len(words), chunk_words):
+            text = " ".join(words[start:start + chunk_words])
+            points.append(PointStruct(
+                id=len(points),
+                vector=hash_embedding(text, dimensions),
+                payload={"text": text, "file_name": path.name, "module": path.parent.name},
+            ))
+    if not points:
+        # No docs checked out; the built-in questions still need something to retrieve
+        for i, question in enumerate(QUESTIONS):
+            points.append(PointStruct(id=i, vector=hash_embedding(question, dimensions),
+                                      payload={"text": question, "file_name": "sample.md", "module": ""}))
+
+    for start in range(0, len(points), 256):
+        client.upsert(COLLECTION, points=points[start:start + 256])
+    return len(points)
+
+
+class LoadClient:
+    """Issues requests against the app and records latency per endpoint"""
+
+    def __init__(self, client, app: str, rng: random.Random):
+        self.client = client
+        self.app = app
+        self.rng = rng
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.first_byte: List[float] = []
+        self.sessions: List[str] = []
+
+    async def call(self, method: str, endpoint: str, url: str, **kwargs) -> Optional[Dict]:
+        started = time.perf_counter()
+        ok = False
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            ok = response.status_code < 400
+            return response.json() if ok else None
+        except Exception:
+            return None
+        finally:
+            self.latencies.setdefault(endpoint, []).append((time.perf_counter() - started) * 1000)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def _session(self) -> Optional[str]:
+        # Half the chats continue an earlier session, so history grows
+        return self.rng.choice(self.sessions) if self.sessions and self.rng.random() < 0.5 else None
+
+    async def chat(self):
+        body = await self.call("POST", "POST /chat", "/chat", json={
+            "message": self.rng.choice(QUESTIONS),
+            "session_id": self._session(),
+        })
+        if body and len(self.sessions) < 200:
+            self.sessions.append(body["session_id"])
+
+    async def stream(self):
+        """/chat/stream (main_enhanced only); also records time to first byte"""
+        endpoint = "POST /chat/stream"
+        started = time.perf_counter()
+        ok = False
+        try:
+            async with self.client.stream("POST", "/chat/stream", json={
+                "message": self.rng.choice(QUESTIONS),
+                "session_id": self._session(),
+            }) as response:
+                first = True
+                async for chunk in response.aiter_text():
+                    if first:
+                        self.first_byte.append((time.perf_counter() - started) * 1000)
+                        first = False
+                    ok = response.status_code < 400 and '"type": "error"' not in chunk
+        except Exception:
+            ok = False
+        finally:
+            self.latencies.setdefault(endpoint, []).append((time.perf_counter() - started) * 1000)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    async def translate(self):
+        text = self.rng.choice(TRANSLATE_TEXTS)
+        if self.app == "main":
+            await self.call("POST", "POST /translate", "/translate", params={"text": text})
+        else:
+            await self.call("POST", "POST /translate", "/translate", json={"text": text})
+
+    async def auth(self):
+        email = f"load-{uuid.uuid4().hex[:12]}@example.com"
+        user = await self.call("POST", "POST /auth/signup", "/auth/signup", json={
+            "email": email,
+            "name": "Load Test",
+            "password": "load-test-password",
+            "software_background": self.rng.choice(["beginner", "intermediate", "advanced"]),
+            "hardware_background": self.rng.choice(["beginner", "intermediate", "advanced"]),
+        })
+        if user:
+            await self.call("POST", "POST /auth/signin", "/auth/signin",
+                            json={"email": email, "password": "load-test-password"})
+            await self.call("GET", "GET /auth/profile/{user_id}", f"/auth/profile/{user['user_id']}")
+
+    async def session(self):
+        body = await self.call("POST", "POST /session/new", "/session/new")
+        session_id = body["session_id"] if body else (self.sessions[0] if self.sessions else None)
+        if session_id:
+            await self.call("GET", "GET /session/{session_id}/history", f"/session/{session_id}/history")
+
+
+def parse_mix(mix: str, app: str) -> Dict[str, float]:
+    weights = {}
+    for entry in mix.split(","):
+        name, _, weight = entry.partition("=")
+        name = name.strip()
+        if name not in ("chat", "stream", "translate", "auth", "session"):
+            raise ValueError(f"Unknown scenario '{name}' in --mix")
+        if name == "stream" and app != "main_enhanced":
+            raise ValueError("The stream scenario needs --app main_enhanced")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+async def run_load(base_url: str, app: str, requests: int, concurrency: int,
+                   weights: Dict[str, float], seed: int, warmup: int) -> Dict:
+    import httpx
+
+    rng = random.Random(seed)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        load = LoadClient(client, app, rng)
+        names = list(weights)
+        scenarios: List[Callable] = [
+            getattr(load, name) for name in rng.choices(names, [weights[n] for n in names], k=requests)
+        ]
+
+        # Unmeasured warm-up (connections, caches, lazy clients)
+        for scenario in scenarios[:warmup]:
+            await scenario()
+        load.latencies.clear()
+        load.errors.clear()
+        load.first_byte.clear()
+        counters_before = server_counters((await client.get("/metrics")).text)
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(scenario: Callable):
+            async with semaphore:
+                await scenario()
+
+        started = time.perf_counter()
+        await asyncio.gather(*[one(scenario) for scenario in scenarios])
+        elapsed = time.perf_counter() - started
+
+        stats = (await client.get("/stats")).json()
+        counters_after = server_counters((await client.get("/metrics")).text)
+
+    endpoints = {}
+    for endpoint, values in sorted(load.latencies.items()):
+        endpoints[endpoint] = {
+            "requests": len(values),
+            "errors": load.errors.get(endpoint, 0),
+            "error_rate": round(load.errors.get(endpoint, 0) / len(values), 4),
+            "requests_per_second": round(len(values) / elapsed, 2),
+            "latency_ms": {
+                "p50": percentile(values, 0.50),
+                "p95": percentile(values, 0.95),
+                "p99": percentile(values, 0.99),
+                "max": round(max(values), 1),
+                "mean": round(statistics.mean(values), 1),
+            },
+        }
+    if load.first_byte:
+        endpoints["POST /chat/stream"]["first_byte_ms"] = {
+            "p50": percentile(load.first_byte, 0.50),
+            "p95": percentile(load.first_byte, 0.95),
+            "p99": percentile(load.first_byte, 0.99),
+        }
+
+    # Handled upstream failures still return 200 (with an apology), so the
+    # server's own error and fallback counters are part of the error rate
+    server_events = {
+        name: int(value - counters_before.get(name, 0))
+        for name, value in sorted(counters_after.items())
+        if value > counters_before.get(name, 0)
+    }
+    fallbacks = sum(v for name, v in server_events.items() if name.startswith("textbook_fallbacks_total"))
+
+    total = sum(len(values) for values in load.latencies.values())
+    errors = sum(load.errors.values())
+    return {
+        "scenarios": requests,
+        "concurrency": concurrency,
+        "elapsed_seconds": round(elapsed, 3),
+        "requests": total,
+        "requests_per_second": round(total / elapsed, 2) if elapsed else 0.0,
+        "error_rate": round((errors + fallbacks) / total, 4) if total else 0.0,
+        "failed_requests": errors,
+        "degraded_responses": fallbacks,
+        "endpoints": endpoints,
+        "server_events": server_events,
+        "server": {key: stats.get(key) for key in ("admission", "event_loop", "usage")},
+    }
+
+
+def start_process(args: List[str], env: Dict[str, str], log_path: Path) -> subprocess.Popen:
+    log = open(log_path, "w")
+    return subprocess.Popen(args, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def stop_process(process: Optional[subprocess.Popen]):
+    if process is None or process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the backend against local stand-ins")
+    parser.add_argument("--app", default="main", help="App module to benchmark (main or main_enhanced)")
+    parser.add_argument("--requests", type=int, default=300, help="Scenarios to run")
+    parser.add_argument("--concurrency", type=int, default=16, help="Scenarios in flight at once")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Scenario weights: chat, stream, translate, auth, session")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured scenarios run first")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="Fake LLM time to first token")
+    parser.add_argument("--token-ms", type=float, default=5.0, help="Fake LLM time per token")
+    parser.add_argument("--answer-tokens", type=int, default=60, help="Fake LLM answer length")
+    parser.add_argument("--embedding-latency-ms", type=float, default=20.0, help="Fake embeddings latency")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="Fake API random extra latency")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Fake API failure probability")
+    parser.add_argument("--translation-latency-ms", type=float, default=50.0, help="Local translation latency")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12, help="BCRYPT_ROUNDS for the app")
+    parser.add_argument("--database-url", help="Database to use instead of a temporary SQLite file")
+    parser.add_argument("--qdrant-url", help="Qdrant server to seed and use instead of embedded Qdrant")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers (needs --qdrant-url if > 1)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for scenario selection")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds to wait for the app to be ready")
+    parser.add_argument("--budget-p95-ms", type=float, help="Fail if any endpoint's p95 exceeds this")
+    parser.add_argument("--max-error-rate", type=float, help="Fail if the overall error rate exceeds this")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary directory and logs")
+    parser.add_argument("--json", dest="json_path", help="Write the report to this file")
+    args = parser.parse_args()
+
+    if args.workers > 1 and not args.qdrant_url:
+        parser.error("Embedded Qdrant cannot be shared between workers; pass --qdrant-url")
+    weights = parse_mix(args.mix, args.app)
+
+    workdir = Path(tempfile.mkdtemp(prefix="textbook-load-"))
+    fake_api = app = None
+    try:
+        fake_port = free_port()
+        fake_api = start_process([
+            sys.executable, str(BACKEND_DIR / "benchmarks" / "fake_openai.py"),
+            "--port", str(fake_port),
+            "--latency-ms", str(args.llm_latency_ms),
+            "--token-ms", str(args.token_ms),
+            "--answer-tokens", str(args.answer_tokens),
+            "--embedding-latency-ms", str(args.embedding_latency_ms),
+            "--jitter-ms", str(args.jitter_ms),
+            "--error-rate", str(args.llm_error_rate),
+            "--dimensions", str(DEFAULT_DIMENSIONS),
+            "--seed", str(args.seed),
+        ], dict(os.environ), workdir / "fake_openai.log")
+
+        from qdrant_client import QdrantClient
+
+        if args.qdrant_url:
+            qdrant = QdrantClient(url=args.qdrant_url, api_key=os.getenv("QDRANT_API_KEY"))
+        else:
+            qdrant = QdrantClient(path=str(workdir / "qdrant"))
+        points = seed_qdrant(qdrant, DOCS_DIR, DEFAULT_DIMENSIONS)
+        qdrant.close()  # Embedded Qdrant allows one process at a time
+
+        env = {
+            **os.environ,
+            "OPENAI_API_KEY": "load-test",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+            "QDRANT_URL": args.qdrant_url or "http://embedded",
+            "QDRANT_API_KEY": os.getenv("QDRANT_API_KEY", "load-test"),
+            "QDRANT_COLLECTION_NAME": COLLECTION,
+            "DATABASE_URL": args.database_url or f"sqlite:///{workdir / 'load.db'}",
+            "AUTH_TOKEN_KEYS": "load:load-test-signing-key-not-secret",
+            "BCRYPT_ROUNDS": str(args.bcrypt_rounds),
+            "TRANSLATION_BACKEND": "local",
+            "TRANSLATION_LOCAL_LATENCY_MS": str(args.translation_latency_ms),
+            "TRANSLATION_LOCAL_SEED": str(args.seed),
+            "TRANSLATION_CACHE_PATH": "",
+            "TRANSLATION_MEMORY_ENABLED": "false",
+        }
+        if not args.qdrant_url:
+            env["QDRANT_PATH"] = str(workdir / "qdrant")
+
+        port = free_port()
+        app = start_process([
+            sys.executable, "-m", "uvicorn", f"{args.app}:app",
+            "--port", str(port), "--workers", str(args.workers), "--log-level", "warning",
+        ], env, workdir / "app.log")
+
+        base_url = f"http://127.0.0.1:{port}"
+        if wait_for(f"{base_url}/ready", time.perf_counter() + args.timeout, expect_ok=True) is None:
+            print(f"❌ App did not become ready; see {workdir / 'app.log'}")
+            args.keep = True
+            return 1
+
+        report = asyncio.run(run_load(
+            base_url, args.app, args.requests, args.concurrency, weights, args.seed, args.warmup
+        ))
+        report["app"] = args.app
+        report["qdrant_points"] = points
+        with urllib.request.urlopen(f"http://127.0.0.1:{fake_port}/health", timeout=5) as response:
+            report["fake_openai"] = json.loads(response.read())["requests"]
+    except urllib.error.URLError as e:
+        print(f"❌ Fake OpenAI server unavailable: {e}")
+        return 1
+    finally:
+        stop_process(app)
+        stop_process(fake_api)
+        if args.keep:
+            print(f"Logs and data kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(report, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    failures = []
+    if args.budget_p95_ms is not None:
+        for endpoint, result in report["endpoints"].items():
+            if result["latency_ms"]["p95"] > args.budget_p95_ms:
+                failures.append(f"{endpoint} p95 {result['latency_ms']['p95']}ms > {args.budget_p95_ms}ms")
+    if args.max_error_rate is not None and report["error_rate"] > args.max_error_rate:
+        failures.append(f"error rate {report['error_rate']} > {args.max_error_rate}")
+
+    if failures:
+        print("❌ Load test budget exceeded: " + "; ".join(failures))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+"""
+Fake OpenAI-Compatible Server
+Local stand-in for OpenRouter's /v1/embeddings and /v1/chat/completions
+with configurable latency, streaming and failure rate
+
+Embeddings are deterministic hashed bags of words, so a query lands near
+the chunks that share its vocabulary and benchmarks see realistic retrieval.
+HashingOpenAIClient offers the same embeddings in process, without a server.
+
+Usage (from textbook/backend):
+    python benchmarks/fake_openai.py --port 8089 --latency-ms 400 --token-ms 15
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 uvicorn main:app
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict, List, Union
+
+DEFAULT_DIMENSIONS = 1536
+WORD = re.compile(r'[a-z0-9]+')
+
+ANSWER_WORDS = (
+    "ROS 2 nodes exchange messages over topics while services and actions handle "
+    "requests that need a reply. Simulation in Gazebo lets you test controllers "
+    "before touching hardware. Isaac Sim adds photorealistic rendering and synthetic "
+    "data for perception. Vision language action models map camera input and an "
+    "instruction to robot commands."
+).split()
+
+
+def hash_embedding(text: str, dimensions: int = DEFAULT_DIMENSIONS) -> List[float]:
+    """Unit-length hashed bag of words; identical in every process"""
+    vector = [0.0] * dimensions
+    for word in WORD.findall(text.lower()):
+        digest = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "big")
+        vector[digest % dimensions] += 1.0 if digest >> 63 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def answer_tokens(count: int) -> List[str]:
+    """Deterministic answer text split into streaming tokens"""
+    return [ANSWER_WORDS[i % len(ANSWER_WORDS)] + " " for i in range(count)]
+
+
+class _HashingEmbeddings:
+    def __init__(self, dimensions: int, latency_ms: float):
+        self.dimensions = dimensions
+        self.latency_ms = latency_ms
+        self.calls = 0
+
+    def create(self, model: str, input: Union[str, List[str]], **kwargs):
+        inputs = [input] if isinstance(input, str) else list(input)
+        self.calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        prompt_tokens = sum(max(1, len(text) // 4) for text in inputs)
+        return SimpleNamespace(
+            model=model,
+            data=[SimpleNamespace(index=i, embedding=hash_embedding(text, self.dimensions))
+                  for i, text in enumerate(inputs)],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, total_tokens=prompt_tokens),
+        )
+
+
+class HashingOpenAIClient:
+    """
+    In-process stand-in for OpenAI(...).embeddings with hashed embeddings,
+    optionally sleeping latency_ms per request like a remote API
+    """
+
+    def __init__(self, dimensions: int = DEFAULT_DIMENSIONS, latency_ms: float = 0.0):
+        self.embeddings = _HashingEmbeddings(dimensions, latency_ms)
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Request handler; configuration lives on the server instance"""
+
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: Dict):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _write_chunk(self, data: str):
+        encoded = data.encode()
+        self.wfile.write(f"{len(encoded):x}\r\n".encode() + encoded + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("", "/health", "/v1/models"):
+            self._send_json(200, {"object": "list", "data": [], "requests": self.server.stats()})
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "Invalid JSON"}})
+            return
+
+        path = self.path.split("?")[0].rstrip("/")
+        if path.endswith("/embeddings"):
+            handler = self._embeddings
+        elif path.endswith("/chat/completions"):
+            handler = self._chat_completions
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        if self.server.should_fail():
+            self._send_json(500, {"error": {"message": "Simulated upstream failure", "type": "server_error"}})
+            return
+        handler(body)
+
+    def _embeddings(self, body: Dict):
+        inputs = body.get("input", "")
+        inputs = [inputs] if isinstance(inputs, str) else list(inputs)
+        self.server.sleep(self.server.embedding_latency_ms)
+        self.server.count("embeddings", len(inputs))
+        self.server.count("embedding_requests", 1)
+
+        prompt_tokens = sum(max(1, len(text) // 4) for text in inputs)
+        self._send_json(200, {
+            "object": "list",
+            "model": body.get("model", "fake-embedding"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": hash_embedding(text, self.server.dimensions)}
+                for i, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        })
+
+    def _chat_completions(self, body: Dict):
+        self.server.count("completions", 1)
+        tokens = answer_tokens(self.server.answer_tokens)
+        prompt_tokens = sum(max(1, len(str(m.get("content", ""))) // 4) for m in body.get("messages", []))
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens),
+        }
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = body.get("model", "fake-model")
+        created = int(time.time())
+
+        if not body.get("stream"):
+            self.server.sleep(self.server.latency_ms + self.server.token_ms * len(tokens))
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(payload: Dict):
+            self._write_chunk(f"data: {json.dumps(payload)}\n\n")
+
+        def chunk(delta: Dict, finish_reason=None) -> Dict:
+            return {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+
+        try:
+            self.server.sleep(self.server.latency_ms)
+            event(chunk({"role": "assistant", "content": ""}))
+            for token in tokens:
+                self.server.sleep(self.server.token_ms)
+                event(chunk({"content": token}))
+            event(chunk({}, "stop"))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                event({"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                       "model": model, "choices": [], "usage": usage})
+            self._write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Client stopped reading
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int, latency_ms: float = 300.0, token_ms: float = 10.0,
+                 answer_tokens: int = 60, embedding_latency_ms: float = 20.0,
+                 jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 dimensions: int = DEFAULT_DIMENSIONS, seed: int = 0):
+        super().__init__(("127.0.0.1", port), FakeOpenAIHandler)
+        self.latency_ms = latency_ms
+        self.token_ms = token_ms
+        self.answer_tokens = answer_tokens
+        self.embedding_latency_ms = embedding_latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.dimensions = dimensions
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counts = {"embeddings": 0, "embedding_requests": 0, "completions": 0, "failures": 0}
+
+    def sleep(self, milliseconds: float):
+        with self._lock:
+            jitter = self._random.uniform(0, self.jitter_ms) if self.jitter_ms and milliseconds else 0.0
+        if milliseconds + jitter > 0:
+            time.sleep((milliseconds + jitter) / 1000)
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            fail = self.error_rate > 0 and self._random.random() < self.error_rate
+            if fail:
+                self._counts["failures"] += 1
+        return fail
+
+    def count(self, kind: str, amount: int):
+        with self._lock:
+            self._counts[kind] += amount
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake OpenAI-compatible API")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Time to first completion token")
+    parser.add_argument("--token-ms", type=float, default=10.0, help="Time per completion token")
+    parser.add_argument("--answer-tokens", type=int, default=60, help="Completion length in tokens")
+    parser.add_argument("--embedding-latency-ms", type=float, default=20.0, help="Time per embeddings request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Random extra latency per wait")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--dimensions", type=int, default=DEFAULT_DIMENSIONS, help="Embedding size")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(
+        args.port, args.latency_ms, args.token_ms, args.answer_tokens,
+        args.embedding_latency_ms, args.jitter_ms, args.error_rate, args.dimensions, args.seed
+    )
+    print(f"Fake OpenAI API on http://127.0.0.1:{args.port}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Ingestion Benchmark
+Runs the embeddings.py pipeline over a synthetic corpus with a deterministic
+local embedder and vector store, and reports files/s, chunks/s, peak RSS
+and the time spent in each stage
+
+The corpus is generated from a fixed seed, so runs with the same arguments
+ingest identical text and are directly comparable.
+
+Usage (from textbook/backend):
+    python benchmarks/ingestion_bench.py
+    python benchmarks/ingestion_bench.py --files 500 --words-per-file 3000 --embed-latency-ms 30
+    python benchmarks/ingestion_bench.py --qdrant-path /tmp/ingest-qdrant --budget-chunks-per-second 200
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+VOCABULARY = (
+    "robot ros node topic service action publisher subscriber message gazebo unity isaac sim "
+    "sensor lidar camera imu joint link urdf xacro controller policy reward training simulation "
+    "humanoid balance gait perception planning navigation whisper speech language model vision "
+    "transform frame odometry launch parameter executor callback timer colcon package workspace"
+).split()
+MODULES = ["module1", "module2", "module3", "module4"]
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def generate_corpus(root: Path, files: int, words_per_file: int, seed: int) -> int:
+    """Write markdown and MDX pages with headings and paragraphs; returns total bytes"""
+    rng = random.Random(seed)
+    total = 0
+    for i in range(files):
+        module = MODULES[i % len(MODULES)]
+        path = root / module / f"page-{i:05d}{'.mdx' if i % 2 else '.md'}"
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        lines = [f"---\nsidebar_position: {i}\n---\n", f"# {' '.join(rng.choices(VOCABULARY, k=4)).title()}\n"]
+        written = 0
+        while written < words_per_file:
+            length = min(rng.randint(40, 120), words_per_file - written)
+            if rng.random() < 0.15:
+                lines.append(f"## {' '.join(rng.choices(VOCABULARY, k=3)).title()}\n")
+            lines.append(" ".join(rng.choices(VOCABULARY, k=length)) + ".\n")
+            written += length
+
+        text = "\n".join(lines)
+        path.write_text(text, encoding="utf-8")
+        total += len(text.encode("utf-8"))
+    return total
+
+
+def run_ingestion(corpus: Path, qdrant_path: str, embed_latency_ms: float, chunk_size: int, chunk_overlap: int) -> Dict:
+    from qdrant_client import QdrantClient
+    from benchmarks.fake_openai import HashingOpenAIClient
+    from embeddings import DocumentEmbedder
+
+    qdrant = QdrantClient(location=":memory:") if qdrant_path == ":memory:" else QdrantClient(path=qdrant_path)
+    embedder = DocumentEmbedder(qdrant_client=qdrant, openai_client=HashingOpenAIClient(latency_ms=embed_latency_ms))
+    embedder.chunk_size = chunk_size
+    embedder.chunk_overlap = chunk_overlap
+
+    rss_before = peak_rss_mb()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        stats = embedder.embed_and_store(str(corpus))
+    elapsed = time.perf_counter() - started
+    stored = qdrant.count(embedder.collection_name).count
+    qdrant.close()
+
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "files": stats["files"],
+        "chunks": stats["chunks"],
+        "stored": stored,
+        "embedding_failures": stats["embedding_failures"],
+        "files_per_second": round(stats["files"] / elapsed, 2) if elapsed else 0.0,
+        "chunks_per_second": round(stats["chunks"] / elapsed, 2) if elapsed else 0.0,
+        "stage_seconds": stats["seconds"],
+        "stage_share": {
+            stage: round(seconds / elapsed, 3) if elapsed else 0.0
+            for stage, seconds in stats["seconds"].items()
+        },
+        "peak_rss_mb_before": rss_before,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the document ingestion pipeline")
+    parser.add_argument("--files", type=int, default=200, help="Synthetic pages to generate")
+    parser.add_argument("--words-per-file", type=int, default=1500, help="Words per page")
+    parser.add_argument("--chunk-size", type=int, default=int(os.getenv("CHUNK_SIZE", 1000)), help="Chunk size (words)")
+    parser.add_argument("--chunk-overlap", type=int, default=int(os.getenv("CHUNK_OVERLAP", 200)), help="Chunk overlap (words)")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="Simulated embeddings API latency per call")
+    parser.add_argument("--qdrant-path", default=":memory:", help="Embedded Qdrant location (:memory: or a directory)")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus seed")
+    parser.add_argument("--budget-chunks-per-second", type=float, help="Fail if throughput is below this")
+    parser.add_argument("--json", dest="json_path", help="Write the report to this file")
+    args = parser.parse_args()
+
+    corpus = Path(tempfile.mkdtemp(prefix="textbook-ingest-"))
+    try:
+        corpus_bytes = generate_corpus(corpus, args.files, args.words_per_file, args.seed)
+        report = run_ingestion(corpus, args.qdrant_path, args.embed_latency_ms, args.chunk_size, args.chunk_overlap)
+    finally:
+        shutil.rmtree(corpus, ignore_errors=True)
+
+    report = {
+        "corpus": {
+            "files": args.files,
+            "words_per_file": args.words_per_file,
+            "megabytes": round(corpus_bytes / 1024 / 1024, 2),
+            "seed": args.seed,
+        },
+        "config": {
+            "chunk_size": args.chunk_size,
+            "chunk_overlap": args.chunk_overlap,
+            "embed_latency_ms": args.embed_latency_ms,
+            "qdrant_path": args.qdrant_path,
+        },
+        **report,
+    }
+
+    print(json.dumps(report, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.budget_chunks_per_second is not None and report["chunks_per_second"] < args.budget_chunks_per_second:
+        print(f"❌ Ingestion {report['chunks_per_second']} chunks/s < {args.budget_chunks_per_second}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+"""
+Retrieval Evaluation
+Indexes textbook/docs with the production chunker and retriever, then
+measures recall@k, MRR, context size and retrieval latency over a versioned
+question set for each configuration, and compares runs
+
+Runs offline with hashed embeddings and in-memory Qdrant by default, so
+numbers are comparable between runs but lower than with real embeddings;
+--embedder openai uses the configured embeddings API instead.
+
+Usage (from textbook/backend):
+    python benchmarks/retrieval_eval.py
+    python benchmarks/retrieval_eval.py --chunk-size 300,600,1000 --top-k 3,5,8 --json runs/candidate.json
+    python benchmarks/retrieval_eval.py --json runs/candidate.json --compare runs/baseline.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DOCS_DIR = BACKEND_DIR.parent / "docs"
+DEFAULT_QUESTIONS = Path(__file__).resolve().parent / "retrieval_questions.json"
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Metrics that must not drop between runs (higher is better)
+QUALITY_METRICS = ("recall_at_k", "hit_rate_at_k", "mrr")
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 2) if ordered else 0.0
+
+
+def matches(file_path: str, expected: str) -> bool:
+    """Payload paths keep the last three path parts; expected paths are relative to docs/"""
+    file_path = file_path.replace("\\", "/")
+    return file_path == expected or file_path.endswith("/" + expected)
+
+
+def load_questions(path: Path) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        question_set = json.load(f)
+    ids = [q["id"] for q in question_set["questions"]]
+    if len(ids) != len(set(ids)):
+        raise ValueError(f"Duplicate question ids in {path}")
+    return question_set
+
+
+def build_index(docs_dir: Path, chunk_size: int, chunk_overlap: int, openai_client):
+    """Embed the docs into a fresh in-memory collection; returns (qdrant client, stats)"""
+    from qdrant_client import QdrantClient
+    from embeddings import DocumentEmbedder
+
+    qdrant = QdrantClient(location=":memory:")
+    embedder = DocumentEmbedder(qdrant_client=qdrant, openai_client=openai_client)
+    embedder.chunk_size = chunk_size
+    embedder.chunk_overlap = chunk_overlap
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stderr):  # Keep stdout for the report
+        embedder.embed_and_store(str(docs_dir))
+    return qdrant, {
+        "chunks": qdrant.count(embedder.collection_name).count,
+        "index_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def evaluate(engine, questions: List[Dict]) -> Dict:
+    """Retrieve for every question and score the ranked sources"""
+    from usage import estimate_tokens
+
+    recalls, hits, reciprocal_ranks, tokens, latencies = [], [], [], [], []
+    misses = []
+    for question in questions:
+        started = time.perf_counter()
+        contexts = engine.retrieve_relevant_context(question["question"])
+        latencies.append((time.perf_counter() - started) * 1000)
+
+        sources = [ctx["metadata"].get("file_path", "") for ctx in contexts]
+        expected = question["sources"]
+        found = [e for e in expected if any(matches(source, e) for source in sources)]
+        first_rank = next(
+            (rank for rank, source in enumerate(sources, 1) if any(matches(source, e) for e in expected)),
+            None
+        )
+
+        recalls.append(len(found) / len(expected))
+        hits.append(1.0 if found else 0.0)
+        reciprocal_ranks.append(1.0 / first_rank if first_rank else 0.0)
+        tokens.append(sum(estimate_tokens(ctx["text"]) for ctx in contexts))
+        if not found:
+            misses.append(question["id"])
+
+    return {
+        "recall_at_k": round(statistics.mean(recalls), 4),
+        "hit_rate_at_k": round(statistics.mean(hits), 4),
+        "mrr": round(statistics.mean(reciprocal_ranks), 4),
+        "context_tokens": {
+            "mean": round(statistics.mean(tokens), 1),
+            "p95": percentile(tokens, 0.95),
+            "max": max(tokens),
+        },
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "mean": round(statistics.mean(latencies), 2),
+        },
+        "misses": misses,
+    }
+
+
+def run_label(config: Dict) -> str:
+    return f"chunk={config['chunk_size']},overlap={config['chunk_overlap']},k={config['top_k']}"
+
+
+def compare(report: Dict, baseline: Dict, max_drop: float) -> List[str]:
+    """Print metric deltas against a baseline report; returns regressions"""
+    if report["questions_version"] != baseline.get("questions_version"):
+        print(f"⚠️  Question set version differs (baseline {baseline.get('questions_version')}, "
+              f"now {report['questions_version']}); quality deltas are not comparable")
+    if report["embedder"] != baseline.get("embedder"):
+        print(f"⚠️  Embedder differs (baseline {baseline.get('embedder')}, now {report['embedder']})")
+
+    baseline_runs = {run["label"]: run for run in baseline.get("runs", [])}
+    regressions = []
+    for run in report["runs"]:
+        before = baseline_runs.get(run["label"])
+        if before is None:
+            print(f"{run['label']}: no baseline run")
+            continue
+        deltas = []
+        for metric in QUALITY_METRICS:
+            delta = run[metric] - before[metric]
+            deltas.append(f"{metric} {run[metric]:.3f} ({delta:+.3f})")
+            if delta < -max_drop:
+                regressions.append(f"{run['label']} {metric} dropped {-delta:.3f}")
+        tokens_delta = run["context_tokens"]["mean"] - before["context_tokens"]["mean"]
+        latency_delta = run["latency_ms"]["p95"] - before["latency_ms"]["p95"]
+        deltas.append(f"tokens {run['context_tokens']['mean']:.0f} ({tokens_delta:+.0f})")
+        deltas.append(f"p95 {run['latency_ms']['p95']:.1f}ms ({latency_delta:+.1f})")
+        newly_missed = sorted(set(run["misses"]) - set(before["misses"]))
+        print(f"{run['label']}: " + ", ".join(deltas) + (f"; newly missed: {', '.join(newly_missed)}" if newly_missed else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality and latency")
+    parser.add_argument("--questions", default=str(DEFAULT_QUESTIONS), help="Question set JSON")
+    parser.add_argument("--docs", default=str(DOCS_DIR), help="Docs directory to index")
+    parser.add_argument("--embedder", choices=["hash", "openai"], default="hash",
+                        help="hash: offline hashed embeddings; openai: the configured embeddings API")
+    parser.add_argument("--chunk-size", default=os.getenv("CHUNK_SIZE", "1000"), help="Comma-separated chunk sizes (words)")
+    parser.add_argument("--chunk-overlap", default=os.getenv("CHUNK_OVERLAP", "200"), help="Comma-separated overlaps (words)")
+    parser.add_argument("--top-k", default=os.getenv("TOP_K_RESULTS", "5"), help="Comma-separated TOP_K_RESULTS values")
+    parser.add_argument("--compare", help="Baseline report to compare against")
+    parser.add_argument("--max-drop", type=float, default=0.02, help="Allowed drop in recall, hit rate or MRR")
+    parser.add_argument("--json", dest="json_path", help="Write the report to this file")
+    args = parser.parse_args()
+
+    # Retrieval only: no database, no usage records; questions run one at
+    # a time, so batching embeddings would only add its window to latency
+    os.environ.setdefault("DATABASE_URL", "sqlite://")
+    os.environ["USAGE_TRACKING_ENABLED"] = "false"
+    os.environ["EMBEDDING_BATCH_WINDOW_MS"] = "0"
+
+    from rag import RAGEngine
+
+    if args.embedder == "hash":
+        from benchmarks.fake_openai import HashingOpenAIClient
+        openai_client = HashingOpenAIClient()
+    else:
+        from openai import OpenAI
+        openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL"))
+
+    question_set = load_questions(Path(args.questions))
+    questions = question_set["questions"]
+    chunk_sizes = [int(v) for v in args.chunk_size.split(",")]
+    overlaps = [int(v) for v in args.chunk_overlap.split(",")]
+    top_ks = [int(v) for v in args.top_k.split(",")]
+
+    runs = []
+    for chunk_size in chunk_sizes:
+        for chunk_overlap in overlaps:
+            if chunk_overlap >= chunk_size:
+                continue
+            qdrant, index_stats = build_index(Path(args.docs), chunk_size, chunk_overlap, openai_client)
+            for top_k in top_ks:
+                engine = RAGEngine(qdrant_client=qdrant, openai_client=openai_client)
+                engine.top_k = top_k
+                config = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "top_k": top_k}
+                runs.append({"label": run_label(config), **config, **index_stats, **evaluate(engine, questions)})
+            qdrant.close()
+
+    report = {
+        "questions_version": question_set["version"],
+        "questions": len(questions),
+        "embedder": args.embedder,
+        "runs": runs,
+    }
+
+    regressions: List[str] = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.max_drop)
+    else:
+        for run in runs:
+            print(f"{run['label']}: recall@k {run['recall_at_k']:.3f}, hit rate {run['hit_rate_at_k']:.3f}, "
+                  f"MRR {run['mrr']:.3f}, tokens {run['context_tokens']['mean']:.0f}, "
+                  f"p95 {run['latency_ms']['p95']:.1f}ms, {run['chunks']} chunks")
+
+    if args.json_path:
+        Path(args.json_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if regressions:
+        print("❌ Retrieval quality regressed: " + "; ".join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
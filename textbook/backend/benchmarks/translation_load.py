@@ -0,0 +1,146 @@
+"""
+Translation Load Test
+Drives TranslationService at a fixed concurrency and reports end-to-end
+latency percentiles, throughput and the backend's own metrics
+
+Runs offline against the local backend by default; the translation cache
+and memory are disabled so every request exercises the translation path.
+Requests are English prose blocks (headings, paragraphs, list items) from
+the textbook pages under textbook/docs, with code and JSX markup removed.
+
+Usage (from textbook/backend):
+    python benchmarks/translation_load.py
+    python benchmarks/translation_load.py --requests 500 --concurrency 32 --latency-ms 80 --error-rate 0.02
+    python benchmarks/translation_load.py --backend google --requests 20 --concurrency 2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DOCS_DIR = BACKEND_DIR.parent / "docs"
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+FALLBACK_PARAGRAPHS = [
+    "ROS 2 is the industry-standard middleware for robotics development.",
+    "Nodes communicate through topics, services and actions.",
+    "Run `ros2 topic list` to see the active topics.\n\nSee https://docs.ros.org for details.",
+    "Gazebo simulates physics, sensors and actuators so controllers can be tested safely.",
+    "```python\nimport rclpy\nrclpy.init()\n```\nThis initializes the client library.",
+]
+
+
+def load_corpus(limit: int) -> List[str]:
+    """
+    English prose from every .md/.mdx page, or built-in samples if the docs
+    are not available. Short blocks (mostly headings) are skipped.
+    """
+    from embeddings import find_documents
+    from translation_memory import english_blocks
+
+    paragraphs: List[str] = []
+    if DOCS_DIR.is_dir():
+        for path in find_documents(str(DOCS_DIR)):
+            source = Path(path).read_text(encoding="utf-8")
+            paragraphs.extend(block for block in english_blocks(source) if len(block) > 40)
+    return paragraphs[:limit] or FALLBACK_PARAGRAPHS
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 1) if ordered else 0.0
+
+
+async def run_load(requests: int, concurrency: int, corpus: List[str], seed: int) -> Dict:
+    from translation import TranslationService
+
+    service = TranslationService()
+    rng = random.Random(seed)
+    texts = [rng.choice(corpus) for _ in range(requests)]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    untranslated = 0
+
+    async def one(text: str):
+        nonlocal untranslated
+        async with semaphore:
+            started = time.perf_counter()
+            result = await service.translate_to_urdu(text, use_cache=False)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if result == text:
+                untranslated += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(text) for text in texts])
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "elapsed_seconds": round(elapsed, 3),
+        "requests_per_second": round(requests / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": round(max(latencies), 1) if latencies else 0.0,
+            "mean": round(statistics.mean(latencies), 1) if latencies else 0.0,
+        },
+        "untranslated_responses": untranslated,
+        "service": service.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the translation path")
+    parser.add_argument("--backend", default="local", help="Translation backend (local or google)")
+    parser.add_argument("--requests", type=int, default=200, help="Total translate calls")
+    parser.add_argument("--concurrency", type=int, default=16, help="Calls in flight at once")
+    parser.add_argument("--service-concurrency", type=int, help="TRANSLATION_CONCURRENCY for the service")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Local backend base latency")
+    parser.add_argument("--latency-per-char-ms", type=float, default=0.05, help="Local backend latency per character")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="Local backend random extra latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Local backend failure probability")
+    parser.add_argument("--corpus-size", type=int, default=500, help="Distinct paragraphs to sample from")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for text sampling and simulated errors")
+    parser.add_argument("--budget-p95-ms", type=float, help="Fail if p95 latency exceeds this")
+    parser.add_argument("--json", dest="json_path", help="Write the report to this file")
+    args = parser.parse_args()
+
+    # Configure the service before it is imported and constructed
+    os.environ["TRANSLATION_BACKEND"] = args.backend
+    os.environ["TRANSLATION_CACHE_PATH"] = ""
+    os.environ["TRANSLATION_MEMORY_ENABLED"] = "false"
+    os.environ["TRANSLATION_LOCAL_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["TRANSLATION_LOCAL_LATENCY_PER_CHAR_MS"] = str(args.latency_per_char_ms)
+    os.environ["TRANSLATION_LOCAL_JITTER_MS"] = str(args.jitter_ms)
+    os.environ["TRANSLATION_LOCAL_ERROR_RATE"] = str(args.error_rate)
+    os.environ["TRANSLATION_LOCAL_SEED"] = str(args.seed)
+    if args.service_concurrency:
+        os.environ["TRANSLATION_CONCURRENCY"] = str(args.service_concurrency)
+
+    report = asyncio.run(run_load(args.requests, args.concurrency, load_corpus(args.corpus_size), args.seed))
+    report["backend"] = args.backend
+
+    print(json.dumps(report, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.budget_p95_ms is not None and report["latency_ms"]["p95"] > args.budget_p95_ms:
+        print(f"❌ Translation p95 {report['latency_ms']['p95']}ms > {args.budget_p95_ms}ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
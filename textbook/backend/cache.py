@@ -0,0 +1,83 @@
+"""
+In-Process Caches
+Thread-safe LRU cache with optional per-entry TTL and hit-ratio metrics
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Bounded LRU cache. Entries older than ttl_seconds are treated as
+    misses; ttl_seconds=None keeps entries until they are evicted.
+    """
+
+    def __init__(self, name: str, max_entries: int, ttl_seconds: Optional[float] = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+
+            value, stored_at = entry
+            if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._data[key]
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return None
+
+            self._data.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Optional[Any]]) -> Optional[Any]:
+        """Return the cached value, calling loader on a miss. None results are not cached."""
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            entries = len(self._data)
+        lookups = stats["hits"] + stats["misses"]
+        return {
+            **stats,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hit_ratio": round(stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
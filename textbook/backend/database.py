@@ -3,7 +3,7 @@ Database models and configuration for the RAG Chatbot
 Uses Neon Serverless Postgres for storing chat sessions and messages
 """
 
-from sqlalchemy import create_engine, Column, String, Integer, DateTime, Text, Boolean
+from sqlalchemy import create_engine, Column, String, Integer, DateTime, Text, Boolean, Float
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -14,7 +14,9 @@ load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+# SQLite (local development and benchmarks) is shared across worker threads
+connect_args = {"check_same_thread": False} if DATABASE_URL and DATABASE_URL.startswith("sqlite") else {}
+engine = create_engine(DATABASE_URL, pool_pre_ping=True, connect_args=connect_args)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -27,7 +29,7 @@ class ChatSession(Base):
     id = Column(String, primary_key=True, index=True)
     user_id = Column(String, nullable=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # Used by retention
     title = Column(String, nullable=True)
 
 class ChatMessage(Base):
@@ -54,6 +56,23 @@ class UserProfile(Base):
     hardware_background = Column(String, nullable=True)  # beginner/intermediate/advanced
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class UsageRecord(Base):
+    """Token usage and cost of one LLM or embedding call"""
+    __tablename__ = "usage_records"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    user_id = Column(String, nullable=True, index=True)
+    session_id = Column(String, nullable=True, index=True)
+    feature = Column(String)  # chat, chat_stream, ...
+    level = Column(String, nullable=True)  # software:hardware background pair
+    kind = Column(String)  # completion or embedding
+    model = Column(String)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    cost_usd = Column(Float, default=0.0)
+    estimated = Column(Boolean, default=False)  # Provider did not report usage
+
 # Database initialization
 def init_db():
     """Initialize database tables"""
@@ -4,9 +4,9 @@ Processes markdown files, chunks them, generates embeddings, and stores in Qdran
 """
 
 import os
-import glob
+import time
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional
 from qdrant_client import QdrantClient
 from qdrant_client.models import Distance, VectorParams, PointStruct
 from openai import OpenAI
@@ -15,20 +15,31 @@ import hashlib
 
 load_dotenv()
 
+# Docusaurus pages; most of the textbook is MDX
+DOC_EXTENSIONS = (".md", ".mdx")
+
+def find_documents(docs_dir: str) -> List[str]:
+    """All markdown and MDX pages under docs_dir, in a stable order"""
+    return sorted(str(p) for p in Path(docs_dir).rglob("*") if p.suffix in DOC_EXTENSIONS)
+
 class DocumentEmbedder:
-    def __init__(self):
+    def __init__(self, qdrant_client: Optional[QdrantClient] = None, openai_client: Optional[OpenAI] = None):
+        """
+        Clients default to the configured services; benchmarks and the
+        retrieval eval pass local ones instead
+        """
         self.qdrant_url = os.getenv("QDRANT_URL")
         self.qdrant_api_key = os.getenv("QDRANT_API_KEY")
         self.collection_name = os.getenv("QDRANT_COLLECTION_NAME", "physical_ai_textbook")
         
         # Initialize Qdrant client
-        self.qdrant_client = QdrantClient(
+        self.qdrant_client = qdrant_client or QdrantClient(
             url=self.qdrant_url,
             api_key=self.qdrant_api_key
         )
         
         # Initialize OpenAI client (via OpenRouter)
-        self.openai_client = OpenAI(
+        self.openai_client = openai_client or OpenAI(
             api_key=os.getenv("OPENAI_API_KEY"),
             base_url=os.getenv("OPENAI_BASE_URL")
         )
@@ -116,13 +127,23 @@ class DocumentEmbedder:
         chunks = self.chunk_text(content, metadata)
         return chunks
     
-    def embed_and_store(self, docs_dir: str):
-        """Process all markdown files and store in Qdrant"""
+    def embed_and_store(self, docs_dir: str) -> Dict:
+        """
+        Process all markdown files and store in Qdrant
+        Returns counts and the seconds spent in each stage
+        """
+        stats = {"files": 0, "chunks": 0, "stored": 0, "embedding_failures": 0}
+        seconds = {"collection": 0.0, "discover": 0.0, "read_chunk": 0.0, "embed": 0.0, "upsert": 0.0}
+        
         # Create collection
+        started = time.perf_counter()
         self.create_collection_if_not_exists()
+        seconds["collection"] += time.perf_counter() - started
         
-        # Find all markdown files
-        md_files = glob.glob(f"{docs_dir}/**/*.md", recursive=True)
+        # Find all markdown and MDX files
+        started = time.perf_counter()
+        md_files = find_documents(docs_dir)
+        seconds["discover"] += time.perf_counter() - started
         print(f"Found {len(md_files)} markdown files")
         
         all_points = []
@@ -130,13 +151,21 @@ class DocumentEmbedder:
         
         for file_path in md_files:
             print(f"Processing: {file_path}")
+            started = time.perf_counter()
             chunks = self.process_markdown_file(file_path)
+            seconds["read_chunk"] += time.perf_counter() - started
+            stats["files"] += 1
+            stats["chunks"] += len(chunks)
             
             for chunk in chunks:
                 # Generate embedding
+                started = time.perf_counter()
                 embedding = self.generate_embedding(chunk["text"])
+                seconds["embed"] += time.perf_counter() - started
                 
-                if embedding:
+                if not embedding:
+                    stats["embedding_failures"] += 1
+                else:
                     # Create point
                     point = PointStruct(
                         id=point_id,
@@ -152,6 +181,7 @@ class DocumentEmbedder:
         # Batch upload to Qdrant
         if all_points:
             batch_size = 100
+            started = time.perf_counter()
             for i in range(0, len(all_points), batch_size):
                 batch = all_points[i:i + batch_size]
                 self.qdrant_client.upsert(
@@ -159,10 +189,15 @@ class DocumentEmbedder:
                     points=batch
                 )
                 print(f"Uploaded batch {i // batch_size + 1}")
+            seconds["upsert"] += time.perf_counter() - started
+            stats["stored"] = len(all_points)
             
             print(f"✅ Successfully embedded and stored {len(all_points)} chunks")
         else:
             print("❌ No chunks to upload")
+        
+        stats["seconds"] = {stage: round(value, 4) for stage, value in seconds.items()}
+        return stats
 
 if __name__ == "__main__":
     # Run embedding process
@@ -0,0 +1,196 @@
+"""
+Runtime Health Monitoring
+Probes Qdrant and the database on an interval, serves the cached result,
+and tracks event-loop lag
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import text
+
+from database import SessionLocal
+
+
+def check_database() -> Dict:
+    """Run SELECT 1 against the database"""
+    db = SessionLocal()
+    try:
+        db.execute(text("SELECT 1"))
+        return {"status": "healthy"}
+    finally:
+        db.close()
+
+
+def make_qdrant_check(get_client: Callable, collection_name: str) -> Callable[[], Dict]:
+    """Build a check that verifies the collection exists and reports its size"""
+
+    def check_qdrant() -> Dict:
+        client = get_client()
+        collections = client.get_collections()
+        collection_names = [c.name for c in collections.collections]
+
+        if collection_name not in collection_names:
+            return {
+                "status": "warning",
+                "message": f"Collection '{collection_name}' not found. Run embeddings.py"
+            }
+
+        points_count = client.get_collection(collection_name).points_count
+        return {
+            "status": "healthy",
+            "collection": collection_name,
+            "points": points_count,
+            "warning": "Low point count" if points_count < 100 else None
+        }
+
+    return check_qdrant
+
+
+class HealthMonitor:
+    """
+    Runs registered dependency checks in the background.
+    /health reads the cached snapshot, so probes never touch the network;
+    refresh() performs a deep check on demand.
+    """
+
+    def __init__(self):
+        self.interval_seconds = float(os.getenv("HEALTH_CHECK_INTERVAL_SECONDS", 15))
+        self.timeout_seconds = float(os.getenv("HEALTH_CHECK_TIMEOUT_SECONDS", 5))
+        self._checks: Dict[str, Callable[[], Dict]] = {}
+        self._results: Dict[str, Dict] = {}
+        self._in_flight: Dict[str, bool] = {}
+        self._checked_at: Optional[float] = None
+        self._checked_at_iso: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, check: Callable[[], Dict]):
+        """Register a blocking check that returns a dict with a 'status' key"""
+        self._checks[name] = check
+
+    async def _run_check(self, name: str, check: Callable[[], Dict]):
+        # A check that is still hanging from the previous round keeps its
+        # last result instead of piling up another worker thread
+        if self._in_flight.get(name):
+            return
+
+        self._in_flight[name] = True
+        started = time.perf_counter()
+        future = asyncio.get_running_loop().run_in_executor(None, check)
+        # Cleared when the thread finishes, not when we stop waiting for it
+        future.add_done_callback(lambda f: self._check_finished(name, f))
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), self.timeout_seconds)
+        except asyncio.TimeoutError:
+            result = {"status": "unhealthy", "error": f"Timed out after {self.timeout_seconds}s"}
+        except Exception as e:
+            result = {"status": "unhealthy", "error": str(e)}
+
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        self._results[name] = result
+
+    def _check_finished(self, name: str, future: asyncio.Future):
+        self._in_flight[name] = False
+        if not future.cancelled():
+            # Retrieve the error of a check that finished after its timeout
+            future.exception()
+
+    async def refresh(self) -> Dict:
+        """Probe every dependency now and update the cache"""
+        await asyncio.gather(*[
+            self._run_check(name, check) for name, check in self._checks.items()
+        ])
+        self._checked_at = time.monotonic()
+        self._checked_at_iso = datetime.utcnow().isoformat()
+        return self.snapshot()
+
+    def snapshot(self) -> Dict:
+        """Last known status of every dependency, served from memory"""
+        if self._checked_at is None:
+            status = "starting"
+        elif any(r.get("status") == "unhealthy" for r in self._results.values()):
+            status = "degraded"
+        else:
+            status = "healthy"
+
+        return {
+            "status": status,
+            "checked_at": self._checked_at_iso,
+            "age_seconds": round(time.monotonic() - self._checked_at, 1) if self._checked_at else None,
+            "services": dict(self._results)
+        }
+
+    async def _run_forever(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self):
+        """Start background probing on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run_forever())
+
+    async def stop(self):
+        """Cancel background probing"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class EventLoopLagMonitor:
+    """
+    Measures event-loop stalls by timing a short periodic sleep.
+    Any lateness beyond the sleep interval is time the loop spent running
+    blocking code instead of serving requests.
+    """
+
+    def __init__(self):
+        self.interval_seconds = float(os.getenv("LOOP_LAG_INTERVAL_SECONDS", 0.1))
+        self.stall_threshold_seconds = float(os.getenv("LOOP_STALL_THRESHOLD_SECONDS", 0.05))
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "samples": 0,
+            "stalls": 0,
+            "lag_seconds_last": 0.0,
+            "lag_seconds_max": 0.0,
+            "stalled_seconds_total": 0.0,
+        }
+
+    async def _run_forever(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval_seconds)
+            lag = max(0.0, time.monotonic() - started - self.interval_seconds)
+
+            self._stats["samples"] += 1
+            self._stats["lag_seconds_last"] = lag
+            self._stats["lag_seconds_max"] = max(self._stats["lag_seconds_max"], lag)
+            if lag >= self.stall_threshold_seconds:
+                self._stats["stalls"] += 1
+                self._stats["stalled_seconds_total"] += lag
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            **{key: round(value, 4) if isinstance(value, float) else value for key, value in self._stats.items()},
+            "stall_threshold_seconds": self.stall_threshold_seconds,
+        }
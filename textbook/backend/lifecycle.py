@@ -0,0 +1,125 @@
+"""
+Application Lifecycle Helpers
+Lazily constructed service clients and startup readiness tracking
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Callable, Dict, Generic, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class LazyResource(Generic[T]):
+    """
+    Service client that is constructed on first use.
+    Construction is thread-safe and retried on the next call if it fails,
+    so a dependency outage at boot does not take the process down.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], T]):
+        self.name = name
+        self._factory = factory
+        self._instance: Optional[T] = None
+        self._lock = threading.Lock()
+        self.last_error: Optional[str] = None
+        self.init_seconds: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._instance is not None
+
+    def get(self) -> T:
+        """Return the instance, constructing it if needed"""
+        if self._instance is not None:
+            return self._instance
+
+        with self._lock:
+            if self._instance is None:
+                started = time.monotonic()
+                try:
+                    self._instance = self._factory()
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = str(e)
+                    raise
+                finally:
+                    self.init_seconds = round(time.monotonic() - started, 3)
+        return self._instance
+
+    async def warm(self) -> bool:
+        """Construct the instance in a worker thread; never raises"""
+        try:
+            await asyncio.to_thread(self.get)
+            return True
+        except Exception as e:
+            print(f"Startup: {self.name} unavailable, will retry on first use: {e}")
+            return False
+
+    def status(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "init_seconds": self.init_seconds,
+            "error": self.last_error,
+        }
+
+
+class StartupState:
+    """Tracks background warm-up of the schema and service clients"""
+
+    def __init__(self):
+        self.schema = "pending"
+        self.schema_error: Optional[str] = None
+        self.startup_seconds: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def schema_init_enabled() -> bool:
+        """Schema creation can be skipped in production with SKIP_SCHEMA_INIT=true"""
+        return os.getenv("SKIP_SCHEMA_INIT", "false").lower() != "true"
+
+    @property
+    def warming(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def init_schema(self, init_db: Callable[[], None]):
+        """Run create_all in a worker thread unless disabled; never raises"""
+        if not self.schema_init_enabled():
+            self.schema = "skipped"
+            return
+
+        try:
+            await asyncio.to_thread(init_db)
+            self.schema = "ready"
+            self.schema_error = None
+        except Exception as e:
+            self.schema = "failed"
+            self.schema_error = str(e)
+            print(f"Startup: schema initialization failed: {e}")
+
+    async def _warm_up(self, init_db: Callable[[], None], resources: List[LazyResource]):
+        started = time.monotonic()
+        await asyncio.gather(
+            self.init_schema(init_db),
+            *[resource.warm() for resource in resources]
+        )
+        self.startup_seconds = round(time.monotonic() - started, 3)
+
+    def start_warmup(self, init_db: Callable[[], None], resources: List[LazyResource]):
+        """
+        Initialize the schema and service clients concurrently in the background.
+        The server starts accepting connections immediately; /ready reports
+        when warm-up has finished.
+        """
+        self._task = asyncio.get_running_loop().create_task(self._warm_up(init_db, resources))
+
+    async def stop(self):
+        """Cancel warm-up if the app shuts down before it finishes"""
+        if self.warming:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
@@ -3,21 +3,33 @@ FastAPI Main Application
 RAG Chatbot Backend with session management, text-selection queries, and CORS
 """
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
+from contextlib import asynccontextmanager
 import uuid
 import os
 from dotenv import load_dotenv
 from sqlalchemy.orm import Session
-from sqlalchemy import text
 
 from database import init_db, get_db, ChatSession, ChatMessage, UserProfile
 from rag import RAGEngine
-from auth import router as auth_router
+from auth import router as auth_router, profile_cache
 from personalization import PersonalizationService
+from lifecycle import LazyResource, StartupState
+from admission import batch_pool, chat_pool, translation_pool, admission_stats
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, ERRORS, REGISTRY, RequestTimingMiddleware, stage_timer
+from health import HealthMonitor, EventLoopLagMonitor, check_database, make_qdrant_check
+from passwords import password_hasher
+from tokens import TOKEN_STATUS_HEADER, TokenClaims, get_token_claims, token_signer
+from retention import retention_job, delete_sessions, touch_session
+from usage import UsageContext, usage_scope, usage_tracker, usage_user_id
+from profiling import ProfilingMiddleware, profiler, router as profiling_router
+from tracing import TracingMiddleware, record_error, tracer
 from translation import TranslationService  # Using deep-translator (Python 3.13 compatible)
 
 load_dotenv()
@@ -53,14 +65,47 @@ def validate_environment():
         print("="*60 + "\n")
         raise ValueError("Missing required environment variables")
 
-# Validate environment on startup
-validate_environment()
+# Service clients are constructed lazily so a dependency outage at boot
+# does not prevent the process from starting
+rag_engine = LazyResource("rag", RAGEngine)
+translation_service = LazyResource("translation", TranslationService)  # Using deep-translator
+personalization_service = PersonalizationService()
+startup_state = StartupState()
+
+# Dependency health is probed in the background and served from memory
+health_monitor = HealthMonitor()
+health_monitor.register("qdrant", make_qdrant_check(
+    lambda: rag_engine.get().qdrant_client,
+    os.getenv("QDRANT_COLLECTION_NAME", "physical_ai_textbook")
+))
+health_monitor.register("database", check_database)
+loop_monitor = EventLoopLagMonitor()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Validate configuration, then warm up dependencies in the background"""
+    validate_environment()
+    token_signer.require_keys()
+    startup_state.start_warmup(init_db, [rag_engine, translation_service])
+    health_monitor.start()
+    loop_monitor.start()
+    retention_job.start()
+    usage_tracker.start()
+    tracer.start()
+    yield
+    await usage_tracker.stop()
+    await retention_job.stop()
+    await loop_monitor.stop()
+    await health_monitor.stop()
+    await startup_state.stop()
+    await tracer.stop()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Physical AI Textbook RAG Chatbot",
     description="AI-powered chatbot for the Physical AI & Humanoid Robotics textbook",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS configuration
@@ -71,20 +116,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[TOKEN_STATUS_HEADER],
 )
 
-# Initialize database
-init_db()
+# Per-endpoint latency for /metrics
+app.add_middleware(RequestTimingMiddleware)
 
-# Initialize RAG engine
-rag_engine = RAGEngine()
+# Opt-in request profiling; not installed at all unless PROFILING_ADMIN_TOKEN is set
+if profiler.enabled:
+    app.add_middleware(ProfilingMiddleware)
 
-# Initialize bonus features
-personalization_service = PersonalizationService()
-translation_service = TranslationService()  # Using deep-translator
+# Request tracing; not installed unless TRACING_EXPORTER is set
+if tracer.enabled:
+    app.add_middleware(TracingMiddleware)
 
 # Include authentication router
 app.include_router(auth_router)
+app.include_router(profiling_router)
 
 # Pydantic models for API
 
@@ -106,6 +154,33 @@ class SessionResponse(BaseModel):
     session_id: str
     created_at: str
 
+class ChatBatchItem(BaseModel):
+    message: str
+    selected_text: Optional[str] = None
+    id: Optional[str] = None  # Echoed back with the result
+
+class ChatBatchRequest(BaseModel):
+    items: List[ChatBatchItem]
+    user_id: Optional[str] = None
+    software_background: Optional[str] = 'intermediate'
+    hardware_background: Optional[str] = 'beginner'
+
+class ChatBatchResult(BaseModel):
+    id: Optional[str] = None
+    message: Optional[str] = None
+    sources: List[str] = []
+    error: Optional[str] = None
+    error_code: Optional[str] = None
+
+class ChatBatchResponse(BaseModel):
+    results: List[ChatBatchResult]
+    succeeded: int
+    failed: int
+    timestamp: str
+
+# Questions accepted per /chat/batch call
+CHAT_BATCH_MAX_ITEMS = int(os.getenv("CHAT_BATCH_MAX_ITEMS", 50))
+
 # API Endpoints
 
 @app.get("/")
@@ -117,25 +192,37 @@ async def root():
         "version": "1.0.0"
     }
 
+def _client_host(http_request: Request) -> Optional[str]:
+    """Client address used to budget callers without a valid token"""
+    return http_request.client.host if http_request.client else None
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest, db: Session = Depends(get_db)):
+async def chat(
+    request: ChatRequest,
+    http_request: Request,
+    db: Session = Depends(get_db),
+    claims: Optional[TokenClaims] = Depends(get_token_claims),
+    _slot: None = Depends(chat_pool.slot)
+):
     """
     Main chat endpoint
     Supports both regular queries and text-selection based queries
+    Background levels come from the Bearer token when one is sent
     """
     try:
         # Get or create session
         session_id = request.session_id
         if not session_id:
             session_id = str(uuid.uuid4())
-            new_session = ChatSession(id=session_id)
+            new_session = ChatSession(id=session_id, user_id=claims.user_id if claims else None)
             db.add(new_session)
             db.commit()
         
         # Get chat history for this session
-        history_messages = db.query(ChatMessage).filter(
-            ChatMessage.session_id == session_id
-        ).order_by(ChatMessage.created_at).all()
+        with stage_timer("history"):
+            history_messages = db.query(ChatMessage).filter(
+                ChatMessage.session_id == session_id
+            ).order_by(ChatMessage.created_at).all()
         
         chat_history = [
             {"role": msg.role, "content": msg.content}
@@ -150,23 +237,39 @@ async def chat(request: ChatRequest, db: Session = Depends(get_db)):
             selected_text=request.selected_text
         )
         db.add(user_message)
-        db.commit()
+        touch_session(db, session_id, claims.user_id if claims else None)
+        with stage_timer("persist_user"):
+            db.commit()
         
-        # Personalize the query if user background is provided
-        query_to_use = request.message
-        if request.software_background and request.hardware_background:
-            query_to_use = personalization_service.personalize_prompt(
-                original_query=request.message,
-                software_background=request.software_background,
-                hardware_background=request.hardware_background
-            )
+        # Personalize via a precompiled system-prompt fragment; the question
+        # itself is sent (and embedded) unchanged
+        personalization = None
+        software_background = claims.software_background if claims else request.software_background
+        hardware_background = claims.hardware_background if claims else request.hardware_background
+        if software_background and hardware_background:
+            with stage_timer("personalization"):
+                personalization = personalization_service.system_fragment(
+                    software_background,
+                    hardware_background
+                )
         
-        # Generate RAG response
-        rag_response = rag_engine.query(
-            question=query_to_use,
-            chat_history=chat_history,
-            selected_text=request.selected_text
+        # Generate RAG response (blocking I/O, so keep it off the event loop);
+        # token usage is attributed to the verified user (or client address),
+        # session and level
+        usage_context = UsageContext(
+            feature="chat",
+            user_id=usage_user_id(claims.user_id if claims else None, _client_host(http_request)),
+            session_id=session_id,
+            level=f"{software_background}:{hardware_background}" if personalization else None
         )
+        with stage_timer("rag"), usage_scope(usage_context):
+            rag_response = await run_in_threadpool(
+                rag_engine.get().query,
+                question=request.message,
+                chat_history=chat_history,
+                selected_text=request.selected_text,
+                personalization=personalization
+            )
         
         # Store assistant response
         assistant_message = ChatMessage(
@@ -176,7 +279,8 @@ async def chat(request: ChatRequest, db: Session = Depends(get_db)):
             context_used=str(rag_response["contexts"][:2])  # Store top 2 contexts
         )
         db.add(assistant_message)
-        db.commit()
+        with stage_timer("persist_assistant"):
+            db.commit()
         
         return ChatResponse(
             session_id=session_id,
@@ -186,14 +290,79 @@ async def chat(request: ChatRequest, db: Session = Depends(get_db)):
         )
     
     except Exception as e:
+        record_error("chat", "handler", e)
+        ERRORS.inc(component="chat", stage="handler")
         raise HTTPException(status_code=500, detail=f"Error processing chat: {str(e)}")
 
+@app.post("/chat/batch", response_model=ChatBatchResponse)
+async def chat_batch(
+    request: ChatBatchRequest,
+    http_request: Request,
+    claims: Optional[TokenClaims] = Depends(get_token_claims),
+    _slot: None = Depends(batch_pool.slot)
+):
+    """
+    Answer many independent questions in one call (FAQ generation, evals)
+    No session or history is kept. Each result has either a message or an
+    error, in the order of the items.
+    """
+    if not request.items:
+        raise HTTPException(status_code=422, detail="items must not be empty")
+    if len(request.items) > CHAT_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {CHAT_BATCH_MAX_ITEMS} items per batch")
+    
+    personalization = None
+    software_background = claims.software_background if claims else request.software_background
+    hardware_background = claims.hardware_background if claims else request.hardware_background
+    if software_background and hardware_background:
+        with stage_timer("personalization"):
+            personalization = personalization_service.system_fragment(software_background, hardware_background)
+    
+    usage_context = UsageContext(
+        feature="chat_batch",
+        user_id=usage_user_id(claims.user_id if claims else None, _client_host(http_request)),
+        level=f"{software_background}:{hardware_background}" if personalization else None
+    )
+    try:
+        with stage_timer("rag_batch"), usage_scope(usage_context):
+            responses = await run_in_threadpool(
+                rag_engine.get().query_many,
+                [item.message for item in request.items],
+                [item.selected_text for item in request.items],
+                personalization
+            )
+    except Exception as e:
+        record_error("chat", "batch", e)
+        ERRORS.inc(component="chat", stage="batch")
+        raise HTTPException(status_code=500, detail=f"Error processing batch: {str(e)}")
+    
+    results = [
+        ChatBatchResult(
+            id=item.id,
+            message=response.get("answer"),
+            sources=response.get("sources", []),
+            error=response.get("error"),
+            error_code=response.get("error_code")
+        )
+        for item, response in zip(request.items, responses)
+    ]
+    failed = sum(1 for result in results if result.error)
+    return ChatBatchResponse(
+        results=results,
+        succeeded=len(results) - failed,
+        failed=failed,
+        timestamp=datetime.utcnow().isoformat()
+    )
+
 @app.post("/session/new", response_model=SessionResponse)
-async def create_session(db: Session = Depends(get_db)):
-    """Create a new chat session"""
+async def create_session(
+    db: Session = Depends(get_db),
+    claims: Optional[TokenClaims] = Depends(get_token_claims)
+):
+    """Create a new chat session, owned by the token's user when one is sent"""
     try:
         session_id = str(uuid.uuid4())
-        new_session = ChatSession(id=session_id)
+        new_session = ChatSession(id=session_id, user_id=claims.user_id if claims else None)
         db.add(new_session)
         db.commit()
         
@@ -231,85 +400,107 @@ async def get_session_history(session_id: str, db: Session = Depends(get_db)):
 async def delete_session(session_id: str, db: Session = Depends(get_db)):
     """Delete a chat session and its messages"""
     try:
-        # Delete messages
-        db.query(ChatMessage).filter(ChatMessage.session_id == session_id).delete()
-        # Delete session
-        db.query(ChatSession).filter(ChatSession.id == session_id).delete()
-        db.commit()
+        # Delete messages and session in one transaction
+        delete_sessions(db, [session_id])
         
         return {"message": "Session deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting session: {str(e)}")
 
 @app.post("/translate")
-async def translate_content(text: str):
+async def translate_content(text: str, _slot: None = Depends(translation_pool.slot)):
     """Translate content to Urdu using deep-translator"""
     try:
         # Use actual translation service
-        translated = await translation_service.translate_to_urdu(text)
+        translated = await translation_service.get().translate_to_urdu(text)
         return {
             "translated_text": translated,
             "original_text": text
         }
     except Exception as e:
-        print(f"Translation error: {e}")
+        record_error("translation", "handler", e)
         raise HTTPException(status_code=500, detail=f"Translation error: {str(e)}")
 
-@app.get("/health")
-async def health_check(db: Session = Depends(get_db)):
-    """Detailed health check for all services"""
-    health_status = {
-        "status": "healthy",
-        "timestamp": datetime.utcnow().isoformat(),
-        "services": {}
-    }
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness probe
+    Returns 503 until the schema step and the RAG engine are ready,
+    retrying whatever failed once warm-up has finished
+    """
+    if startup_state.warming:
+        return JSONResponse(status_code=503, content={"ready": False, "warming": True})
     
-    # Check Qdrant connection
-    try:
-        collections = rag_engine.qdrant_client.get_collections()
-        collection_name = os.getenv("QDRANT_COLLECTION_NAME", "physical_ai_textbook")
-        collection_names = [c.name for c in collections.collections]
-        
-        if collection_name in collection_names:
-            collection_info = rag_engine.qdrant_client.get_collection(collection_name)
-            points_count = collection_info.points_count
-            health_status["services"]["qdrant"] = {
-                "status": "healthy",
-                "collection": collection_name,
-                "points": points_count,
-                "warning": "Low point count" if points_count < 100 else None
-            }
-        else:
-            health_status["services"]["qdrant"] = {
-                "status": "warning",
-                "message": f"Collection '{collection_name}' not found. Run embeddings.py"
-            }
-    except Exception as e:
-        health_status["services"]["qdrant"] = {
-            "status": "unhealthy",
-            "error": str(e)
-        }
-        health_status["status"] = "degraded"
+    if startup_state.schema == "failed":
+        await startup_state.init_schema(init_db)
+    if not rag_engine.ready:
+        await rag_engine.warm()
     
-    # Check database connection
-    try:
-        db.execute(text("SELECT 1"))
-        health_status["services"]["database"] = {"status": "healthy"}
-    except Exception as e:
-        health_status["services"]["database"] = {
-            "status": "unhealthy",
-            "error": str(e)
+    ready = startup_state.schema in ("ready", "skipped") and rag_engine.ready
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "ready": ready,
+            "schema": startup_state.schema,
+            "schema_error": startup_state.schema_error,
+            "startup_seconds": startup_state.startup_seconds,
+            "services": {
+                "rag": rag_engine.status(),
+                "translation": translation_service.status()
+            }
         }
-        health_status["status"] = "degraded"
-    
-    # Check LLM configuration
-    llm_model = os.getenv("LLM_MODEL")
-    health_status["services"]["llm"] = {
+    )
+
+def _health_response(snapshot: dict) -> dict:
+    """Add static LLM configuration to a health monitor snapshot"""
+    snapshot["timestamp"] = datetime.utcnow().isoformat()
+    snapshot["services"]["llm"] = {
         "status": "configured",
-        "model": llm_model
+        "model": os.getenv("LLM_MODEL")
     }
-    
-    return health_status
+    return snapshot
+
+@app.get("/health")
+async def health_check():
+    """
+    Detailed health check for all services
+    Served from the health monitor's cache; dependencies are probed in the background
+    """
+    return _health_response(health_monitor.snapshot())
+
+@app.get("/health/deep")
+async def deep_health_check():
+    """Probe every dependency now and refresh the cached health status"""
+    return _health_response(await health_monitor.refresh())
+
+def _collect_stats() -> Dict:
+    """Component stats shared by /stats and /metrics"""
+    return {
+        "retention": retention_job.stats(),
+        "admission": admission_stats(),
+        "passwords": password_hasher.stats(),
+        "event_loop": loop_monitor.stats(),
+        "profile_cache": profile_cache.stats(),
+        "usage": usage_tracker.stats(),
+        "profiling": profiler.stats(),
+        "tracing": tracer.stats(),
+        "rag": rag_engine.get().stats() if rag_engine.ready else None,
+        "translation": translation_service.get().stats() if translation_service.ready else None,
+        "translation_cache": translation_service.get().cache.stats() if translation_service.ready else None,
+        "translation_memory": translation_service.get().memory.stats() if translation_service.ready else None,
+    }
+
+@app.get("/stats")
+async def get_stats():
+    """Operational metrics for background jobs, load shedding and the event loop"""
+    return {**_collect_stats(), "timestamp": datetime.utcnow().isoformat()}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics: per-stage latency histograms, error and fallback counters, and /stats values"""
+    return Response(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+REGISTRY.register_collector("", _collect_stats)
 
 if __name__ == "__main__":
     import uvicorn
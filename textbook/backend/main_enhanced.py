@@ -3,29 +3,80 @@ FastAPI Main Application - Extended with Bonus Features
 RAG Chatbot Backend with authentication, personalization, and translation
 """
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
+from contextlib import AsyncExitStack, asynccontextmanager
+import asyncio
+import json
 import uuid
 import os
 from dotenv import load_dotenv
 from sqlalchemy.orm import Session
 
-from database import init_db, get_db, ChatSession, ChatMessage, UserProfile
+from database import init_db, get_db, SessionLocal, ChatSession, ChatMessage
 from rag import RAGEngine
-from auth import router as auth_router
+from auth import router as auth_router, get_cached_profile, profile_cache
 from personalization import PersonalizationService
+from lifecycle import LazyResource, StartupState
+from admission import batch_pool, chat_pool, translation_pool, admission_stats
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, ERRORS, REGISTRY, RequestTimingMiddleware, stage_timer
+from health import HealthMonitor, EventLoopLagMonitor, check_database, make_qdrant_check
+from passwords import password_hasher
+from tokens import TOKEN_STATUS_HEADER, TokenClaims, get_token_claims, token_signer
+from retention import retention_job, touch_session
+from usage import UsageContext, usage_scope, usage_tracker, usage_user_id
+from profiling import ProfilingMiddleware, profiler, router as profiling_router
+from tracing import TracingMiddleware, record_error, tracer
 from translation import TranslationService
 
 load_dotenv()
 
+# Service clients are constructed lazily so a dependency outage at boot
+# does not prevent the process from starting
+rag_engine = LazyResource("rag", RAGEngine)
+translation_service = LazyResource("translation", TranslationService)
+personalization_service = PersonalizationService()
+startup_state = StartupState()
+
+# Dependency health is probed in the background and served from memory
+health_monitor = HealthMonitor()
+health_monitor.register("qdrant", make_qdrant_check(
+    lambda: rag_engine.get().qdrant_client,
+    os.getenv("QDRANT_COLLECTION_NAME", "physical_ai_textbook")
+))
+health_monitor.register("database", check_database)
+loop_monitor = EventLoopLagMonitor()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up dependencies in the background"""
+    token_signer.require_keys()
+    startup_state.start_warmup(init_db, [rag_engine, translation_service])
+    health_monitor.start()
+    loop_monitor.start()
+    retention_job.start()
+    usage_tracker.start()
+    tracer.start()
+    yield
+    await usage_tracker.stop()
+    await retention_job.stop()
+    await loop_monitor.stop()
+    await health_monitor.stop()
+    await startup_state.stop()
+    await tracer.stop()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Physical AI Textbook RAG Chatbot",  
     description="AI-powered chatbot with authentication, personalization, and translation",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # CORS configuration
@@ -36,18 +87,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[TOKEN_STATUS_HEADER],
 )
 
-# Initialize database
-init_db()
+# Per-endpoint latency for /metrics
+app.add_middleware(RequestTimingMiddleware)
 
-# Initialize RAG engine and bonus features
-rag_engine = RAGEngine()
-personalization_service = PersonalizationService()
-translation_service = TranslationService()
+# Opt-in request profiling; not installed at all unless PROFILING_ADMIN_TOKEN is set
+if profiler.enabled:
+    app.add_middleware(ProfilingMiddleware)
+
+# Request tracing; not installed unless TRACING_EXPORTER is set
+if tracer.enabled:
+    app.add_middleware(TracingMiddleware)
 
 # Include authentication router
 app.include_router(auth_router)
+app.include_router(profiling_router)
 
 # Pydantic models for API
 
@@ -64,6 +120,32 @@ class ChatResponse(BaseModel):
     sources: List[str]
     timestamp: str
 
+class ChatBatchItem(BaseModel):
+    message: str
+    selected_text: Optional[str] = None
+    id: Optional[str] = None  # Echoed back with the result
+
+class ChatBatchRequest(BaseModel):
+    items: List[ChatBatchItem]
+    user_id: Optional[str] = None  # For personalization
+    language: Optional[str] = "en"  # en or ur
+
+class ChatBatchResult(BaseModel):
+    id: Optional[str] = None
+    message: Optional[str] = None
+    sources: List[str] = []
+    error: Optional[str] = None
+    error_code: Optional[str] = None
+
+class ChatBatchResponse(BaseModel):
+    results: List[ChatBatchResult]
+    succeeded: int
+    failed: int
+    timestamp: str
+
+# Questions accepted per /chat/batch call
+CHAT_BATCH_MAX_ITEMS = int(os.getenv("CHAT_BATCH_MAX_ITEMS", 50))
+
 class PersonalizedIntroRequest(BaseModel):
     user_id: str
     chapter_title: str
@@ -84,71 +166,115 @@ async def root():
         "features": ["RAG", "Authentication", "Personalization", "Translation"]
     }
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest, db: Session = Depends(get_db)):
+def _prepare_chat(
+    request: ChatRequest,
+    db: Session,
+    claims: Optional[TokenClaims],
+    client_host: Optional[str],
+    feature: str = "chat"
+) -> Tuple[str, Optional[str], List[Dict], UsageContext]:
     """
-    Enhanced chat endpoint with personalization support
+    Resolve the session and personalization, and store the user message
+    Returns (session_id, personalization fragment, chat_history, usage context)
     """
-    try:
-        # Get or create session
-        session_id = request.session_id
-        if not session_id:
-            session_id = str(uuid.uuid4())
-            new_session = ChatSession(
-                id=session_id,
-                user_id=request.user_id
-            )
-            db.add(new_session)
-            db.commit()
-        
-        # Get user profile for personalization
-        user_profile = None
-        if request.user_id:
-            user_profile = db.query(UserProfile).filter(
-                UserProfile.id == request.user_id
-            ).first()
-        
-        # Get chat history
+    # Only a verified user owns a session (and gets the authenticated retention TTL)
+    user_id = claims.user_id if claims else None
+    
+    # Get or create session
+    session_id = request.session_id
+    if not session_id:
+        session_id = str(uuid.uuid4())
+        new_session = ChatSession(
+            id=session_id,
+            user_id=user_id
+        )
+        db.add(new_session)
+        db.commit()
+    
+    # Get background levels for personalization
+    background = None
+    if claims:
+        background = (claims.software_background, claims.hardware_background)
+    elif request.user_id:
+        # Legacy clients that send only a user_id
+        user_profile = get_cached_profile(db, request.user_id)
+        if user_profile:
+            background = (user_profile.software_background, user_profile.hardware_background)
+    
+    # Get chat history
+    with stage_timer("history"):
         history_messages = db.query(ChatMessage).filter(
             ChatMessage.session_id == session_id
         ).order_by(ChatMessage.created_at).all()
-        
-        chat_history = [
-            {"role": msg.role, "content": msg.content}
-            for msg in history_messages
-        ]
-        
-        # Personalize query if user profile exists
-        query = request.message
-        if user_profile:
-            query = personalization_service.personalize_prompt(
-                request.message,
-                user_profile.software_background,
-                user_profile.hardware_background
-            )
-        
-        # Store user message
-        user_message = ChatMessage(
-            session_id=session_id,
-            role="user",
-            content=request.message,
-            selected_text=request.selected_text
-        )
-        db.add(user_message)
+    
+    chat_history = [
+        {"role": msg.role, "content": msg.content}
+        for msg in history_messages
+    ]
+    
+    # Personalize via a precompiled system-prompt fragment
+    personalization = None
+    if background:
+        with stage_timer("personalization"):
+            personalization = personalization_service.system_fragment(background[0], background[1])
+    
+    # Store user message
+    user_message = ChatMessage(
+        session_id=session_id,
+        role="user",
+        content=request.message,
+        selected_text=request.selected_text
+    )
+    db.add(user_message)
+    touch_session(db, session_id, user_id)
+    with stage_timer("persist_user"):
         db.commit()
+    
+    # Budgets apply to the verified user only, or to the client address
+    usage_context = UsageContext(
+        feature=feature,
+        user_id=usage_user_id(claims.user_id if claims else None, client_host),
+        session_id=session_id,
+        level=f"{background[0]}:{background[1]}" if background else None
+    )
+    return session_id, personalization, chat_history, usage_context
+
+def _client_host(http_request: Request) -> Optional[str]:
+    """Client address used to budget callers without a valid token"""
+    return http_request.client.host if http_request.client else None
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(
+    request: ChatRequest,
+    http_request: Request,
+    db: Session = Depends(get_db),
+    claims: Optional[TokenClaims] = Depends(get_token_claims),
+    _slot: None = Depends(chat_pool.slot)
+):
+    """
+    Enhanced chat endpoint with personalization support
+    Authenticated requests (Bearer token) are personalized from the token
+    claims without a profile lookup
+    """
+    try:
+        session_id, personalization, chat_history, usage_context = _prepare_chat(request, db, claims, _client_host(http_request))
         
-        # Generate RAG response
-        rag_response = rag_engine.query(
-            question=query,
-            chat_history=chat_history,
-            selected_text=request.selected_text
-        )
+        # Generate RAG response (blocking I/O, so keep it off the event loop)
+        with stage_timer("rag"), usage_scope(usage_context):
+            rag_response = await run_in_threadpool(
+                rag_engine.get().query,
+                question=request.message,
+                chat_history=chat_history,
+                selected_text=request.selected_text,
+                personalization=personalization
+            )
         
         answer = rag_response["answer"]
         
         # Translate if requested
         if request.language == "ur":
-            answer = await translation_service.translate_to_urdu(answer)
+            with stage_timer("translation"):
+                answer = await translation_service.get().translate_to_urdu(answer)
         
         # Store assistant response
         assistant_message = ChatMessage(
@@ -158,7 +284,8 @@ async def chat(request: ChatRequest, db: Session = Depends(get_db)):
             context_used=str(rag_response["contexts"][:2])
         )
         db.add(assistant_message)
-        db.commit()
+        with stage_timer("persist_assistant"):
+            db.commit()
         
         return ChatResponse(
             session_id=session_id,
@@ -168,31 +295,209 @@ async def chat(request: ChatRequest, db: Session = Depends(get_db)):
         )
     
     except Exception as e:
+        record_error("chat", "handler", e)
+        ERRORS.inc(component="chat", stage="handler")
         raise HTTPException(status_code=500, detail=f"Error processing chat: {str(e)}")
 
+@app.post("/chat/batch", response_model=ChatBatchResponse)
+async def chat_batch(
+    request: ChatBatchRequest,
+    http_request: Request,
+    db: Session = Depends(get_db),
+    claims: Optional[TokenClaims] = Depends(get_token_claims),
+    _slot: None = Depends(batch_pool.slot)
+):
+    """
+    Answer many independent questions in one call (FAQ generation, evals)
+    No session or history is kept. Each result has either a message or an
+    error, in the order of the items.
+    """
+    if not request.items:
+        raise HTTPException(status_code=422, detail="items must not be empty")
+    if len(request.items) > CHAT_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {CHAT_BATCH_MAX_ITEMS} items per batch")
+    
+    background = None
+    if claims:
+        background = (claims.software_background, claims.hardware_background)
+    elif request.user_id:
+        user_profile = get_cached_profile(db, request.user_id)
+        if user_profile:
+            background = (user_profile.software_background, user_profile.hardware_background)
+    personalization = None
+    if background:
+        with stage_timer("personalization"):
+            personalization = personalization_service.system_fragment(background[0], background[1])
+    
+    usage_context = UsageContext(
+        feature="chat_batch",
+        user_id=usage_user_id(claims.user_id if claims else None, _client_host(http_request)),
+        level=f"{background[0]}:{background[1]}" if background else None
+    )
+    try:
+        with stage_timer("rag_batch"), usage_scope(usage_context):
+            responses = await run_in_threadpool(
+                rag_engine.get().query_many,
+                [item.message for item in request.items],
+                [item.selected_text for item in request.items],
+                personalization
+            )
+        
+        answers = [response.get("answer") for response in responses]
+        if request.language == "ur":
+            with stage_timer("translation"):
+                service = translation_service.get()
+                answers = await asyncio.gather(*[
+                    service.translate_to_urdu(answer) if answer else asyncio.sleep(0, answer)
+                    for answer in answers
+                ])
+    except Exception as e:
+        record_error("chat", "batch", e)
+        ERRORS.inc(component="chat", stage="batch")
+        raise HTTPException(status_code=500, detail=f"Error processing batch: {str(e)}")
+    
+    results = [
+        ChatBatchResult(
+            id=item.id,
+            message=answer,
+            sources=response.get("sources", []),
+            error=response.get("error"),
+            error_code=response.get("error_code")
+        )
+        for item, response, answer in zip(request.items, responses, answers)
+    ]
+    failed = sum(1 for result in results if result.error)
+    return ChatBatchResponse(
+        results=results,
+        succeeded=len(results) - failed,
+        failed=failed,
+        timestamp=datetime.utcnow().isoformat()
+    )
+
+def _sse(event: Dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+def _store_assistant_message(session_id: str, content: str, contexts: List[Dict]):
+    """Persist a streamed answer once it is complete (own session; runs in a worker thread)"""
+    db = SessionLocal()
+    try:
+        db.add(ChatMessage(
+            session_id=session_id,
+            role="assistant",
+            content=content,
+            context_used=str(contexts[:2])
+        ))
+        with stage_timer("persist_assistant"):
+            db.commit()
+    finally:
+        db.close()
+
+@app.post("/chat/stream")
+async def chat_stream(
+    request: ChatRequest,
+    http_request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+    claims: Optional[TokenClaims] = Depends(get_token_claims)
+):
+    """
+    Streaming chat endpoint (Server-Sent Events)
+    Sends a "meta" event with the session id and sources, "delta" events
+    with answer text, then "done". With language="ur", each sentence is
+    translated while the LLM is still writing the next ones.
+    """
+    # The admission slot is held until the stream ends, not just until
+    # this handler returns
+    admission = AsyncExitStack()
+    await admission.enter_async_context(chat_pool.admit())
+    try:
+        session_id, personalization, chat_history, usage_context = _prepare_chat(request, db, claims, _client_host(http_request), "chat_stream")
+        engine = rag_engine.get()
+        with usage_scope(usage_context):
+            contexts = await run_in_threadpool(engine.retrieve_relevant_context, request.message, request.selected_text)
+    except Exception as e:
+        await admission.aclose()
+        record_error("chat", "handler", e)
+        ERRORS.inc(component="chat", stage="handler")
+        raise HTTPException(status_code=500, detail=f"Error processing chat: {str(e)}")
+    
+    async def events():
+        parts = []
+        # Usage from the streamed completion is attributed to this request
+        with usage_scope(usage_context):
+            try:
+                yield _sse({
+                    "type": "meta",
+                    "session_id": session_id,
+                    "sources": [ctx['metadata'].get('file_name', 'Unknown') for ctx in contexts]
+                })
+                
+                deltas = iterate_in_threadpool(
+                    engine.stream_response(request.message, contexts, chat_history, request.selected_text, personalization)
+                )
+                if request.language == "ur":
+                    deltas = translation_service.get().translate_stream(deltas)
+                
+                async for text in deltas:
+                    parts.append(text)
+                    yield _sse({"type": "delta", "text": text})
+                
+                await run_in_threadpool(_store_assistant_message, session_id, "".join(parts), contexts)
+                yield _sse({"type": "done", "timestamp": datetime.utcnow().isoformat()})
+            except Exception as e:
+                record_error("chat", "stream", e)
+                ERRORS.inc(component="chat", stage="stream")
+                yield _sse({"type": "error", "detail": "Error generating response. Please try again."})
+            finally:
+                await admission.aclose()
+    
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    # Returned responses do not pick up headers set by dependencies
+    if TOKEN_STATUS_HEADER in response.headers:
+        headers[TOKEN_STATUS_HEADER] = response.headers[TOKEN_STATUS_HEADER]
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers=headers,
+        # Releases the slot if the client disconnects before streaming starts
+        background=BackgroundTask(admission.aclose)
+    )
+
 @app.post("/personalize/intro")
 async def get_personalized_intro(
     request: PersonalizedIntroRequest,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    claims: Optional[TokenClaims] = Depends(get_token_claims)
 ):
-    """Get personalized chapter introduction"""
-    user = db.query(UserProfile).filter(UserProfile.id == request.user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    """
+    Get personalized chapter introduction
+    Rendered intros are cached per chapter title and level
+    """
+    if claims:
+        background = (claims.software_background, claims.hardware_background)
+    else:
+        user = get_cached_profile(db, request.user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        background = (user.software_background, user.hardware_background)
     
     intro = personalization_service.get_chapter_intro(
         request.chapter_title,
-        user.software_background,
-        user.hardware_background
+        background[0],
+        background[1]
     )
     
     return intro
 
 @app.post("/translate")
-async def translate_content(request: TranslationRequest):
+async def translate_content(
+    request: TranslationRequest,
+    _slot: None = Depends(translation_pool.slot)
+):
     """Translate content to Urdu"""
     try:
-        translated = await translation_service.translate_to_urdu(request.text)
+        translated = await translation_service.get().translate_to_urdu(request.text)
         return {
             "original": request.text,
             "translated": translated,
@@ -203,15 +508,15 @@ async def translate_content(request: TranslationRequest):
 
 @app.post("/session/new")
 async def create_session(
-    user_id: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    claims: Optional[TokenClaims] = Depends(get_token_claims)
 ):
-    """Create a new chat session"""
+    """Create a new chat session, owned by the token's user when one is sent"""
     try:
         session_id = str(uuid.uuid4())
         new_session = ChatSession(
             id=session_id,
-            user_id=user_id
+            user_id=claims.user_id if claims else None
         )
         db.add(new_session)
         db.commit()
@@ -243,18 +548,48 @@ async def get_session_history(session_id: str, db: Session = Depends(get_db)):
         ]
     }
 
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness probe
+    Returns 503 until the schema step and the RAG engine are ready,
+    retrying whatever failed once warm-up has finished
+    """
+    if startup_state.warming:
+        return JSONResponse(status_code=503, content={"ready": False, "warming": True})
+    
+    if startup_state.schema == "failed":
+        await startup_state.init_schema(init_db)
+    if not rag_engine.ready:
+        await rag_engine.warm()
+    
+    ready = startup_state.schema in ("ready", "skipped") and rag_engine.ready
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "ready": ready,
+            "schema": startup_state.schema,
+            "schema_error": startup_state.schema_error,
+            "startup_seconds": startup_state.startup_seconds,
+            "services": {
+                "rag": rag_engine.status(),
+                "translation": translation_service.status()
+            }
+        }
+    )
+
 @app.get("/health")
 async def health_check():
-    """Detailed health check"""
-    try:
-        collections = rag_engine.qdrant_client.get_collections()
-        qdrant_status = "healthy"
-    except:
-        qdrant_status = "unhealthy"
+    """
+    Detailed health check
+    Served from the health monitor's cache; dependencies are probed in the background
+    """
+    snapshot = health_monitor.snapshot()
+    qdrant_status = snapshot["services"].get("qdrant", {}).get("status", "unknown")
     
     return {
         "status": "healthy",
-        "qdrant": qdrant_status,
+        "qdrant": qdrant_status if qdrant_status in ("unhealthy", "unknown") else "healthy",
         "features": {
             "authentication": True,
             "personalization": True,
@@ -264,6 +599,43 @@ async def health_check():
         "timestamp": datetime.utcnow().isoformat()
     }
 
+@app.get("/health/deep")
+async def deep_health_check():
+    """Probe every dependency now and refresh the cached health status"""
+    snapshot = await health_monitor.refresh()
+    snapshot["timestamp"] = datetime.utcnow().isoformat()
+    return snapshot
+
+def _collect_stats() -> Dict:
+    """Component stats shared by /stats and /metrics"""
+    return {
+        "retention": retention_job.stats(),
+        "admission": admission_stats(),
+        "passwords": password_hasher.stats(),
+        "event_loop": loop_monitor.stats(),
+        "profile_cache": profile_cache.stats(),
+        "usage": usage_tracker.stats(),
+        "profiling": profiler.stats(),
+        "tracing": tracer.stats(),
+        "rag": rag_engine.get().stats() if rag_engine.ready else None,
+        "intro_cache": personalization_service.intro_cache.stats(),
+        "translation": translation_service.get().stats() if translation_service.ready else None,
+        "translation_cache": translation_service.get().cache.stats() if translation_service.ready else None,
+        "translation_memory": translation_service.get().memory.stats() if translation_service.ready else None,
+    }
+
+@app.get("/stats")
+async def get_stats():
+    """Operational metrics for background jobs, load shedding and the event loop"""
+    return {**_collect_stats(), "timestamp": datetime.utcnow().isoformat()}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics: per-stage latency histograms, error and fallback counters, and /stats values"""
+    return Response(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+REGISTRY.register_collector("", _collect_stats)
+
 if __name__ == "__main__":
     import uvicorn
     host = os.getenv("HOST", "0.0.0.0")
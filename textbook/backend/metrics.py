@@ -0,0 +1,236 @@
+"""
+Metrics
+Lightweight counters and latency histograms exposed in Prometheus text format
+"""
+
+import bisect
+import re
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Callable, ContextManager, Dict, List, Optional, Sequence, Tuple
+
+# Seconds; spans a cache hit through a slow LLM completion
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+NAMESPACE = "textbook"
+INVALID_NAME_CHARS = re.compile(r'[^a-zA-Z0-9_]')
+
+
+def _label_key(labelnames: Sequence[str], labels: Dict[str, str]) -> Tuple[str, ...]:
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count, optionally split by labels"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(list(zip(self.labelnames, key)))} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Distribution of observed values in fixed buckets, optionally split by labels"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block, including when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+        for key, (counts, total) in series:
+            base = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(base + [('le', _format_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(base)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(base)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Holds metrics and stats collectors and renders them for /metrics.
+    A collector returns the same nested dict that /stats serves; its
+    numeric leaves are exported as untyped samples named after their path.
+    """
+
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Tuple[str, Callable[[], Optional[Dict]]]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, prefix: str, collect: Callable[[], Optional[Dict]]):
+        with self._lock:
+            self._collectors.append((prefix, collect))
+
+    @staticmethod
+    def _flatten(prefix: str, value, out: Dict[str, float]):
+        if isinstance(value, bool):
+            out[prefix] = int(value)
+        elif isinstance(value, (int, float)):
+            out[prefix] = value
+        elif isinstance(value, dict):
+            for key, child in value.items():
+                Registry._flatten(f"{prefix}_{INVALID_NAME_CHARS.sub('_', str(key))}", child, out)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+
+        for prefix, collect in collectors:
+            try:
+                stats = collect()
+            except Exception as e:
+                print(f"Metrics collector {prefix} failed: {e}")
+                continue
+            samples: Dict[str, float] = {}
+            self._flatten(f"{NAMESPACE}_{prefix}" if prefix else NAMESPACE, stats or {}, samples)
+            for name, value in samples.items():
+                lines.append(f"# TYPE {name} untyped")
+                lines.append(f"{name} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+# Global registry and the metrics shared across modules
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    f"{NAMESPACE}_stage_seconds",
+    "Time spent in each chat pipeline stage",
+    ["stage"]
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    f"{NAMESPACE}_request_seconds",
+    "End-to-end handler time by endpoint",
+    ["endpoint"]
+))
+ERRORS = REGISTRY.register(Counter(
+    f"{NAMESPACE}_errors_total",
+    "Errors by component and stage",
+    ["component", "stage"]
+))
+FALLBACKS = REGISTRY.register(Counter(
+    f"{NAMESPACE}_fallbacks_total",
+    "Degraded responses served instead of failing",
+    ["kind"]
+))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# Added to by profiling and tracing when enabled, so stages also become
+# request profile spans and trace spans
+stage_hooks: List[Callable[[str], ContextManager]] = []
+
+
+def stage_timer(stage: str):
+    """Context manager that records a pipeline stage's duration"""
+    if stage_hooks:
+        return _hooked_stage(stage)
+    return STAGE_SECONDS.time(stage=stage)
+
+
+@contextmanager
+def _hooked_stage(stage: str):
+    with ExitStack() as stack:
+        stack.enter_context(STAGE_SECONDS.time(stage=stage))
+        for hook in stage_hooks:
+            stack.enter_context(hook(stage))
+        yield
+
+
+class RequestTimingMiddleware:
+    """
+    ASGI middleware recording REQUEST_SECONDS per route template.
+    Streaming responses are timed until the last chunk is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            # The router stores the matched route in the scope; unmatched
+            # paths share one label so scanners cannot blow up cardinality
+            route = scope.get("route")
+            endpoint = getattr(route, "path", None) or "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=f"{scope['method']} {endpoint}")
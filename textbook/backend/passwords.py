@@ -0,0 +1,111 @@
+"""
+Password Hashing
+Runs bcrypt on a bounded worker pool so hashing never stalls the event loop
+"""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+
+class PasswordHasher:
+    """
+    bcrypt hashing with a configurable work factor.
+    bcrypt releases the GIL while hashing, so a small thread pool gives
+    real parallelism without blocking the event loop.
+    """
+
+    def __init__(self):
+        self.rounds = int(os.getenv("BCRYPT_ROUNDS", 12))
+        self.max_workers = int(os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {
+            "hashes": 0,
+            "verifies": 0,
+            "rehashes": 0,
+            "hash_seconds_total": 0.0,
+            "verify_seconds_total": 0.0,
+            "max_seconds": 0.0,
+        }
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix="password-hash"
+                    )
+        return self._executor
+
+    def _record(self, counter: str, timer: str, seconds: float):
+        with self._lock:
+            self._stats[counter] += 1
+            self._stats[timer] += seconds
+            self._stats["max_seconds"] = max(self._stats["max_seconds"], seconds)
+
+    def hash(self, password: str) -> str:
+        """Hash a password synchronously with the configured work factor"""
+        import bcrypt  # Deferred: only auth requests need it
+        started = time.perf_counter()
+        hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=self.rounds)).decode('utf-8')
+        self._record("hashes", "hash_seconds_total", time.perf_counter() - started)
+        return hashed
+
+    def verify(self, password: str, hashed: str) -> bool:
+        """Check a password against a bcrypt hash synchronously"""
+        import bcrypt
+        started = time.perf_counter()
+        valid = bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+        self._record("verifies", "verify_seconds_total", time.perf_counter() - started)
+        return valid
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """True if the hash was made with a different work factor ($2b$<rounds>$...)"""
+        try:
+            return int(hashed.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return False
+
+    async def _run(self, fn, *args):
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash_async(self, password: str) -> str:
+        return await self._run(self.hash, password)
+
+    async def verify_async(self, password: str, hashed: str) -> bool:
+        return await self._run(self.verify, password, hashed)
+
+    def record_rehash(self):
+        with self._lock:
+            self._stats["rehashes"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        operations = stats["hashes"] + stats["verifies"]
+        busy_seconds = stats["hash_seconds_total"] + stats["verify_seconds_total"]
+        return {
+            **stats,
+            "hash_seconds_total": round(stats["hash_seconds_total"], 3),
+            "verify_seconds_total": round(stats["verify_seconds_total"], 3),
+            "max_seconds": round(stats["max_seconds"], 3),
+            "avg_seconds": round(busy_seconds / operations, 4) if operations else 0.0,
+            "rounds": self.rounds,
+            "workers": self.max_workers,
+            "pending": self._pending,
+        }
+
+
+# Global password hasher instance
+password_hasher = PasswordHasher()
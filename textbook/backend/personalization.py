@@ -3,8 +3,52 @@ Content Personalization Service
 Adjusts content difficulty based on user's software and hardware background
 """
 
+import os
+from types import MappingProxyType
 from typing import Dict, Optional
 
+from cache import TTLCache
+
+LEVELS = ["beginner", "intermediate", "advanced"]
+
+LEVEL_GUIDANCE = {
+    "beginner": """For beginners:
+- Explain technical terms in simple language
+- Provide step-by-step instructions
+- Include many practical examples
+- Avoid assuming prior knowledge
+- Use analogies when helpful""",
+    "intermediate": """For intermediate users:
+- Balance theory with practice
+- Reference prerequisites but don't over-explain
+- Provide moderate technical depth
+- Focus on practical application""",
+    "advanced": """For advanced users:
+- Use technical terminology freely
+- Provide comprehensive details
+- Focus on edge cases and optimization
+- Assume strong foundational knowledge
+- Reference research papers if relevant""",
+}
+
+INTRO_TEMPLATES = {
+    "beginner": {
+        "greeting": "Welcome to **{chapter_title}**! 👋",
+        "message": "This chapter is customized for your background. We'll explain concepts step-by-step with plenty of examples.",
+        "tip": "💡 Don't worry if some terms are new - we'll explain everything as we go!"
+    },
+    "intermediate": {
+        "greeting": "**{chapter_title}** 🚀",
+        "message": "This content is tailored to your experience level. We'll balance theory with practical implementation.",
+        "tip": "💡 Feel free to skip sections you're already familiar with."
+    },
+    "advanced": {
+        "greeting": "**{chapter_title}** ⚡",
+        "message": "Advanced content ahead. We'll dive deep into technical details and edge cases.",
+        "tip": "💡 This  chapter assumes strong foundational knowledge."
+    }
+}
+
 class PersonalizationService:
     """Personalizes content based on user background"""
     
@@ -30,27 +74,30 @@ class PersonalizationService:
                 "prerequisites": "assumed"
             }
         }
-    
-    def personalize_prompt(
-        self,
-        original_query: str,
-        software_background: str,
-        hardware_background: str
-    ) -> str:
-        """
-        Enhance the RAG prompt with personalization instructions
-        """
-        # Determine overall user level (use the lower of the two)
-        levels = ["beginner", "intermediate", "advanced"]
-        sw_idx = levels.index(software_background) if software_background in levels else 1
-        hw_idx = levels.index(hardware_background) if hardware_background in levels else 1
-        user_level = levels[min(sw_idx, hw_idx)]
         
+        # All nine background pairs are rendered once; every request for the
+        # same pair gets a byte-identical system prompt
+        self.fragments = MappingProxyType({
+            (software, hardware): self._build_fragment(software, hardware)
+            for software in LEVELS
+            for hardware in LEVELS
+        })
+        
+        # Rendered intros by (chapter title, level)
+        self.intro_cache = TTLCache("chapter_intros", int(os.getenv("INTRO_CACHE_MAX_ENTRIES", 2048)))
+    
+    def _user_level(self, software_background: str, hardware_background: str) -> str:
+        """Overall user level: the lower of the two backgrounds"""
+        sw_idx = LEVELS.index(software_background) if software_background in LEVELS else 1
+        hw_idx = LEVELS.index(hardware_background) if hardware_background in LEVELS else 1
+        return LEVELS[min(sw_idx, hw_idx)]
+    
+    def _build_fragment(self, software_background: str, hardware_background: str) -> str:
+        """System-prompt instructions for one background pair"""
+        user_level = self._user_level(software_background, hardware_background)
         adjustments = self.adjustments[user_level]
         
-        # Create personalization instructions
-        personalization_prompt = f"""
-PERSONALIZATION CONTEXT:
+        return f"""PERSONALIZATION CONTEXT:
 - User's software background: {software_background}
 - User's hardware background: {hardware_background}
 - Response style: {adjustments['tone']}
@@ -58,37 +105,30 @@ PERSONALIZATION CONTEXT:
 - Code examples: {adjustments['examples']}
 - Prerequisites: {adjustments['prerequisites']}
 
-USER QUERY: {original_query}
-
-Please adapt your response to match the user's background level. """
-        
-        if user_level == "beginner":
-            personalization_prompt += """
-For beginners:
-- Explain technical terms in simple language
-- Provide step-by-step instructions
-- Include many practical examples
-- Avoid assuming prior knowledge
-- Use analogies when helpful"""
-        
-        elif user_level == "intermediate":
-            personalization_prompt += """
-For intermediate users:
-- Balance theory with practice
-- Reference prerequisites but don't over-explain
-- Provide moderate technical depth
-- Focus on practical application"""
-        
-        else:  # advanced
-            personalization_prompt += """
-For advanced users:
-- Use technical terminology freely
-- Provide comprehensive details
-- Focus on edge cases and optimization
-- Assume strong foundational knowledge
-- Reference research papers if relevant"""
-        
-        return personalization_prompt
+Please adapt your response to match the user's background level.
+{LEVEL_GUIDANCE[user_level]}"""
+    
+    def system_fragment(self, software_background: str, hardware_background: str) -> str:
+        """
+        Precompiled personalization instructions for the system prompt
+        Unknown levels are treated as intermediate
+        """
+        software = software_background if software_background in LEVELS else "intermediate"
+        hardware = hardware_background if hardware_background in LEVELS else "intermediate"
+        return self.fragments[(software, hardware)]
+    
+    def personalize_prompt(
+        self,
+        original_query: str,
+        software_background: str,
+        hardware_background: str
+    ) -> str:
+        """
+        Personalization instructions and query as a single string
+        Chat handlers send system_fragment() as the system prompt and the
+        query as its own message instead, so the prompt prefix stays stable
+        """
+        return f"{self.system_fragment(software_background, hardware_background)}\n\nUSER QUERY: {original_query}"
     
     def get_chapter_intro(
         self,
@@ -99,27 +139,19 @@ For advanced users:
         """
         Generate personalized chapter introduction
         """
-        levels = ["beginner", "intermediate", "advanced"]
-        sw_idx = levels.index(software_background) if software_background in levels else 1
-        hw_idx = levels.index(hardware_background) if hardware_background in levels else 1
-        user_level = levels[min(sw_idx, hw_idx)]
+        user_level = self._user_level(software_background, hardware_background)
+        key = (chapter_title, user_level)
         
-        intros = {
-            "beginner": {
-                "greeting": f"Welcome to **{chapter_title}**! 👋",
-                "message": "This chapter is customized for your background. We'll explain concepts step-by-step with plenty of examples.",
-                "tip": "💡 Don't worry if some terms are new - we'll explain everything as we go!"
-            },
-            "intermediate": {
-                "greeting": f"**{chapter_title}** 🚀",
-                "message": "This content is tailored to your experience level. We'll balance theory with practical implementation.",
-                "tip": "💡 Feel free to skip sections you're already familiar with."
-            },
-            "advanced": {
-                "greeting": f"**{chapter_title}** ⚡",
-                "message": "Advanced content ahead. We'll dive deep into technical details and edge cases.",
-                "tip": "💡 This  chapter assumes strong foundational knowledge."
-            }
+        intro = self.intro_cache.get(key)
+        if intro is None:
+            intro = self.render_intro(chapter_title, user_level)
+            self.intro_cache.set(key, intro)
+        return dict(intro)
+    
+    @staticmethod
+    def render_intro(chapter_title: str, user_level: str) -> Dict[str, str]:
+        """Fill the precompiled intro template for one level"""
+        return {
+            field: template.format(chapter_title=chapter_title)
+            for field, template in INTRO_TEMPLATES[user_level].items()
         }
-        
-        return intros[user_level]
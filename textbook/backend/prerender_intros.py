@@ -0,0 +1,119 @@
+"""
+Personalized Intro Prerenderer
+Renders the chapter intro for every doc in textbook/docs and every level
+into a static JSON bundle, for a frontend that shows intros without
+calling /personalize/intro. Not part of the build; run it on demand.
+
+Usage (from textbook/, or `npm run build:intros`):
+    python3 backend/prerender_intros.py
+    python3 backend/prerender_intros.py --docs docs --out static/personalized-intros.json
+"""
+
+import argparse
+import json
+import re
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+from personalization import LEVELS, PersonalizationService
+
+TEXTBOOK_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_DOCS_DIR = TEXTBOOK_DIR / "docs"
+DEFAULT_OUTPUT = TEXTBOOK_DIR / "static" / "personalized-intros.json"
+
+FRONT_MATTER = re.compile(r'\A---\n(.*?)\n---\n', re.DOTALL)
+MARKDOWN_H1 = re.compile(r'^#\s+(.+?)\s*#*$', re.MULTILINE)
+JSX_H1 = re.compile(r'<h1\b[^>]*>(.*?)</h1>', re.DOTALL)
+TAG = re.compile(r'<[^>]+>')
+CODE_FENCE = re.compile(r'^(`{3,}|~{3,}).*?^\1', re.DOTALL | re.MULTILINE)
+
+
+def _front_matter(source: str) -> Dict[str, str]:
+    match = FRONT_MATTER.match(source)
+    if not match:
+        return {}
+    fields = {}
+    for line in match.group(1).splitlines():
+        key, sep, value = line.partition(":")
+        if sep:
+            fields[key.strip()] = value.strip().strip("'\"")
+    return fields
+
+
+def chapter_title(source: str, fallback: str) -> str:
+    """Front matter title, else the first English heading, else the sidebar label"""
+    fields = _front_matter(source)
+    if fields.get("title"):
+        return fields["title"]
+
+    # Headings inside code examples are not titles
+    body = CODE_FENCE.sub('', FRONT_MATTER.sub('', source))
+
+    if "if (isUrdu)" not in body:
+        match = MARKDOWN_H1.search(body)
+        if match:
+            return match.group(1).strip()
+
+    # Bilingual pages render Urdu first; the English branch is the last return
+    english = body[body.rfind("return ("):] if "if (isUrdu)" in body else body
+    match = JSX_H1.search(english)
+    if match:
+        return re.sub(r'\s+', ' ', TAG.sub('', match.group(1))).strip()
+
+    return fields.get("sidebar_label") or fallback
+
+
+def discover_chapters(docs_dir: Path) -> List[Dict[str, str]]:
+    """Doc id (as Docusaurus assigns it) and title for every page"""
+    chapters = []
+    for path in sorted(docs_dir.rglob("*")):
+        if path.suffix not in (".md", ".mdx"):
+            continue
+        source = path.read_text(encoding="utf-8")
+        relative = path.relative_to(docs_dir).with_suffix("")
+        doc_id = _front_matter(source).get("id")
+        doc_id = str(relative.parent / doc_id) if doc_id else str(relative)
+        chapters.append({"id": doc_id.replace("\\", "/"), "title": chapter_title(source, relative.name)})
+    return chapters
+
+
+def build_bundle(docs_dir: Path) -> Dict:
+    service = PersonalizationService()
+    chapters = {}
+    for chapter in discover_chapters(docs_dir):
+        chapters[chapter["id"]] = {
+            "title": chapter["title"],
+            "intros": {level: service.render_intro(chapter["title"], level) for level in LEVELS},
+        }
+
+    return {
+        "version": 1,
+        "levels": LEVELS,
+        # Overall level for a (software, hardware) pair: the lower of the two
+        "level_for": {
+            f"{software}:{hardware}": service._user_level(software, hardware)
+            for software in LEVELS
+            for hardware in LEVELS
+        },
+        "chapters": chapters,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prerender personalized chapter intros")
+    parser.add_argument("--docs", default=str(DEFAULT_DOCS_DIR), help="Docs directory to scan")
+    parser.add_argument("--out", default=str(DEFAULT_OUTPUT), help="Bundle to write")
+    args = parser.parse_args()
+
+    bundle = build_bundle(Path(args.docs))
+    output = Path(args.out)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    # Sorted, stable output so rebuilding without doc changes is a no-op diff
+    output.write_text(json.dumps(bundle, ensure_ascii=False, indent=1, sort_keys=True) + "\n", encoding="utf-8")
+    print(f"✅ Wrote {len(bundle['chapters'])} chapters x {len(LEVELS)} levels to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
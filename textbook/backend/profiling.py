@@ -0,0 +1,339 @@
+"""
+Request Profiling
+Opt-in span timelines and sampled stacks for individual requests, kept in
+a ring buffer and served from admin endpoints
+"""
+
+import asyncio
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+
+import metrics
+
+PROFILE_HEADER = "x-profile"
+MAX_STACK_DEPTH = 64
+MAX_SPANS = 2000
+# Never profiled: the admin endpoints themselves and probes
+EXCLUDED_PREFIXES = ("/admin/profiles", "/metrics", "/health", "/ready", "/stats")
+
+_active: ContextVar[Optional["RequestProfile"]] = ContextVar("request_profile", default=None)
+
+
+def _collapse(frame) -> str:
+    """Stack as root;...;leaf (file:function, leaf with its line number)"""
+    names = []
+    leaf = True
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        name = f"{Path(code.co_filename).name}:{code.co_name}"
+        names.append(f"{name}:{frame.f_lineno}" if leaf else name)
+        leaf = False
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class RequestProfile:
+    """Span timeline and stack samples for one request"""
+
+    def __init__(self, method: str, path: str, trigger: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.started_at = datetime.utcnow().isoformat()
+        self.status: Optional[int] = None
+        self.duration_ms: Optional[float] = None
+        self.spans: List[Dict] = []
+        self.samples: Dict[str, int] = {}
+        # Worker threads currently inside one of this request's stages (ident -> depth)
+        self.threads: Dict[int, int] = {}
+        # The request's task, sampled on the event loop thread while it runs
+        self.task: Optional[asyncio.Task] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str):
+        ident = threading.get_ident()
+        # Loop-thread stages are covered by sampling the request's task
+        worker = self.loop is None or self.loop is not _running_loop()
+        if worker:
+            with self._lock:
+                self.threads[ident] = self.threads.get(ident, 0) + 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            ended = time.perf_counter()
+            with self._lock:
+                if worker:
+                    depth = self.threads[ident] - 1
+                    if depth:
+                        self.threads[ident] = depth
+                    else:
+                        del self.threads[ident]
+                if len(self.spans) < MAX_SPANS:
+                    self.spans.append({
+                        "name": name,
+                        "start_ms": round((started - self._started) * 1000, 2),
+                        "duration_ms": round((ended - started) * 1000, 2),
+                        "thread": threading.current_thread().name,
+                    })
+
+    def sample(self, frames: Dict[int, object], loop_thread: Optional[int]):
+        with self._lock:
+            idents = list(self.threads)
+        if loop_thread is not None and self.loop is not None and self.task is not None:
+            if asyncio.current_task(self.loop) is self.task:
+                idents.append(loop_thread)
+        stacks = [_collapse(frames[ident]) for ident in idents if ident in frames]
+        with self._lock:
+            for stack in stacks:
+                self.samples[stack] = self.samples.get(stack, 0) + 1
+
+    def finish(self, status: Optional[int]):
+        self.status = status
+        self.duration_ms = round((time.perf_counter() - self._started) * 1000, 2)
+
+    def summary(self) -> Dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "trigger": self.trigger,
+            "started_at": self.started_at,
+            "status": self.status,
+            "duration_ms": self.duration_ms,
+            "spans": len(self.spans),
+            "samples": sum(self.samples.values()),
+        }
+
+    def to_dict(self, top: int = 50) -> Dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start_ms"])
+            stacks = sorted(self.samples.items(), key=lambda item: item[1], reverse=True)
+        return {
+            **self.summary(),
+            "timeline": spans,
+            "top_stacks": [{"stack": stack, "samples": count} for stack, count in stacks[:top]],
+        }
+
+    def collapsed(self) -> str:
+        """Folded stacks for flamegraph.pl, speedscope and similar tools"""
+        with self._lock:
+            return "".join(f"{stack} {count}\n" for stack, count in sorted(self.samples.items()))
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class Profiler:
+    """
+    Decides which requests to profile and samples their stacks.
+    A request is profiled when it sends `X-Profile: <PROFILING_ADMIN_TOKEN>`
+    or is picked at PROFILING_SAMPLE_RATE. Without an admin token nothing
+    is installed, so there is no overhead at all.
+    """
+
+    def __init__(self):
+        self.admin_token = os.getenv("PROFILING_ADMIN_TOKEN", "")
+        self.sample_rate = float(os.getenv("PROFILING_SAMPLE_RATE", 0))
+        self.interval_seconds = float(os.getenv("PROFILING_INTERVAL_MS", 5)) / 1000
+        self.max_active = int(os.getenv("PROFILING_MAX_ACTIVE", 4))
+        self.profiles: deque = deque(maxlen=int(os.getenv("PROFILING_BUFFER_SIZE", 20)))
+        self.enabled = bool(self.admin_token)
+        if self.sample_rate and not self.enabled:
+            print("⚠️  PROFILING_SAMPLE_RATE ignored: set PROFILING_ADMIN_TOKEN to read profiles")
+
+        self._active: List[RequestProfile] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._loop_thread: Optional[int] = None
+        self._stats = {"profiled": 0, "skipped_busy": 0, "samples_taken": 0}
+
+        if self.enabled:
+            # Pipeline stages double as profile spans
+            metrics.stage_hooks.append(self._stage)
+
+    def is_admin(self, token: Optional[str]) -> bool:
+        if not self.enabled or token is None:
+            return False
+        # Header values are latin-1 decoded; compare the raw bytes, since
+        # compare_digest rejects non-ASCII str with TypeError
+        try:
+            supplied = token.encode("latin-1")
+        except UnicodeEncodeError:
+            return False
+        return hmac.compare_digest(supplied, self.admin_token.encode("utf-8"))
+
+    def start(self, scope) -> Optional[RequestProfile]:
+        """Begin profiling this request if it asked for it or was sampled"""
+        path = scope.get("path", "")
+        if path.startswith(EXCLUDED_PREFIXES):
+            return None
+
+        trigger = None
+        for name, value in scope.get("headers", []):
+            if name == PROFILE_HEADER.encode() and self.is_admin(value.decode("latin-1")):
+                trigger = "header"
+                break
+        if trigger is None and self.sample_rate and random.random() < self.sample_rate:
+            trigger = "sampled"
+        if trigger is None:
+            return None
+
+        profile = RequestProfile(scope.get("method", ""), path, trigger)
+        profile.loop = asyncio.get_running_loop()
+        profile.task = asyncio.current_task()
+        with self._lock:
+            if len(self._active) >= self.max_active:
+                self._stats["skipped_busy"] += 1
+                return None
+            self._active.append(profile)
+            self._stats["profiled"] += 1
+            self._loop_thread = threading.get_ident()
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample_forever, name="profiler", daemon=True)
+                self._sampler.start()
+        self._wake.set()
+        return profile
+
+    def finish(self, profile: RequestProfile, status: Optional[int]):
+        profile.finish(status)
+        with self._lock:
+            self._active.remove(profile)
+            self.profiles.append(profile)
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        return next((p for p in list(self.profiles) if p.id == profile_id), None)
+
+    def _sample_forever(self):
+        while True:
+            with self._lock:
+                active = list(self._active)
+                loop_thread = self._loop_thread
+            if not active:
+                self._wake.clear()
+                self._wake.wait()
+                continue
+            frames = sys._current_frames()
+            for profile in active:
+                profile.sample(frames, loop_thread)
+            self._stats["samples_taken"] += 1
+            del frames
+            time.sleep(self.interval_seconds)
+
+    @contextmanager
+    def _stage(self, stage: str):
+        """metrics.stage_timer hook: a span when the request is being profiled"""
+        profile = _active.get()
+        if profile is None:
+            yield
+        else:
+            with profile.span(stage):
+                yield
+
+    def stats(self) -> Dict:
+        with self._lock:
+            active = len(self._active)
+        return {
+            **self._stats,
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "active": active,
+            "stored": len(self.profiles),
+        }
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles selected requests and tags the response
+    with X-Profile-Id. Only added to the app when profiling is enabled.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        profile = profiler.start(scope)
+        if profile is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = None
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile.id.encode())
+                ]}
+            await send(message)
+
+        previous = _active.get()
+        _active.set(profile)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _active.set(previous)
+            profiler.finish(profile, status)
+
+
+# Global profiler instance
+profiler = Profiler()
+
+# Admin endpoints
+router = APIRouter(prefix="/admin/profiles", tags=["admin"])
+
+
+def _require_admin(token: Optional[str]):
+    if not profiler.enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not profiler.is_admin(token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+@router.get("")
+async def list_profiles(x_admin_token: Optional[str] = Header(None)):
+    """Most recent profiles, newest first"""
+    _require_admin(x_admin_token)
+    return {
+        "profiler": profiler.stats(),
+        "profiles": [profile.summary() for profile in reversed(list(profiler.profiles))],
+    }
+
+
+@router.get("/{profile_id}")
+async def get_profile(profile_id: str, format: str = "json", x_admin_token: Optional[str] = Header(None)):
+    """Span timeline and top stacks, or folded stacks with ?format=collapsed"""
+    _require_admin(x_admin_token)
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found (it may have been evicted)")
+    if format == "collapsed":
+        return PlainTextResponse(profile.collapsed())
+    return profile.to_dict()
@@ -3,24 +3,68 @@ RAG (Retrieval-Augmented Generation) Logic
 Handles query embedding, similarity search, context assembly, and LLM response generation
 """
 
+import contextvars
 import os
-from typing import List, Dict, Optional
-from qdrant_client import QdrantClient
-from openai import OpenAI
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Dict, NamedTuple, Optional
 from dotenv import load_dotenv
 
+from batching import MicroBatcher
+from metrics import ERRORS, FALLBACKS, STAGE_SECONDS, stage_timer
+from tracing import current_span, record_error, tracer
+from usage import estimate_tokens, usage_tracker
+
 load_dotenv()
 
+SYSTEM_PROMPT = """You are an expert AI assistant for the Physical AI & Humanoid Robotics textbook. 
+Your role is to help students learn about robotics, ROS 2, simulation, NVIDIA Isaac, and Vision-Language-Action systems.
+
+Guidelines:
+1. Answer questions based on the provided textbook context
+2. Be clear, concise, and educational
+3. Use examples when helpful
+4. If the context doesn't contain the answer, say so honestly
+5. Reference specific modules or sections when relevant
+6. For code questions, provide practical examples
+7. Encourage hands-on learning"""
+
+class QueryEmbedding(NamedTuple):
+    """One text's share of a batched embeddings request"""
+    embedding: List[float]
+    prompt_tokens: int
+    estimated: bool
+    batch_size: int
+
 class RAGEngine:
-    def __init__(self):
-        # Initialize Qdrant client
-        self.qdrant_client = QdrantClient(
-            url=os.getenv("QDRANT_URL"),
-            api_key=os.getenv("QDRANT_API_KEY")
-        )
+    def __init__(self, qdrant_client=None, openai_client=None):
+        """
+        Clients default to the configured services; the retrieval eval
+        passes local ones instead
+        """
+        # Client libraries are imported here rather than at module level:
+        # they dominate import time, and main.py constructs the engine
+        # during background warm-up, after the server is already listening
+        from qdrant_client import QdrantClient
+        from openai import OpenAI
+        
+        # Initialize Qdrant client; QDRANT_PATH selects embedded local mode
+        # (":memory:" or a directory) for benchmarks and offline development
+        qdrant_path = os.getenv("QDRANT_PATH")
+        if qdrant_client is not None:
+            self.qdrant_client = qdrant_client
+        elif qdrant_path == ":memory:":
+            self.qdrant_client = QdrantClient(location=":memory:")
+        elif qdrant_path:
+            self.qdrant_client = QdrantClient(path=qdrant_path)
+        else:
+            self.qdrant_client = QdrantClient(
+                url=os.getenv("QDRANT_URL"),
+                api_key=os.getenv("QDRANT_API_KEY")
+            )
         
         # Initialize OpenAI client (via OpenRouter)
-        self.openai_client = OpenAI(
+        self.openai_client = openai_client or OpenAI(
             api_key=os.getenv("OPENAI_API_KEY"),
             base_url=os.getenv("OPENAI_BASE_URL")
         )
@@ -28,20 +72,72 @@ class RAGEngine:
         self.collection_name = os.getenv("QDRANT_COLLECTION_NAME", "physical_ai_textbook")
         self.embedding_model = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
         self.llm_model = os.getenv("LLM_MODEL", "openai/gpt-3.5-turbo")
+        # Cheaper model for users over their token budget (USAGE_BUDGET_ACTION=fallback)
+        self.fallback_model = os.getenv("LLM_FALLBACK_MODEL") or None
         self.top_k = int(os.getenv("TOP_K_RESULTS", 5))
         self.temperature = float(os.getenv("TEMPERATURE", 0.7))
         self.max_tokens = int(os.getenv("MAX_TOKENS", 500))
+        
+        # Queries arriving within EMBEDDING_BATCH_WINDOW_MS of each other
+        # share one embeddings request (0 sends each on its own)
+        self.embedding_batcher = MicroBatcher(
+            self.embed_texts,
+            float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", 5)) / 1000,
+            int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", 32))
+        )
+        # Completions running at once for query_many, across all batches
+        self.batch_completion_concurrency = int(os.getenv("BATCH_COMPLETION_CONCURRENCY", 8))
+        self._batch_executor: Optional[ThreadPoolExecutor] = None
     
-    def generate_query_embedding(self, query: str) -> List[float]:
-        """Generate embedding for user query"""
-        try:
+    @property
+    def batch_executor(self) -> ThreadPoolExecutor:
+        if self._batch_executor is None:
+            self._batch_executor = ThreadPoolExecutor(
+                max_workers=self.batch_completion_concurrency, thread_name_prefix="rag_batch"
+            )
+        return self._batch_executor
+    
+    def embed_texts(self, texts: List[str]) -> List[QueryEmbedding]:
+        """
+        Embed several texts in one request
+        Reported prompt tokens are split across texts in proportion to their
+        estimated size, so each caller can record its own share
+        """
+        with stage_timer("embedding_request"):
             response = self.openai_client.embeddings.create(
                 model=self.embedding_model,
-                input=query
+                input=texts
             )
-            return response.data[0].embedding
+        
+        estimates = [estimate_tokens(text) for text in texts]
+        reported = getattr(response.usage, "prompt_tokens", None) if response.usage is not None else None
+        if reported is None:
+            shares = estimates
+        else:
+            total = sum(estimates) or 1
+            shares = [reported * estimate // total for estimate in estimates]
+            shares[0] += reported - sum(shares)
+        
+        embeddings = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        return [
+            QueryEmbedding(embedding, share, reported is None, len(texts))
+            for embedding, share in zip(embeddings, shares)
+        ]
+    
+    def generate_query_embedding(self, query: str) -> List[float]:
+        """Generate embedding for user query, batched with concurrent queries"""
+        try:
+            with stage_timer("embedding"):
+                result = self.embedding_batcher.submit(query)
+                span = current_span()
+                if span is not None:
+                    span.set_attribute("batch_size", result.batch_size)
+            # Recorded by each caller, so usage is attributed to its own request
+            usage_tracker.record("embedding", self.embedding_model, result.prompt_tokens, estimated=result.estimated)
+            return result.embedding
         except Exception as e:
-            print(f"Error generating query embedding: {e}")
+            record_error("rag", "embedding", e)
+            ERRORS.inc(component="rag", stage="embedding")
             return []
     
     def retrieve_relevant_context(self, query: str, selected_text: Optional[str] = None) -> List[Dict]:
@@ -49,75 +145,135 @@ class RAGEngine:
         Retrieve relevant context from Qdrant
         If selected_text is provided, prioritize context related to it
         """
-        # If user selected specific text, use that as additional context
-        search_query = query
-        if selected_text:
-            search_query = f"{selected_text}\n\nQuestion: {query}"
-        
         # Generate embedding for the query
-        query_embedding = self.generate_query_embedding(search_query)
+        query_embedding = self.generate_query_embedding(self._search_query(query, selected_text))
         
         if not query_embedding:
             return []
         
         # Search in Qdrant
         try:
-            search_result = self.qdrant_client.search(
-                collection_name=self.collection_name,
-                query_vector=query_embedding,
-                limit=self.top_k,
-                with_payload=True
-            )
-            
-            # Format results
-            contexts = []
-            for hit in search_result:
-                contexts.append({
-                    "text": hit.payload.get("text", ""),
-                    "metadata": {
-                        "file_name": hit.payload.get("file_name", ""),
-                        "module": hit.payload.get("module", ""),
-                        "score": hit.score
-                    }
-                })
+            with stage_timer("search"):
+                search_result = self.qdrant_client.query_points(
+                    collection_name=self.collection_name,
+                    query=query_embedding,
+                    limit=self.top_k,
+                    with_payload=True
+                )
             
-            return contexts
+            return self._format_hits(search_result.points)
         
         except Exception as e:
-            print(f"Error retrieving context: {e}")
+            record_error("rag", "search", e)
+            ERRORS.inc(component="rag", stage="search")
             return []
     
-    def generate_response(
-        self, 
-        query: str, 
-        contexts: List[Dict],
-        chat_history: Optional[List[Dict]] = None,
-        selected_text: Optional[str] = None
-    ) -> Dict:
-        """Generate response using LLM with retrieved context"""
+    def retrieve_many(self, queries: List[str]) -> List[List[Dict]]:
+        """
+        Retrieve context for several queries: one embeddings request and one
+        Qdrant batch query. A failure leaves every query without context.
+        """
+        from qdrant_client.models import QueryRequest
         
-        # Build context string from retrieved chunks
-        context_str = "\n\n---\n\n".join([
-            f"Source: {ctx['metadata'].get('file_name', 'Unknown')}\n{ctx['text']}"
-            for ctx in contexts
-        ])
+        try:
+            with stage_timer("embedding"):
+                embeddings = self.embed_texts(queries)
+            for result in embeddings:
+                usage_tracker.record("embedding", self.embedding_model, result.prompt_tokens, estimated=result.estimated)
+        except Exception as e:
+            record_error("rag", "embedding", e)
+            ERRORS.inc(component="rag", stage="embedding")
+            return [[] for _ in queries]
         
-        # Build system prompt
-        system_prompt = """You are an expert AI assistant for the Physical AI & Humanoid Robotics textbook. 
-Your role is to help students learn about robotics, ROS 2, simulation, NVIDIA Isaac, and Vision-Language-Action systems.
-
-Guidelines:
-1. Answer questions based on the provided textbook context
-2. Be clear, concise, and educational
-3. Use examples when helpful
-4. If the context doesn't contain the answer, say so honestly
-5. Reference specific modules or sections when relevant
-6. For code questions, provide practical examples
-7. Encourage hands-on learning"""
-
-        # Add selected text context if available
+        try:
+            with stage_timer("search"):
+                responses = self.qdrant_client.query_batch_points(
+                    collection_name=self.collection_name,
+                    requests=[
+                        QueryRequest(query=result.embedding, limit=self.top_k, with_payload=True)
+                        for result in embeddings
+                    ]
+                )
+            return [self._format_hits(response.points) for response in responses]
+        except Exception as e:
+            record_error("rag", "search", e)
+            ERRORS.inc(component="rag", stage="search")
+            return [[] for _ in queries]
+    
+    @staticmethod
+    def _search_query(query: str, selected_text: Optional[str]) -> str:
+        """If user selected specific text, use that as additional context"""
         if selected_text:
-            system_prompt += f"\n\nThe user has selected this specific text from the book:\n{selected_text}\n\nAnswer their question with this context in mind."
+            return f"{selected_text}\n\nQuestion: {query}"
+        return query
+    
+    @staticmethod
+    def _format_hits(points) -> List[Dict]:
+        contexts = []
+        for hit in points:
+            contexts.append({
+                "text": hit.payload.get("text", ""),
+                "metadata": {
+                    "file_name": hit.payload.get("file_name", ""),
+                    "file_path": hit.payload.get("file_path", ""),
+                    "module": hit.payload.get("module", ""),
+                    "score": hit.score
+                }
+            })
+        return contexts
+    
+    @staticmethod
+    def _record_usage(kind: str, model: str, usage, prompt_text: str, completion_text: str = ""):
+        """Record reported token usage, or an estimate when the provider omits it"""
+        if usage is not None and getattr(usage, "prompt_tokens", None) is not None:
+            usage_tracker.record(kind, model, usage.prompt_tokens, getattr(usage, "completion_tokens", 0) or 0)
+        else:
+            usage_tracker.record(
+                kind, model, estimate_tokens(prompt_text),
+                estimate_tokens(completion_text) if completion_text else 0, estimated=True
+            )
+    
+    def _completion_model(self) -> Optional[str]:
+        """
+        Model to answer with under the current usage budget, or None when
+        the budget calls for a degraded answer without the LLM
+        """
+        action = usage_tracker.budget_action()
+        if action == "degraded":
+            FALLBACKS.inc(kind="budget_degraded")
+            return None
+        if action == "fallback" and self.fallback_model:
+            FALLBACKS.inc(kind="budget_fallback_model")
+            return self.fallback_model
+        return self.llm_model
+    
+    @staticmethod
+    def degraded_answer(contexts: List[Dict]) -> str:
+        """Retrieved passages as the answer, for users over their budget"""
+        if not contexts:
+            return "You have reached your usage limit for now. Please try again later."
+        passages = "\n\n".join(
+            f"**{ctx['metadata'].get('file_name', 'Unknown')}**\n{ctx['text']}" for ctx in contexts[:3]
+        )
+        return f"You have reached your usage limit for now, so here are the most relevant textbook passages:\n\n{passages}"
+    
+    def build_messages(
+        self,
+        query: str,
+        contexts: List[Dict],
+        chat_history: Optional[List[Dict]] = None,
+        selected_text: Optional[str] = None,
+        personalization: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Assemble the chat messages for a question and its retrieved context
+        The system prompt depends only on the personalization fragment, so
+        it is byte-identical across requests and providers can cache it;
+        everything request-specific goes in the final user message
+        """
+        system_prompt = SYSTEM_PROMPT
+        if personalization:
+            system_prompt = f"{SYSTEM_PROMPT}\n\n{personalization}"
         
         # Build messages for OpenAI
         messages = [{"role": "system", "content": system_prompt}]
@@ -130,24 +286,47 @@ Guidelines:
                     "content": msg["content"]
                 })
         
+        # Build context string from retrieved chunks
+        context_str = "\n\n---\n\n".join([
+            f"Source: {ctx['metadata'].get('file_name', 'Unknown')}\n{ctx['text']}"
+            for ctx in contexts
+        ])
+        
         # Add current query with context
         user_message = f"""Context from the textbook:
-{context_str}
-
-Question: {query}"""
+{context_str}"""
+        
+        # Add selected text context if available
+        if selected_text:
+            user_message += f"\n\nThe user has selected this specific text from the book:\n{selected_text}\n\nAnswer their question with this context in mind."
+        
+        user_message += f"\n\nQuestion: {query}"
         
         messages.append({"role": "user", "content": user_message})
+        return messages
+    
+    def generate_response(
+        self, 
+        query: str, 
+        contexts: List[Dict],
+        chat_history: Optional[List[Dict]] = None,
+        selected_text: Optional[str] = None,
+        personalization: Optional[str] = None
+    ) -> Dict:
+        """Generate response using LLM with retrieved context"""
+        model = self._completion_model()
+        if model is None:
+            return {
+                "answer": self.degraded_answer(contexts),
+                "contexts": contexts,
+                "sources": [ctx['metadata'].get('file_name', 'Unknown') for ctx in contexts]
+            }
+        
+        messages = self.build_messages(query, contexts, chat_history, selected_text, personalization)
         
         # Generate response
         try:
-            response = self.openai_client.chat.completions.create(
-                model=self.llm_model,
-                messages=messages,
-                temperature=self.temperature,
-                max_tokens=self.max_tokens
-            )
-            
-            answer = response.choices[0].message.content
+            answer = self._complete(model, messages)
             
             return {
                 "answer": answer,
@@ -156,33 +335,180 @@ Question: {query}"""
             }
         
         except Exception as e:
-            print(f"Error generating response: {e}")
+            record_error("rag", "completion", e)
+            ERRORS.inc(component="rag", stage="completion")
+            FALLBACKS.inc(kind="llm_error_message")
             return {
                 "answer": "I apologize, but I encountered an error generating a response. Please try again.",
                 "contexts": [],
                 "sources": []
             }
     
+    def _complete(self, model: str, messages: List[Dict]) -> str:
+        """One chat completion with usage recorded; raises on failure"""
+        with stage_timer("completion"):
+            response = self.openai_client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens
+            )
+        
+        answer = response.choices[0].message.content
+        self._record_usage(
+            "completion", model, response.usage,
+            "".join(m["content"] for m in messages), answer or ""
+        )
+        return answer
+    
+    def stream_response(
+        self,
+        query: str,
+        contexts: List[Dict],
+        chat_history: Optional[List[Dict]] = None,
+        selected_text: Optional[str] = None,
+        personalization: Optional[str] = None
+    ) -> Iterator[str]:
+        """
+        Yield the answer text as the LLM generates it
+        Errors are raised to the caller, which has already started responding
+        """
+        model = self._completion_model()
+        if model is None:
+            yield self.degraded_answer(contexts)
+            return
+        
+        messages = self.build_messages(query, contexts, chat_history, selected_text, personalization)
+        started = time.perf_counter()
+        started_ns = time.time_ns()
+        first_token = True
+        usage = None
+        answer: List[str] = []
+        first_token_ms = None
+        error = None
+        try:
+            stream = self.openai_client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                stream=True,
+                # The final chunk carries token usage for the whole stream
+                stream_options={"include_usage": True}
+            )
+            try:
+                for chunk in stream:
+                    if getattr(chunk, "usage", None) is not None:
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if first_token:
+                            first_token_ms = (time.perf_counter() - started) * 1000
+                            STAGE_SECONDS.observe(first_token_ms / 1000, stage="completion_first_token")
+                            first_token = False
+                        answer.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+            finally:
+                stream.close()
+                # Also counts streams the client abandoned part way
+                if usage is not None or answer:
+                    self._record_usage(
+                        "completion", model, usage,
+                        "".join(m["content"] for m in messages), "".join(answer)
+                    )
+        except Exception as e:
+            error = e
+            ERRORS.inc(component="rag", stage="completion_stream")
+            raise
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage="completion_stream")
+            # Recorded after the fact: a span made current here would leak
+            # into the consumer across yields
+            tracer.record_span(
+                "completion_stream", started_ns, time.time_ns(), error,
+                model=model, chunks=len(answer), first_token_ms=first_token_ms
+            )
+    
     def query(
         self, 
         question: str,
         chat_history: Optional[List[Dict]] = None,
-        selected_text: Optional[str] = None
+        selected_text: Optional[str] = None,
+        personalization: Optional[str] = None
     ) -> Dict:
         """
         Main RAG query function
-        1. Retrieve relevant context
+        1. Retrieve relevant context (embedding only the question)
         2. Generate response with LLM
+        personalization is an optional system-prompt fragment from
+        PersonalizationService.system_fragment
         """
         # Retrieve relevant context
         contexts = self.retrieve_relevant_context(question, selected_text)
+        if not contexts:
+            FALLBACKS.inc(kind="no_context")
         
         # Generate response
         response = self.generate_response(
             question,
             contexts,
             chat_history,
-            selected_text
+            selected_text,
+            personalization
         )
         
         return response
+    
+    def query_many(
+        self,
+        questions: List[str],
+        selected_texts: Optional[List[Optional[str]]] = None,
+        personalization: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Answer independent questions (no chat history) in bulk
+        1. Embed all of them in one request and search in one batch query
+        2. Generate answers on the batch executor, at most
+           BATCH_COMPLETION_CONCURRENCY at a time across all batches
+        Returns one dict per question, in order: answer, contexts and sources,
+        or error and error_code when its completion failed (details go to the
+        log and trace, not the caller). Like query(), a question whose
+        retrieval failed is answered without context.
+        """
+        if not questions:
+            return []
+        selected_texts = selected_texts or [None] * len(questions)
+        contexts_per_question = self.retrieve_many([
+            self._search_query(question, selected_text)
+            for question, selected_text in zip(questions, selected_texts)
+        ])
+        # One budget check for the whole batch: it belongs to one user
+        model = self._completion_model()
+        
+        def answer(index: int) -> Dict:
+            contexts = contexts_per_question[index]
+            if not contexts:
+                FALLBACKS.inc(kind="no_context")
+            sources = [ctx['metadata'].get('file_name', 'Unknown') for ctx in contexts]
+            if model is None:
+                return {"answer": self.degraded_answer(contexts), "contexts": contexts, "sources": sources}
+            
+            messages = self.build_messages(
+                questions[index], contexts, None, selected_texts[index], personalization
+            )
+            try:
+                return {"answer": self._complete(model, messages), "contexts": contexts, "sources": sources}
+            except Exception as e:
+                record_error("rag", "completion", e)
+                ERRORS.inc(component="rag", stage="completion")
+                return {"error": "Could not generate an answer for this question", "error_code": "completion_failed"}
+        
+        # Each task gets its own copy of the caller's context, so usage and
+        # trace spans are attributed to this request
+        futures = [
+            self.batch_executor.submit(contextvars.copy_context().run, answer, index)
+            for index in range(len(questions))
+        ]
+        return [future.result() for future in futures]
+    
+    def stats(self) -> Dict:
+        return {"embedding_batches": self.embedding_batcher.stats()}
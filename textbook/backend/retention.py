@@ -0,0 +1,211 @@
+"""
+Chat Session Retention
+Expires old chat sessions and their messages in bounded batches
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, func
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, ChatSession, ChatMessage
+
+
+def delete_sessions(db: Session, session_ids: List[str], idle_before: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Delete a batch of sessions and all of their messages in one transaction.
+    With idle_before, a session is only deleted if it is still idle at
+    delete time: one touched after it was selected survives, and so do
+    its messages.
+    """
+    if not session_ids:
+        return {"sessions": 0, "messages": 0}
+
+    statement = delete(ChatSession).where(ChatSession.id.in_(session_ids))
+    if idle_before is not None:
+        statement = statement.where(ChatSession.updated_at < idle_before)
+    deleted_ids = db.execute(statement.returning(ChatSession.id)).scalars().all()
+
+    # An explicit delete also clears messages whose session row is already gone
+    message_session_ids = deleted_ids if idle_before is not None else session_ids
+    messages_deleted = 0
+    if message_session_ids:
+        messages_deleted = db.query(ChatMessage).filter(
+            ChatMessage.session_id.in_(message_session_ids)
+        ).delete(synchronize_session=False)
+    db.commit()
+
+    return {"sessions": len(deleted_ids), "messages": messages_deleted}
+
+
+def touch_session(db: Session, session_id: str, user_id: Optional[str] = None):
+    """
+    Mark a session as active so retention measures idle time, not age.
+    With a verified user_id, an anonymous session becomes that user's, so
+    it is kept for the authenticated TTL; an existing owner is never changed.
+    The caller is responsible for committing.
+    """
+    values = {ChatSession.updated_at: datetime.utcnow()}
+    if user_id:
+        values[ChatSession.user_id] = func.coalesce(ChatSession.user_id, user_id)
+    db.query(ChatSession).filter(ChatSession.id == session_id).update(
+        values,
+        synchronize_session=False
+    )
+
+
+class RetentionPolicy:
+    """TTLs for anonymous and authenticated sessions (0 disables expiry)"""
+
+    def __init__(self):
+        self.anonymous_ttl_days = float(os.getenv("SESSION_TTL_ANONYMOUS_DAYS", 30))
+        self.authenticated_ttl_days = float(os.getenv("SESSION_TTL_AUTHENTICATED_DAYS", 365))
+        self.batch_size = int(os.getenv("RETENTION_BATCH_SIZE", 500))
+        self.max_batches_per_run = int(os.getenv("RETENTION_MAX_BATCHES_PER_RUN", 100))
+        self.interval_seconds = float(os.getenv("RETENTION_INTERVAL_SECONDS", 3600))
+        self.initial_delay_seconds = float(os.getenv("RETENTION_INITIAL_DELAY_SECONDS", 60))
+        self.batch_pause_seconds = float(os.getenv("RETENTION_BATCH_PAUSE_SECONDS", 0.1))
+        self.enabled = os.getenv("RETENTION_ENABLED", "true").lower() == "true"
+
+
+class RetentionJob:
+    """Background job that purges idle sessions in bounded batches"""
+
+    def __init__(self, policy: Optional[RetentionPolicy] = None):
+        self.policy = policy or RetentionPolicy()
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "runs": 0,
+            "batches": 0,
+            "sessions_deleted": 0,
+            "messages_deleted": 0,
+            "last_run_started_at": None,
+            "last_run_duration_seconds": None,
+            "last_run_sessions_deleted": 0,
+            "last_run_complete": None,
+            "last_error": None,
+        }
+
+    def _expired_batch(self, db: Session, authenticated: bool, cutoff: datetime) -> List[str]:
+        """Select the ids of at most one batch of idle sessions"""
+        query = db.query(ChatSession.id).filter(ChatSession.updated_at < cutoff)
+        if authenticated:
+            query = query.filter(ChatSession.user_id.isnot(None))
+        else:
+            query = query.filter(ChatSession.user_id.is_(None))
+
+        rows = query.order_by(ChatSession.updated_at).limit(self.policy.batch_size).all()
+        return [row[0] for row in rows]
+
+    def purge(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Run one purge pass synchronously.
+        Stops early after max_batches_per_run so a large backlog is
+        worked off over several runs instead of one long transaction.
+        """
+        now = now or datetime.utcnow()
+        started = time.monotonic()
+        self._stats["runs"] += 1
+        self._stats["last_run_started_at"] = now.isoformat()
+
+        totals = {"sessions": 0, "messages": 0, "batches": 0}
+        targets = [
+            (False, self.policy.anonymous_ttl_days),
+            (True, self.policy.authenticated_ttl_days),
+        ]
+        complete = True
+
+        db = SessionLocal()
+        try:
+            for authenticated, ttl_days in targets:
+                if ttl_days <= 0:
+                    continue
+                cutoff = now - timedelta(days=ttl_days)
+
+                while True:
+                    if totals["batches"] >= self.policy.max_batches_per_run:
+                        complete = False
+                        break
+
+                    session_ids = self._expired_batch(db, authenticated, cutoff)
+                    if not session_ids:
+                        break
+
+                    deleted = delete_sessions(db, session_ids, idle_before=cutoff)
+                    totals["sessions"] += deleted["sessions"]
+                    totals["messages"] += deleted["messages"]
+                    totals["batches"] += 1
+
+                    self._stats["batches"] += 1
+                    self._stats["sessions_deleted"] += deleted["sessions"]
+                    self._stats["messages_deleted"] += deleted["messages"]
+
+                    if len(session_ids) < self.policy.batch_size:
+                        break
+                    if self.policy.batch_pause_seconds:
+                        time.sleep(self.policy.batch_pause_seconds)
+
+                if not complete:
+                    break
+
+            self._stats["last_error"] = None
+        except Exception as e:
+            db.rollback()
+            self._stats["last_error"] = str(e)
+            raise
+        finally:
+            db.close()
+            self._stats["last_run_duration_seconds"] = round(time.monotonic() - started, 3)
+            self._stats["last_run_sessions_deleted"] = totals["sessions"]
+            self._stats["last_run_complete"] = complete
+
+        return totals
+
+    async def _run_forever(self):
+        # Stay off the database while the process is still warming up
+        await asyncio.sleep(self.policy.initial_delay_seconds)
+        while True:
+            try:
+                totals = await asyncio.to_thread(self.purge)
+                if totals["sessions"]:
+                    print(
+                        f"Retention: deleted {totals['sessions']} sessions and "
+                        f"{totals['messages']} messages in {totals['batches']} batches"
+                    )
+            except Exception as e:
+                print(f"Retention error: {e}")
+            await asyncio.sleep(self.policy.interval_seconds)
+
+    def start(self):
+        """Start the background purge loop on the running event loop"""
+        if self.policy.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run_forever())
+
+    async def stop(self):
+        """Cancel the background purge loop"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict:
+        """Progress metrics for the retention job"""
+        return {
+            **self._stats,
+            "enabled": self.policy.enabled,
+            "running": self._task is not None and not self._task.done(),
+            "anonymous_ttl_days": self.policy.anonymous_ttl_days,
+            "authenticated_ttl_days": self.policy.authenticated_ttl_days,
+            "batch_size": self.policy.batch_size,
+        }
+
+
+# Global retention job instance
+retention_job = RetentionJob()
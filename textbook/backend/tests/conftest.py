@@ -0,0 +1,19 @@
+"""
+Test configuration
+The backend is a flat set of modules run from textbook/backend, so make
+them importable when pytest is started from anywhere. Tests that touch
+the database get a throwaway SQLite file instead of the configured one.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+# Must be set before database.py is imported; overrides any .env value
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/test.db"
+os.environ.setdefault("AUTH_TOKEN_KEYS", "test:test-secret")
@@ -0,0 +1,109 @@
+"""
+AdmissionPool: bounded concurrency and load shedding with 429
+"""
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from admission import AdmissionPool
+
+
+async def hold(pool: AdmissionPool, release: asyncio.Event, active: list, peak: list):
+    async with pool.admit():
+        active.append(1)
+        peak[0] = max(peak[0], len(active))
+        await release.wait()
+        active.pop()
+
+
+def test_concurrency_is_capped_and_queued_requests_run_later():
+    async def scenario():
+        pool = AdmissionPool("test", max_concurrency=2, max_queue=4, queue_timeout=5)
+        release, active, peak = asyncio.Event(), [], [0]
+        tasks = [asyncio.create_task(hold(pool, release, active, peak)) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        assert pool.stats()["in_flight"] == 2 and pool.stats()["waiting"] == 3
+
+        release.set()
+        await asyncio.gather(*tasks)
+        return pool, peak[0]
+
+    pool, peak = asyncio.run(scenario())
+    assert peak == 2
+    assert pool.stats()["admitted"] == 5
+    assert pool.stats()["in_flight"] == 0 and pool.stats()["waiting"] == 0
+
+
+def test_full_queue_is_rejected_immediately():
+    async def scenario():
+        pool = AdmissionPool("test", max_concurrency=1, max_queue=1, queue_timeout=5)
+        release, active, peak = asyncio.Event(), [], [0]
+        tasks = [asyncio.create_task(hold(pool, release, active, peak)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        try:
+            with pytest.raises(HTTPException) as rejected:
+                async with pool.admit():
+                    pass
+        finally:
+            release.set()
+            await asyncio.gather(*tasks)
+        return pool, rejected.value
+
+    pool, error = asyncio.run(scenario())
+    assert error.status_code == 429
+    assert int(error.headers["Retry-After"]) >= 1
+    assert pool.stats()["rejected_queue_full"] == 1
+
+
+def test_request_times_out_in_the_queue():
+    async def scenario():
+        pool = AdmissionPool("test", max_concurrency=1, max_queue=4, queue_timeout=0.05)
+        release, active, peak = asyncio.Event(), [], [0]
+        holder = asyncio.create_task(hold(pool, release, active, peak))
+        await asyncio.sleep(0.01)
+        try:
+            with pytest.raises(HTTPException) as rejected:
+                async with pool.admit():
+                    pass
+        finally:
+            release.set()
+            await holder
+        return pool, rejected.value
+
+    pool, error = asyncio.run(scenario())
+    assert error.status_code == 429
+    assert pool.stats()["timed_out_in_queue"] == 1
+    assert pool.stats()["waiting"] == 0
+
+
+def test_expected_wait_beyond_the_deadline_is_rejected_up_front():
+    async def scenario():
+        pool = AdmissionPool("test", max_concurrency=1, max_queue=10, queue_timeout=1)
+        # Requests have been taking 2s each, so waiting for a slot would
+        # exceed the 1s deadline
+        pool._avg_service_seconds = 2.0
+        release, active, peak = asyncio.Event(), [], [0]
+        holder = asyncio.create_task(hold(pool, release, active, peak))
+        await asyncio.sleep(0.01)
+        try:
+            with pytest.raises(HTTPException) as rejected:
+                async with pool.admit():
+                    pass
+        finally:
+            release.set()
+            await holder
+        return pool, rejected.value
+
+    pool, error = asyncio.run(scenario())
+    assert error.status_code == 429
+    assert int(error.headers["Retry-After"]) == 2
+    assert pool.stats()["rejected_deadline"] == 1
+
+
+def test_limits_can_be_overridden_from_the_environment(monkeypatch):
+    monkeypatch.setenv("SAMPLE_MAX_CONCURRENCY", "3")
+    monkeypatch.setenv("SAMPLE_QUEUE_TIMEOUT_SECONDS", "2.5")
+    pool = AdmissionPool.from_env("sample", max_concurrency=8, max_queue=16, queue_timeout=10)
+    assert (pool.max_concurrency, pool.max_queue, pool.queue_timeout) == (3, 16, 2.5)
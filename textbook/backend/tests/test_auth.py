@@ -0,0 +1,78 @@
+"""
+Profile updates require the profile owner's token
+"""
+
+import uuid
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import auth
+from database import init_db
+
+
+@pytest.fixture(scope="module")
+def client() -> TestClient:
+    init_db()
+    app = FastAPI()
+    app.include_router(auth.router)
+    return TestClient(app)
+
+
+def signup(client: TestClient) -> dict:
+    response = client.post("/auth/signup", json={
+        "email": f"{uuid.uuid4().hex[:12]}@example.com",
+        "name": "Test User",
+        "password": "correct horse battery",
+        "software_background": "beginner",
+        "hardware_background": "beginner",
+    })
+    assert response.status_code == 200
+    return response.json()
+
+
+def bearer(user: dict) -> dict:
+    return {"Authorization": f"Bearer {user['token']}"}
+
+
+def test_owner_can_update_and_gets_a_fresh_token(client):
+    user = signup(client)
+    response = client.put(
+        f"/auth/profile/{user['user_id']}",
+        params={"software_background": "advanced"},
+        headers=bearer(user),
+    )
+    assert response.status_code == 200
+    claims = auth.token_signer.verify(response.json()["token"])
+    assert (claims.user_id, claims.software_background) == (user["user_id"], "advanced")
+
+
+@pytest.mark.parametrize("headers", [{}, {"Authorization": "Bearer not-a-token"}])
+def test_update_without_a_valid_token_is_rejected(client, headers):
+    user = signup(client)
+    response = client.put(f"/auth/profile/{user['user_id']}", params={"software_background": "advanced"}, headers=headers)
+    assert response.status_code == 401
+    assert "token" not in response.json()
+    assert client.get(f"/auth/profile/{user['user_id']}").json()["software_background"] == "beginner"
+
+
+def test_another_users_token_is_forbidden(client):
+    victim, attacker = signup(client), signup(client)
+    response = client.put(
+        f"/auth/profile/{victim['user_id']}",
+        params={"hardware_background": "advanced"},
+        headers=bearer(attacker),
+    )
+    assert response.status_code == 403
+    assert client.get(f"/auth/profile/{victim['user_id']}").json()["hardware_background"] == "beginner"
+
+
+def test_unknown_levels_are_rejected(client):
+    user = signup(client)
+    response = client.put(
+        f"/auth/profile/{user['user_id']}",
+        params={"software_background": "wizard"},
+        headers=bearer(user),
+    )
+    assert response.status_code == 400
@@ -0,0 +1,111 @@
+"""
+MicroBatcher: coalescing, result order and error propagation
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import pytest
+
+from batching import MicroBatcher
+
+
+class Recorder:
+    """process() that remembers every batch it was called with"""
+
+    def __init__(self, fail: bool = False):
+        self.batches: List[List[int]] = []
+        self.fail = fail
+        self._lock = threading.Lock()
+
+    def __call__(self, items: List[int]) -> List[int]:
+        with self._lock:
+            self.batches.append(list(items))
+        if self.fail:
+            raise RuntimeError("upstream unavailable")
+        return [item * 10 for item in items]
+
+
+def submit_concurrently(batcher: MicroBatcher, items: List[int]):
+    """Submit every item from its own thread, all at once; results or exceptions in item order"""
+    barrier = threading.Barrier(len(items))
+
+    def call(item):
+        barrier.wait()
+        try:
+            return batcher.submit(item)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(len(items)) as pool:
+        return list(pool.map(call, items))
+
+
+def test_each_caller_gets_its_own_result():
+    process = Recorder()
+    batcher = MicroBatcher(process, window_seconds=0.2, max_size=8)
+
+    results = submit_concurrently(batcher, list(range(8)))
+
+    assert results == [item * 10 for item in range(8)]
+    # Everyone arrived inside the window, so one full batch
+    assert len(process.batches) == 1
+    assert sorted(process.batches[0]) == list(range(8))
+    stats = batcher.stats()
+    assert stats["calls"] == 8 and stats["batches"] == 1 and stats["full_batches"] == 1
+
+
+def test_full_batches_close_and_later_callers_start_a_new_one():
+    process = Recorder()
+    batcher = MicroBatcher(process, window_seconds=0.2, max_size=4)
+
+    results = submit_concurrently(batcher, list(range(10)))
+
+    assert results == [item * 10 for item in range(10)]
+    assert all(len(batch) <= 4 for batch in process.batches)
+    assert sorted(item for batch in process.batches for item in batch) == list(range(10))
+    assert batcher.stats()["largest_batch"] == 4
+
+
+def test_error_reaches_every_caller_in_the_batch():
+    process = Recorder(fail=True)
+    batcher = MicroBatcher(process, window_seconds=0.2, max_size=5)
+
+    results = submit_concurrently(batcher, list(range(5)))
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert batcher.stats()["errors"] == len(process.batches)
+
+
+def test_wrong_number_of_results_is_an_error():
+    batcher = MicroBatcher(lambda items: items[:-1], window_seconds=0.2, max_size=3)
+
+    results = submit_concurrently(batcher, [1, 2, 3])
+
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_batcher_recovers_after_an_error():
+    calls = {"count": 0}
+
+    def flaky(items):
+        calls["count"] += 1
+        if calls["count"] == 1:
+            raise RuntimeError("first call fails")
+        return items
+
+    batcher = MicroBatcher(flaky, window_seconds=0.01, max_size=4)
+    with pytest.raises(RuntimeError):
+        batcher.submit("a")
+    assert batcher.submit("b") == "b"
+
+
+@pytest.mark.parametrize("window_seconds, max_size", [(0, 8), (0.05, 1)])
+def test_disabled_batcher_calls_process_directly(window_seconds, max_size):
+    process = Recorder()
+    batcher = MicroBatcher(process, window_seconds=window_seconds, max_size=max_size)
+
+    assert not batcher.enabled
+    assert batcher.submit(3) == 30
+    assert process.batches == [[3]]
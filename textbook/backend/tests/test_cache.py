@@ -0,0 +1,78 @@
+"""
+TTLCache: LRU eviction, expiry and hit-ratio stats
+"""
+
+import time
+
+from cache import TTLCache
+
+
+def test_get_and_set():
+    cache = TTLCache("test", max_entries=4)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache("test", max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")  # "b" is now least recently used
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+    assert len(cache) == 2
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache = TTLCache("test", max_entries=4, ttl_seconds=10)
+    cache.set("a", 1)
+
+    now[0] += 9
+    assert cache.get("a") == 1
+    now[0] += 2
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+    assert len(cache) == 0
+
+
+def test_get_or_load_calls_loader_only_on_miss():
+    cache = TTLCache("test", max_entries=4)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return "value"
+
+    assert cache.get_or_load("a", loader) == "value"
+    assert cache.get_or_load("a", loader) == "value"
+    assert len(calls) == 1
+
+
+def test_none_results_are_not_cached():
+    cache = TTLCache("test", max_entries=4)
+    calls = []
+    cache.get_or_load("missing", lambda: calls.append(1))
+    cache.get_or_load("missing", lambda: calls.append(1))
+    assert len(calls) == 2
+
+
+def test_invalidate_and_stats():
+    cache = TTLCache("test", max_entries=4)
+    cache.set("a", 1)
+    cache.invalidate("a")
+    cache.invalidate("a")
+    cache.get("a")
+    cache.set("b", 2)
+    cache.get("b")
+
+    stats = cache.stats()
+    assert stats["invalidations"] == 1
+    assert stats["entries"] == 1
+    assert stats["hit_ratio"] == 0.5
@@ -0,0 +1,67 @@
+"""
+Profiling admin checks must not fail on unusual header bytes
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import metrics
+import profiling
+from profiling import Profiler, ProfilingMiddleware
+
+ADMIN_TOKEN = "s3cret-token"
+
+
+@pytest.fixture
+def profiler(monkeypatch) -> Profiler:
+    monkeypatch.setenv("PROFILING_ADMIN_TOKEN", ADMIN_TOKEN)
+    # An enabled profiler registers a stage hook; keep it out of other tests
+    monkeypatch.setattr(metrics, "stage_hooks", list(metrics.stage_hooks))
+    instance = Profiler()
+    monkeypatch.setattr(profiling, "profiler", instance)
+    return instance
+
+
+@pytest.fixture
+def client(profiler) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware)
+    app.include_router(profiling.router)
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("token, expected", [
+    (ADMIN_TOKEN, True),
+    ("wrong", False),
+    ("", False),
+    (None, False),
+    ("tökén", False),
+    ("日本語", False),
+])
+def test_is_admin(profiler, token, expected):
+    assert profiler.is_admin(token) is expected
+
+
+@pytest.mark.parametrize("value", ["caf\xe9".encode("latin-1"), "日本語".encode("utf-8")])
+def test_non_ascii_profile_header_is_ignored(client, value):
+    response = client.get("/ping", headers=[(b"x-profile", value)])
+    assert response.status_code == 200
+    assert "x-profile-id" not in response.headers
+
+
+def test_non_ascii_admin_token_is_forbidden(client):
+    response = client.get("/admin/profiles", headers=[(b"x-admin-token", "ключ".encode("utf-8"))])
+    assert response.status_code == 403
+
+
+def test_admin_token_profiles_the_request(client):
+    response = client.get("/ping", headers={"X-Profile": ADMIN_TOKEN})
+    assert response.status_code == 200
+    assert "x-profile-id" in response.headers
+    assert client.get("/admin/profiles", headers={"X-Admin-Token": ADMIN_TOKEN}).status_code == 200
@@ -0,0 +1,110 @@
+"""
+Session retention: idle sessions are purged with their messages, and a
+session touched while a purge is running survives
+"""
+
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import ChatMessage, ChatSession, SessionLocal, init_db
+from retention import RetentionJob, RetentionPolicy, delete_sessions, touch_session
+
+NOW = datetime(2026, 1, 31, 12, 0)
+
+
+@pytest.fixture
+def db():
+    init_db()
+    session = SessionLocal()
+    session.query(ChatMessage).delete()
+    session.query(ChatSession).delete()
+    session.commit()
+    yield session
+    session.close()
+
+
+def add_session(db, days_idle: float, user_id=None, messages: int = 2) -> str:
+    session_id = str(uuid.uuid4())
+    updated_at = NOW - timedelta(days=days_idle)
+    db.add(ChatSession(id=session_id, user_id=user_id, created_at=updated_at, updated_at=updated_at))
+    for index in range(messages):
+        db.add(ChatMessage(session_id=session_id, role="user", content=f"message {index}"))
+    db.commit()
+    return session_id
+
+
+def remaining(db):
+    return (
+        {row[0] for row in db.query(ChatSession.id)},
+        {row[0] for row in db.query(ChatMessage.session_id)},
+    )
+
+
+def make_job(monkeypatch, **overrides) -> RetentionJob:
+    monkeypatch.setenv("SESSION_TTL_ANONYMOUS_DAYS", "30")
+    monkeypatch.setenv("SESSION_TTL_AUTHENTICATED_DAYS", "365")
+    monkeypatch.setenv("RETENTION_BATCH_PAUSE_SECONDS", "0")
+    for name, value in overrides.items():
+        monkeypatch.setenv(name, str(value))
+    return RetentionJob(RetentionPolicy())
+
+
+def test_purge_applies_the_ttl_for_each_kind_of_session(db, monkeypatch):
+    old_anonymous = add_session(db, days_idle=45)
+    recent_anonymous = add_session(db, days_idle=5)
+    old_authenticated = add_session(db, days_idle=45, user_id="user-1")
+    ancient_authenticated = add_session(db, days_idle=400, user_id="user-2")
+
+    totals = make_job(monkeypatch).purge(now=NOW)
+
+    sessions, message_sessions = remaining(db)
+    assert sessions == {recent_anonymous, old_authenticated}
+    assert message_sessions == sessions
+    assert not {old_anonymous, ancient_authenticated} & sessions
+    assert totals["sessions"] == 2 and totals["messages"] == 4
+
+
+def test_purge_works_in_batches(db, monkeypatch):
+    for _ in range(5):
+        add_session(db, days_idle=45, messages=1)
+
+    totals = make_job(monkeypatch, RETENTION_BATCH_SIZE=2).purge(now=NOW)
+
+    assert totals == {"sessions": 5, "messages": 5, "batches": 3}
+    assert remaining(db) == (set(), set())
+
+
+def test_session_touched_after_selection_is_kept(db):
+    cutoff = NOW - timedelta(days=30)
+    idle = add_session(db, days_idle=45)
+    touched = add_session(db, days_idle=45)
+
+    # The purge has selected both, then a chat turn touches one of them
+    selected = [idle, touched]
+    touch_session(db, touched)
+    db.commit()
+
+    deleted = delete_sessions(db, selected, idle_before=cutoff)
+
+    assert deleted == {"sessions": 1, "messages": 2}
+    assert remaining(db) == ({touched}, {touched})
+
+
+def test_explicit_delete_ignores_idle_time(db):
+    session_id = add_session(db, days_idle=0)
+    assert delete_sessions(db, [session_id]) == {"sessions": 1, "messages": 2}
+    assert remaining(db) == (set(), set())
+
+
+def test_touch_claims_anonymous_sessions_but_keeps_owners(db):
+    anonymous = add_session(db, days_idle=1)
+    owned = add_session(db, days_idle=1, user_id="owner")
+
+    touch_session(db, anonymous, "user-1")
+    touch_session(db, owned, "user-2")
+    db.commit()
+
+    owners = dict(db.query(ChatSession.id, ChatSession.user_id))
+    assert owners == {anonymous: "user-1", owned: "owner"}
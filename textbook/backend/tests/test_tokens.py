@@ -0,0 +1,135 @@
+"""
+Signed session tokens: verification, key rotation and the optional
+bearer dependency
+"""
+
+import json
+
+import pytest
+from fastapi import Depends, FastAPI, Response
+from fastapi.testclient import TestClient
+
+import tokens
+from tokens import TOKEN_STATUS_HEADER, TokenError, TokenSigner, _b64encode, get_token_claims
+
+
+def make_signer(monkeypatch, keys: str, ttl: int = 3600) -> TokenSigner:
+    monkeypatch.setenv("AUTH_TOKEN_KEYS", keys)
+    monkeypatch.setenv("AUTH_TOKEN_TTL_SECONDS", str(ttl))
+    monkeypatch.delenv("AUTH_TOKEN_ALLOW_EPHEMERAL", raising=False)
+    return TokenSigner()
+
+
+def test_issue_and_verify_round_trip(monkeypatch):
+    signer = make_signer(monkeypatch, "k1:first-secret")
+    claims = signer.verify(signer.issue("user-1", "advanced", "beginner"))
+
+    assert claims.user_id == "user-1"
+    assert claims.software_background == "advanced"
+    assert claims.hardware_background == "beginner"
+    assert claims.expires_at - claims.issued_at == 3600
+
+
+def test_tampered_payload_is_rejected(monkeypatch):
+    signer = make_signer(monkeypatch, "k1:first-secret")
+    payload_part, signature_part = signer.issue("user-1", "advanced", "beginner").split(".")
+    payload = json.loads(tokens._b64decode(payload_part))
+    payload["sw"] = "expert"
+    forged = _b64encode(json.dumps(payload).encode()) + "." + signature_part
+
+    with pytest.raises(TokenError, match="Invalid signature"):
+        signer.verify(forged)
+
+
+def test_expired_token_is_rejected(monkeypatch):
+    signer = make_signer(monkeypatch, "k1:first-secret", ttl=-10)
+    with pytest.raises(TokenError, match="expired"):
+        signer.verify(signer.issue("user-1", "advanced", "beginner"))
+
+
+@pytest.mark.parametrize("payload", [b"[1, 2]", b'"text"', b"42", b"null", b'{"kid": ["k1"]}', b'{"kid": "k1"}'])
+def test_malformed_payloads_are_invalid_not_errors(monkeypatch, payload):
+    signer = make_signer(monkeypatch, "k1:first-secret")
+    with pytest.raises(TokenError, match="Malformed"):
+        signer.verify(_b64encode(payload) + "." + _b64encode(b"signature"))
+
+
+@pytest.mark.parametrize("token", ["", "no-dot", "a.b.c", "!!!.???"])
+def test_garbage_tokens_are_malformed(monkeypatch, token):
+    signer = make_signer(monkeypatch, "k1:first-secret")
+    with pytest.raises(TokenError, match="Malformed"):
+        signer.verify(token)
+
+
+def test_rotation_keeps_old_tokens_valid_until_the_key_is_dropped(monkeypatch):
+    old_token = make_signer(monkeypatch, "k1:first-secret").issue("user-1", "advanced", "beginner")
+
+    # New key prepended: it signs new tokens, the old key still verifies
+    rotated = make_signer(monkeypatch, "k2:second-secret,k1:first-secret")
+    assert rotated.verify(old_token).user_id == "user-1"
+    new_token = rotated.issue("user-1", "advanced", "beginner")
+    assert json.loads(tokens._b64decode(new_token.split(".")[0]))["kid"] == "k2"
+
+    # Old key retired
+    retired = make_signer(monkeypatch, "k2:second-secret")
+    assert retired.verify(new_token).user_id == "user-1"
+    with pytest.raises(TokenError, match="Unknown signing key"):
+        retired.verify(old_token)
+
+
+def test_same_kid_with_a_different_secret_is_rejected(monkeypatch):
+    token = make_signer(monkeypatch, "k1:first-secret").issue("user-1", "advanced", "beginner")
+    with pytest.raises(TokenError, match="Invalid signature"):
+        make_signer(monkeypatch, "k1:other-secret").verify(token)
+
+
+def test_missing_keys_refuse_to_start(monkeypatch):
+    signer = make_signer(monkeypatch, "")
+    with pytest.raises(RuntimeError, match="AUTH_TOKEN_KEYS"):
+        signer.require_keys()
+    with pytest.raises(RuntimeError):
+        signer.issue("user-1", "advanced", "beginner")
+
+
+def test_ephemeral_key_only_when_allowed(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN_KEYS", "")
+    monkeypatch.setenv("AUTH_TOKEN_ALLOW_EPHEMERAL", "true")
+    signer = TokenSigner()
+    signer.require_keys()
+    assert signer.verify(signer.issue("user-1", "advanced", "beginner")).user_id == "user-1"
+
+
+def test_bad_bearer_tokens_fall_back_to_anonymous(monkeypatch):
+    signer = make_signer(monkeypatch, "k1:first-secret")
+    monkeypatch.setattr(tokens, "token_signer", signer)
+    token = signer.issue("user-1", "advanced", "beginner")
+
+    def claims_for(authorization):
+        response = Response()
+        return get_token_claims(response, authorization), response.headers.get(TOKEN_STATUS_HEADER)
+
+    assert claims_for(f"Bearer {token}")[0].user_id == "user-1"
+    assert claims_for(f"Bearer {token}")[1] is None
+    assert claims_for(None) == (None, None)
+    assert claims_for("Bearer 3f2b6c1e-legacy-uuid-token") == (None, "rejected")
+    assert claims_for(f"Basic {token}") == (None, "rejected")
+    assert claims_for("Bearer") == (None, "rejected")
+
+
+def test_rejected_token_is_flagged_on_the_response(monkeypatch):
+    signer = make_signer(monkeypatch, "k1:first-secret")
+    monkeypatch.setattr(tokens, "token_signer", signer)
+    app = FastAPI()
+
+    @app.get("/whoami")
+    def whoami(claims=Depends(get_token_claims)):
+        return {"user_id": claims.user_id if claims else None}
+
+    client = TestClient(app)
+    stale = client.get("/whoami", headers={"Authorization": "Bearer expired-or-legacy"})
+    assert stale.json() == {"user_id": None}
+    assert stale.headers[TOKEN_STATUS_HEADER] == "rejected"
+
+    valid = client.get("/whoami", headers={"Authorization": f"Bearer {signer.issue('user-1', 'a', 'b')}"})
+    assert valid.json() == {"user_id": "user-1"}
+    assert TOKEN_STATUS_HEADER not in valid.headers
@@ -0,0 +1,87 @@
+"""
+Translation helpers that must never change the text they do not translate
+"""
+
+import pytest
+
+from translation import pack_segments, split_markup
+
+PARAGRAPH = (
+    "ROS 2 is a middleware for robots. Nodes exchange messages over topics! "
+    "Services answer requests? Actions run long tasks.\n\nLaunch files start many nodes."
+)
+
+
+@pytest.mark.parametrize("max_chars", [10, 25, 40, 80, 5000])
+def test_segments_join_back_to_the_original(max_chars):
+    segments = pack_segments(PARAGRAPH, max_chars)
+    assert "".join(segment + separator for segment, separator in segments) == PARAGRAPH
+
+
+@pytest.mark.parametrize("max_chars", [10, 25, 40, 80])
+def test_segments_respect_the_limit(max_chars):
+    assert all(len(segment) <= max_chars for segment, _ in pack_segments(PARAGRAPH, max_chars))
+
+
+def test_short_text_is_one_segment():
+    assert pack_segments("Hello world.", 100) == [("Hello world.", "")]
+
+
+def test_sentences_are_packed_greedily():
+    segments = pack_segments("One. Two. Three. Four.", 10)
+    assert segments == [("One. Two.", " "), ("Three.", " "), ("Four.", "")]
+
+
+def test_oversized_sentence_is_split_at_spaces():
+    text = "word " * 30 + "end"
+    segments = pack_segments(text, 20)
+    assert "".join(segment + separator for segment, separator in segments) == text
+    assert all(len(segment) <= 20 and not segment.startswith(" ") for segment, _ in segments)
+
+
+def test_unbroken_text_is_cut_hard():
+    segments = pack_segments("x" * 45, 20)
+    assert [segment for segment, _ in segments] == ["x" * 20, "x" * 20, "x" * 5]
+
+
+MARKDOWN = (
+    "## Setup\n"
+    "- Install [ROS 2](https://docs.ros.org/en/humble/) first.\n"
+    "- Run `ros2 run demo_nodes_cpp talker` in a terminal.\n\n"
+    "```python\nimport rclpy  # Keep this comment\n```\n"
+    "Press <kbd>Ctrl</kbd>+C to stop. | 42 |\n"
+    "Next|||SEPARATOR|||Previous"
+)
+
+
+def protected(text):
+    return [span for span, translatable in split_markup(text) if not translatable]
+
+
+def prose(text):
+    return [span for span, translatable in split_markup(text) if translatable]
+
+
+def test_markup_spans_join_back_to_the_original():
+    assert "".join(span for span, _ in split_markup(MARKDOWN)) == MARKDOWN
+
+
+def test_code_urls_and_markup_are_not_translated():
+    kept = protected(MARKDOWN)
+    assert "```python\nimport rclpy  # Keep this comment\n```" in kept
+    assert "`ros2 run demo_nodes_cpp talker`" in kept
+    assert "](https://docs.ros.org/en/humble/)" in kept
+    assert "<kbd>" in kept and "</kbd>" in kept
+    assert "## " in kept and "- " in kept
+    assert "|||SEPARATOR|||" in kept
+
+
+def test_prose_is_translated():
+    assert prose(MARKDOWN) == [
+        "Setup", "Install ", "ROS 2", " first.", "Run ", " in a terminal.",
+        "Press ", "Ctrl", "+C to stop. ", "Next", "Previous",
+    ]
+
+
+def test_spans_without_letters_are_not_translated():
+    assert split_markup(" 42 ") == [(" 42 ", False)]
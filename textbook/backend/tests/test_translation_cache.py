@@ -0,0 +1,83 @@
+"""
+TranslationCache: the shared SQLite store is pruned least recently used
+first, and stores from before last_used was tracked are migrated
+"""
+
+import sqlite3
+import time
+
+import pytest
+
+from translation_cache import TranslationCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def cache_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "translations.sqlite3")
+    monkeypatch.setenv("TRANSLATION_CACHE_PATH", path)
+    return path
+
+
+def disk_keys(path) -> set:
+    with sqlite3.connect(path) as connection:
+        return {row[0] for row in connection.execute("SELECT key FROM translations")}
+
+
+def test_disk_hit_keeps_an_old_entry_from_being_pruned(cache_path, clock):
+    cache = TranslationCache()
+    for key in ("a", "b", "c"):
+        cache.set(key, key.upper())
+        clock[0] += 1
+
+    # A fresh worker reads "a" from disk, so "b" is now least recently used
+    other = TranslationCache()
+    assert other.get("a") == "A"
+    assert other.stats()["disk_hits"] == 1
+    other.max_disk_entries = 2
+    other._prune(other._connection())
+
+    assert disk_keys(cache_path) == {"a", "c"}
+
+
+def test_memory_hits_are_batched(cache_path, clock, monkeypatch):
+    monkeypatch.setenv("TRANSLATION_CACHE_TOUCH_BATCH_SIZE", "2")
+    cache = TranslationCache()
+    for key in ("a", "b", "c"):
+        cache.set(key, key.upper())
+        clock[0] += 1
+
+    assert cache.get("a") == "A"
+    with sqlite3.connect(cache_path) as connection:
+        assert connection.execute("SELECT last_used FROM translations WHERE key = 'a'").fetchone()[0] == 1000.0
+
+    assert cache.get("b") == "B"
+    with sqlite3.connect(cache_path) as connection:
+        used = dict(connection.execute("SELECT key, last_used FROM translations"))
+    assert used == {"a": 1003.0, "b": 1003.0, "c": 1002.0}
+
+
+def test_misses_are_counted(cache_path):
+    cache = TranslationCache()
+    assert cache.get("missing") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_store_without_last_used_is_migrated(cache_path, clock):
+    with sqlite3.connect(cache_path) as connection:
+        connection.execute(
+            "CREATE TABLE translations (key TEXT PRIMARY KEY, translation TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        connection.execute("INSERT INTO translations VALUES ('old', 'OLD', 5.0)")
+
+    cache = TranslationCache()
+    assert cache.stats()["persistent"]
+    assert cache.get("old") == "OLD"
+    with sqlite3.connect(cache_path) as connection:
+        assert connection.execute("SELECT last_used FROM translations").fetchone()[0] == 5.0
@@ -0,0 +1,113 @@
+"""
+Translation memory lookups: exact, near-exact, and sentences that only
+look similar
+"""
+
+import json
+
+import pytest
+
+from translation_memory import TranslationMemory, english_blocks, extract_parallel_pairs
+
+PAIRS = [
+    ("A GPU is required for this lab.", "اس لیب کے لیے GPU درکار ہے۔"),
+    ("ROS 2 nodes communicate over topics.", "ROS 2 نوڈز ٹاپکس کے ذریعے بات چیت کرتے ہیں۔"),
+    ("Module 1: The Robotic Nervous System", "ماڈیول 1: روبوٹک اعصابی نظام"),
+]
+
+
+@pytest.fixture
+def memory(tmp_path, monkeypatch) -> TranslationMemory:
+    export = tmp_path / "tm.json"
+    export.write_text(json.dumps({"sources": 1, "pairs": PAIRS}, ensure_ascii=False), encoding="utf-8")
+    monkeypatch.setenv("TRANSLATION_MEMORY_PATH", str(export))
+    monkeypatch.setenv("TRANSLATION_MEMORY_ENABLED", "true")
+    return TranslationMemory()
+
+
+def test_exact_match(memory):
+    assert memory.lookup("A GPU is required for this lab.") == PAIRS[0][1]
+    assert memory.stats()["exact_hits"] == 1
+
+
+def test_whitespace_is_normalized_for_exact_matches(memory):
+    assert memory.lookup("  ROS 2 nodes   communicate\nover topics. ") == PAIRS[1][1]
+    assert memory.stats()["exact_hits"] == 1
+
+
+@pytest.mark.parametrize("text", [
+    "a gpu is required for this lab",
+    "A GPU is required, for this lab. 🚀",
+    "**A GPU** is required for this lab.",
+])
+def test_near_exact_ignores_case_punctuation_and_markup(memory, text):
+    assert memory.lookup(text) == PAIRS[0][1]
+    assert memory.stats()["near_hits"] == 1
+
+
+@pytest.mark.parametrize("text", [
+    "A GPU is required for this lab?",
+    "**A GPU is required for this lab?**",
+    "A GPU is required for this lab!",
+])
+def test_question_or_exclamation_does_not_match_a_statement(memory, text):
+    assert memory.lookup(text) is None
+    assert memory.stats()["misses"] == 1
+
+
+@pytest.mark.parametrize("text", [
+    # Negation: nearly the same characters, opposite meaning
+    "A GPU is not required for this lab.",
+    "A GPU is required for this lab only.",
+    "Module 2: The Robotic Nervous System",
+    "ROS 2 nodes never communicate over topics.",
+])
+def test_similar_sentences_are_misses(memory, text):
+    assert memory.lookup(text) is None
+    assert memory.stats()["misses"] == 1
+
+
+def test_empty_text_is_not_looked_up(memory):
+    assert memory.lookup("   ") is None
+    assert memory.stats()["misses"] == 0
+
+
+def test_disabled_memory_never_matches(memory, monkeypatch):
+    monkeypatch.setenv("TRANSLATION_MEMORY_ENABLED", "false")
+    assert TranslationMemory().lookup(PAIRS[0][0]) is None
+
+
+def test_first_translation_wins(memory):
+    memory.lookup(PAIRS[0][0])  # Builds the memory
+    memory.add(PAIRS[0][0], "another translation")
+    assert memory.lookup(PAIRS[0][0]) == PAIRS[0][1]
+
+
+def test_parallel_markdown_pairs_align_by_block():
+    english = "# Setup\n\nInstall the SDK.\n\n```bash\npip install sdk\n```\n\n- First step\n"
+    urdu = "# سیٹ اپ\n\nSDK انسٹال کریں۔\n\n```bash\npip install sdk\n```\n\n- پہلا قدم\n"
+    assert extract_parallel_pairs(english, urdu) == [
+        ("Setup", "سیٹ اپ"),
+        ("Install the SDK.", "SDK انسٹال کریں۔"),
+        ("First step", "پہلا قدم"),
+    ]
+
+
+def test_english_blocks_of_a_bilingual_page_skip_urdu_and_code():
+    page = """import {useTranslation} from 'react-i18next';
+
+export default function Page() {
+  if (isUrdu) {
+    return (<div><h1>نوڈز</h1><p>اردو متن</p></div>);
+  }
+  return (
+    <div>
+      <h1>Nodes</h1>
+      <p>Nodes exchange <strong>messages</strong> over topics.</p>
+      <pre>{`import rclpy`}</pre>
+      <ul><li>Publishers send messages</li></ul>
+    </div>
+  );
+}
+"""
+    assert english_blocks(page) == ["Nodes", "Nodes exchange messages over topics.", "Publishers send messages"]
@@ -0,0 +1,162 @@
+"""
+Signed Session Tokens
+Stateless HMAC-signed tokens carrying the user id and background levels,
+verified in memory without a database lookup
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from typing import Dict, Optional, Tuple
+
+from fastapi import Header, Response
+from pydantic import BaseModel
+
+
+class TokenError(Exception):
+    """Raised when a token is malformed, forged, signed with an unknown key, or expired"""
+
+
+class TokenClaims(BaseModel):
+    user_id: str
+    software_background: str
+    hardware_background: str
+    issued_at: int
+    expires_at: int
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class TokenSigner:
+    """
+    Issues and verifies tokens of the form <payload>.<signature>.
+    AUTH_TOKEN_KEYS holds comma-separated kid:secret pairs. The first key
+    signs new tokens and every listed key is accepted for verification,
+    so keys can be rotated by prepending a new one and dropping the old
+    one once its tokens have expired. Without keys the apps refuse to
+    start (see require_keys), unless AUTH_TOKEN_ALLOW_EPHEMERAL=true
+    allows a per-process key for local development.
+    """
+
+    def __init__(self):
+        self.ttl_seconds = int(os.getenv("AUTH_TOKEN_TTL_SECONDS", 7 * 24 * 3600))
+        self.allow_ephemeral = os.getenv("AUTH_TOKEN_ALLOW_EPHEMERAL", "false").lower() == "true"
+        self.keys, self.active_kid = self._load_keys(os.getenv("AUTH_TOKEN_KEYS", ""), self.allow_ephemeral)
+
+    @staticmethod
+    def _load_keys(config: str, allow_ephemeral: bool = False) -> Tuple[Dict[str, bytes], Optional[str]]:
+        keys: Dict[str, bytes] = {}
+        active_kid = None
+        for entry in config.split(","):
+            if not entry.strip():
+                continue
+            kid, sep, secret = entry.strip().partition(":")
+            if not sep or not kid or not secret:
+                raise ValueError("AUTH_TOKEN_KEYS entries must look like kid:secret")
+            keys[kid] = secret.encode("utf-8")
+            active_kid = active_kid or kid
+
+        if not keys and allow_ephemeral:
+            # Tokens signed with an ephemeral key do not survive a restart and
+            # are not accepted by other workers
+            print("⚠️  AUTH_TOKEN_KEYS not set; using an ephemeral signing key (development only)")
+            active_kid = "ephemeral"
+            keys[active_kid] = secrets.token_bytes(32)
+
+        return keys, active_kid
+
+    def require_keys(self):
+        """Called at startup: refuse to run without a shared signing key"""
+        if self.active_kid is None:
+            raise RuntimeError(
+                "AUTH_TOKEN_KEYS is not set. Set it to kid:secret pairs shared by all "
+                "workers, or AUTH_TOKEN_ALLOW_EPHEMERAL=true for local development."
+            )
+
+    def _sign(self, kid: str, payload: bytes) -> bytes:
+        return hmac.new(self.keys[kid], payload, hashlib.sha256).digest()
+
+    def issue(self, user_id: str, software_background: str, hardware_background: str) -> str:
+        """Create a signed token for a user"""
+        self.require_keys()
+        now = int(time.time())
+        payload = json.dumps({
+            "kid": self.active_kid,
+            "sub": user_id,
+            "sw": software_background,
+            "hw": hardware_background,
+            "iat": now,
+            "exp": now + self.ttl_seconds,
+        }, separators=(",", ":")).encode("utf-8")
+        return f"{_b64encode(payload)}.{_b64encode(self._sign(self.active_kid, payload))}"
+
+    def verify(self, token: str) -> TokenClaims:
+        """Check signature and expiry; raise TokenError if the token is not valid"""
+        try:
+            payload_part, signature_part = token.split(".")
+            payload = _b64decode(payload_part)
+            signature = _b64decode(signature_part)
+            data = json.loads(payload)
+            if not isinstance(data, dict):
+                raise ValueError("Token payload is not an object")
+            kid = data.get("kid")
+            claims = TokenClaims(
+                user_id=data["sub"],
+                software_background=data["sw"],
+                hardware_background=data["hw"],
+                issued_at=data["iat"],
+                expires_at=data["exp"],
+            )
+        except (KeyError, TypeError, ValueError):
+            # JSONDecodeError and pydantic's ValidationError are ValueErrors
+            raise TokenError("Malformed token")
+
+        if not isinstance(kid, str) or kid not in self.keys:
+            raise TokenError("Unknown signing key")
+        if not hmac.compare_digest(signature, self._sign(kid, payload)):
+            raise TokenError("Invalid signature")
+        if claims.expires_at < time.time():
+            raise TokenError("Token expired")
+
+        return claims
+
+
+# Global token signer instance
+token_signer = TokenSigner()
+
+# Set to "rejected" when a bearer token was sent but ignored, so clients
+# can drop a stale token instead of staying anonymous without knowing it
+TOKEN_STATUS_HEADER = "X-Token-Status"
+
+
+def get_token_claims(response: Response, authorization: Optional[str] = Header(None)) -> Optional[TokenClaims]:
+    """
+    FastAPI dependency for optional authentication.
+    Returns None when no Authorization header is sent, and also when the
+    token does not verify (legacy UUID tokens, expired tokens, retired
+    keys): the request then falls back to anonymous or user_id
+    personalization instead of failing, and the response carries
+    TOKEN_STATUS_HEADER: rejected.
+    """
+    if not authorization:
+        return None
+
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            return token_signer.verify(token.strip())
+        except TokenError:
+            pass
+
+    response.headers[TOKEN_STATUS_HEADER] = "rejected"
+    return None
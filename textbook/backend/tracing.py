@@ -0,0 +1,412 @@
+"""
+Tracing
+Request-scoped spans with W3C trace context, exported in batches to a
+JSON-lines file or an OTLP/HTTP collector
+"""
+
+import asyncio
+import json
+import logging
+import os
+import queue
+import random
+import re
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+EXPORTERS = ("none", "file", "otlp")
+TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+REQUEST_ID = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+# Stages that wait on another service; exported as client spans
+CLIENT_STAGES = {"embedding", "embedding_request", "search", "completion", "completion_stream", "translation_remote"}
+# OTLP SpanKind and StatusCode values
+KINDS = {"internal": 1, "server": 2, "client": 3}
+STATUS_CODES = {"unset": 0, "ok": 1, "error": 2}
+# Probes and scrapes are never traced
+EXCLUDED_PREFIXES = ("/metrics", "/health", "/ready")
+
+_current: ContextVar[Optional["Span"]] = ContextVar("trace_span", default=None)
+_STOP = object()
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Span:
+    """One timed operation within a request's trace"""
+
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "request_id", "start_ns", "end_ns",
+                 "attributes", "events", "status", "status_message", "thread")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], request_id: str,
+                 kind: str = "internal", start_ns: Optional[int] = None):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.request_id = request_id
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict = {}
+        self.events: List[Dict] = []
+        self.status = "unset"
+        self.status_message: Optional[str] = None
+        self.thread = threading.current_thread().name
+
+    def child(self, name: str, kind: str = "internal", start_ns: Optional[int] = None) -> "Span":
+        return Span(name, self.trace_id, self.span_id, self.request_id, kind, start_ns)
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes):
+        self.events.append({"name": name, "time_ns": time.time_ns(), "attributes": attributes})
+
+    def record_error(self, error: BaseException):
+        self.status = "error"
+        self.status_message = str(error)[:500]
+        self.add_event("exception", **{
+            "exception.type": type(error).__name__,
+            "exception.message": self.status_message,
+        })
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "request_id": self.request_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": datetime.utcfromtimestamp(self.start_ns / 1e9).isoformat() + "Z",
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "status_message": self.status_message,
+            "thread": self.thread,
+            "attributes": self.attributes,
+            "events": [
+                {"name": e["name"], "offset_ms": round((e["time_ns"] - self.start_ns) / 1e6, 3), **e["attributes"]}
+                for e in self.events
+            ],
+        }
+
+
+def _otlp_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict) -> List[Dict]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+def _otlp_span(span: Span) -> Dict:
+    encoded = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": KINDS[span.kind],
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": _otlp_attributes({**span.attributes, "request.id": span.request_id, "thread.name": span.thread}),
+        "events": [
+            {"name": e["name"], "timeUnixNano": str(e["time_ns"]), "attributes": _otlp_attributes(e["attributes"])}
+            for e in span.events
+        ],
+        "status": {"code": STATUS_CODES[span.status]},
+    }
+    if span.parent_id:
+        encoded["parentSpanId"] = span.parent_id
+    if span.status_message:
+        encoded["status"]["message"] = span.status_message
+    return encoded
+
+
+class Tracer:
+    """
+    Creates spans for sampled requests and exports finished ones from a
+    background thread, in batches of TRACING_BATCH_SIZE or every
+    TRACING_FLUSH_SECONDS. Spans are dropped, never blocked on, when the
+    queue is full. Pipeline stages (metrics.stage_timer) become child spans.
+    """
+
+    def __init__(self):
+        self.exporter = os.getenv("TRACING_EXPORTER", "none").lower()
+        if self.exporter not in EXPORTERS:
+            print(f"⚠️  Unknown TRACING_EXPORTER {self.exporter!r}; tracing disabled")
+            self.exporter = "none"
+        self.enabled = self.exporter != "none"
+        self.file_path = os.getenv("TRACING_FILE_PATH", "traces.jsonl")
+        self.otlp_endpoint = os.getenv("TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+        # "key=value,key=value", e.g. an API key header for a hosted collector
+        self.otlp_headers = dict(
+            pair.split("=", 1) for pair in os.getenv("TRACING_OTLP_HEADERS", "").split(",") if "=" in pair
+        )
+        self.service_name = os.getenv("TRACING_SERVICE_NAME", "textbook-backend")
+        self.sample_rate = float(os.getenv("TRACING_SAMPLE_RATE", 1.0))
+        self.batch_size = int(os.getenv("TRACING_BATCH_SIZE", 512))
+        self.flush_interval_seconds = float(os.getenv("TRACING_FLUSH_SECONDS", 2))
+        self._queue: queue.Queue = queue.Queue(maxsize=int(os.getenv("TRACING_QUEUE_SIZE", 10000)))
+
+        # Identifies the worker process in every exported span
+        self.resource = {
+            "service.name": self.service_name,
+            "host.name": socket.gethostname(),
+            "process.pid": os.getpid(),
+        }
+        self._thread: Optional[threading.Thread] = None
+        self._http = None
+        self._stats = {"spans": 0, "exported": 0, "dropped": 0, "batches": 0, "export_errors": 0, "last_export_error": None}
+        # Most recent error per component and stage; kept even when tracing
+        # is off, so the latest failures are visible in /stats
+        self._errors: Dict[str, Dict] = {}
+
+        if self.enabled:
+            metrics.stage_hooks.append(self._stage)
+
+    def start_request(self, name: str, traceparent: Optional[str], request_id: Optional[str]) -> Optional[Span]:
+        """Root span for an incoming request, or None when it is not sampled"""
+        trace_id, parent_id, sampled = None, None, None
+        match = TRACEPARENT.match(traceparent or "")
+        if match and match.group(1) != "0" * 32:
+            trace_id, parent_id = match.group(1), match.group(2)
+            sampled = bool(int(match.group(3), 16) & 1)
+        if sampled is None:
+            sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+        if not sampled:
+            return None
+
+        trace_id = trace_id or _new_id(128)
+        if not request_id or not REQUEST_ID.match(request_id):
+            request_id = trace_id
+        return Span(name, trace_id, parent_id, request_id, kind="server")
+
+    def finish(self, span: Span, end_ns: Optional[int] = None):
+        """End a span and queue it for export"""
+        span.end_ns = end_ns or time.time_ns()
+        self._stats["spans"] += 1
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self._stats["dropped"] += 1
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", **attributes):
+        """Child span of the current one; does nothing outside a traced request"""
+        parent = _current.get()
+        if parent is None:
+            yield None
+            return
+        span = parent.child(name, kind)
+        span.attributes.update(attributes)
+        # Restore rather than reset, so a span closed from another context
+        # (a generator finalized elsewhere) cannot raise
+        _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current.set(parent)
+            self.finish(span)
+
+    def record_span(self, name: str, start_ns: int, end_ns: int, error: Optional[BaseException] = None, **attributes):
+        """
+        Add an already-timed child span to the current one without making it
+        current, for work that spans generator yields
+        """
+        parent = _current.get()
+        if parent is None:
+            return
+        span = parent.child(name, "client" if name in CLIENT_STAGES else "internal", start_ns)
+        span.attributes.update(attributes)
+        if error is not None:
+            span.record_error(error)
+        self.finish(span, end_ns)
+
+    def _stage(self, stage: str):
+        return self.span(stage, "client" if stage in CLIENT_STAGES else "internal")
+
+    def record_error(self, component: str, stage: str, error: BaseException):
+        """Log the error, keep it for /stats and attach it to the current span"""
+        span = _current.get()
+        logger.warning(
+            "%s.%s failed (request_id=%s)", component, stage, span.request_id if span else None,
+            exc_info=error,
+        )
+        self._errors[f"{component}.{stage}"] = {
+            "error": f"{type(error).__name__}: {str(error)[:300]}",
+            "at": datetime.utcnow().isoformat(),
+            "request_id": span.request_id if span else None,
+        }
+        if span is not None:
+            span.add_event("exception", **{
+                "component": component,
+                "stage": stage,
+                "exception.type": type(error).__name__,
+                "exception.message": str(error)[:500],
+            })
+
+    def _write_file(self, spans: List[Span]):
+        directory = os.path.dirname(self.file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        resource = {"service": self.service_name, "host": self.resource["host.name"], "pid": self.resource["process.pid"]}
+        with open(self.file_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps({**span.to_dict(), **resource}, default=str) + "\n" for span in spans))
+
+    def _post_otlp(self, spans: List[Span]):
+        import httpx
+
+        if self._http is None:
+            self._http = httpx.Client(timeout=10.0, headers=self.otlp_headers)
+        response = self._http.post(self.otlp_endpoint, json={
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes(self.resource)},
+                "scopeSpans": [{"scope": {"name": "textbook.tracing"}, "spans": [_otlp_span(s) for s in spans]}],
+            }]
+        })
+        response.raise_for_status()
+
+    def export(self, spans: List[Span]):
+        """Write one batch; a failed batch is counted and dropped"""
+        try:
+            if self.exporter == "file":
+                self._write_file(spans)
+            else:
+                self._post_otlp(spans)
+            self._stats["batches"] += 1
+            self._stats["exported"] += len(spans)
+        except Exception as e:
+            self._stats["export_errors"] += 1
+            self._stats["dropped"] += len(spans)
+            self._stats["last_export_error"] = str(e)[:300]
+
+    def _export_forever(self):
+        stopping = False
+        while not stopping:
+            batch: List[Span] = []
+            deadline = time.monotonic() + self.flush_interval_seconds
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            if batch:
+                self.export(batch)
+
+    def start(self):
+        """Start the background exporter thread"""
+        if self.enabled and self._thread is None:
+            self._thread = threading.Thread(target=self._export_forever, name="trace-exporter", daemon=True)
+            self._thread.start()
+
+    async def stop(self):
+        """Export whatever is still queued, then stop the exporter thread"""
+        if self._thread is None:
+            return
+        await asyncio.to_thread(self._queue.put, _STOP)
+        await asyncio.to_thread(self._thread.join, 30)
+        self._thread = None
+        if self._http is not None:
+            self._http.close()
+            self._http = None
+
+    def stats(self) -> Dict:
+        return {
+            **self._stats,
+            "enabled": self.enabled,
+            "exporter": self.exporter,
+            "sample_rate": self.sample_rate,
+            "queued": self._queue.qsize(),
+            "last_errors": dict(self._errors),
+        }
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that opens a root span per sampled request, continuing
+    an incoming `traceparent`. Responses carry X-Request-ID (the caller's,
+    or the trace id) and a traceparent pointing at the root span.
+    Only added to the app when tracing is enabled.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(EXCLUDED_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", []))
+        span = tracer.start_request(
+            f"{scope['method']} {scope['path']}",
+            headers.get(b"traceparent", b"").decode("latin-1"),
+            headers.get(b"x-request-id", b"").decode("latin-1"),
+        )
+        if span is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_ids(message):
+            if message["type"] == "http.response.start":
+                span.set_attribute("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    span.status = "error"
+                message = {**message, "headers": list(message.get("headers", [])) + [
+                    (b"x-request-id", span.request_id.encode()),
+                    (b"traceparent", f"00-{span.trace_id}-{span.span_id}-01".encode()),
+                ]}
+            await send(message)
+
+        span.attributes.update({"http.method": scope["method"], "http.target": scope["path"]})
+        previous = _current.get()
+        _current.set(span)
+        try:
+            await self.app(scope, receive, send_with_ids)
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current.set(previous)
+            # Name by route template so traces group like /metrics does
+            route = getattr(scope.get("route"), "path", None)
+            if route:
+                span.name = f"{scope['method']} {route}"
+                span.set_attribute("http.route", route)
+            tracer.finish(span)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+# Global tracer instance
+tracer = Tracer()
+
+
+def record_error(component: str, stage: str, error: BaseException):
+    """Log a handled error and record it on the current span"""
+    tracer.record_error(component, stage, error)
@@ -1,18 +1,334 @@
 """
-Translation Service using deep-translator (Python 3.13 compatible)
+Translation Service using pluggable backends (Google via deep-translator by default)
 Translates textbook content to Urdu
 """
 
-from deep_translator import GoogleTranslator
-from typing import Optional
+import asyncio
+import contextvars
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from metrics import ERRORS, FALLBACKS, stage_timer
+from tracing import record_error
+from translation_backends import create_backend
+from translation_cache import TranslationCache, cache_key
+from translation_memory import TranslationMemory
+
+# Sentence ends and line breaks are the preferred places to split long texts
+SEGMENT_BOUNDARY = re.compile(r'(?<=[.!?])\s+|\n+')
+
+# Spans that must reach the reader unchanged: code, URLs, HTML, Markdown
+# syntax, the frontend's batch separator, and line breaks (so prose
+# segments never span lines)
+PROTECTED_SPAN = re.compile(
+    r'(?P<fence>^[ \t]*(```|~~~)[^\n]*(?:\n.*?^[ \t]*\2[ \t]*$|.*\Z))'
+    r'|(?P<code>`[^`\n]+`)'
+    r'|(?P<url>https?://[^\s<>()\[\]]*[^\s<>()\[\].,;:!?\'"])'
+    r'|(?P<link>!?\[|\]\([^)\s]*\))'
+    r'|(?P<tag></?[A-Za-z][^<>\n]*>)'
+    r'|(?P<rule>^[ \t]*(?:-{3,}|\*{3,}|_{3,})[ \t]*$)'
+    r'|(?P<marker>^[ \t]*(?:#{1,6}[ \t]+|[-*+][ \t]+|\d+[.)][ \t]+|>[ \t]*)+)'
+    r'|(?P<separator>\|\|\|SEPARATOR\|\|\|)'
+    r'|(?P<pipe>\|)'
+    r'|(?P<newline>\n+)',
+    re.MULTILINE | re.DOTALL
+)
+LINE_MARKER = re.compile(r'[ \t]*(?:#{1,6}[ \t]+|[-*+][ \t]+|\d+[.)][ \t]+|>[ \t]*)*')
+FENCE_LINE = re.compile(r'[ \t]*(```|~~~)')
+
+# Where streamed text can be cut: after a sentence end or at a line break
+STREAM_BOUNDARY = re.compile(r'(?<=[.!?\u06d4])[ \t]+|\n')
+FENCE_OPEN = re.compile(r'^[ \t]*(```|~~~)', re.MULTILINE)
+
+
+def _split_long_piece(piece: str, max_chars: int) -> List[Tuple[str, str]]:
+    """Split a single oversized sentence at spaces (or hard, as a last resort)"""
+    parts = []
+    while len(piece) > max_chars:
+        cut = piece.rfind(' ', 0, max_chars + 1)
+        if cut <= 0:
+            parts.append((piece[:max_chars], ''))
+            piece = piece[max_chars:]
+        else:
+            parts.append((piece[:cut], ' '))
+            piece = piece[cut + 1:]
+    parts.append((piece, ''))
+    return parts
+
+
+def pack_segments(text: str, max_chars: int) -> List[Tuple[str, str]]:
+    """
+    Greedily pack sentences into segments of at most max_chars.
+    Returns (segment, separator) pairs such that joining segment + separator
+    for every pair reproduces the original text exactly.
+    """
+    pieces: List[Tuple[str, str]] = []
+    position = 0
+    for match in SEGMENT_BOUNDARY.finditer(text):
+        pieces.append((text[position:match.start()], match.group()))
+        position = match.end()
+    pieces.append((text[position:], ''))
+
+    units: List[Tuple[str, str]] = []
+    for piece, separator in pieces:
+        if len(piece) > max_chars:
+            parts = _split_long_piece(piece, max_chars)
+            parts[-1] = (parts[-1][0], separator)
+            units.extend(parts)
+        else:
+            units.append((piece, separator))
+
+    segments: List[Tuple[str, str]] = []
+    current, current_sep = units[0]
+    for unit, separator in units[1:]:
+        if len(current) + len(current_sep) + len(unit) <= max_chars:
+            current = current + current_sep + unit
+        else:
+            segments.append((current, current_sep))
+            current = unit
+        current_sep = separator
+    segments.append((current, current_sep))
+    return segments
+
+
+def split_markup(text: str) -> List[Tuple[str, bool]]:
+    """
+    Split text into (span, translatable) pairs that join back to the
+    original exactly. Only prose containing letters is translatable.
+    """
+    parts: List[Tuple[str, bool]] = []
+    position = 0
+    for match in PROTECTED_SPAN.finditer(text):
+        if match.start() > position:
+            parts.append((text[position:match.start()], True))
+        parts.append((match.group(), False))
+        position = match.end()
+    if position < len(text):
+        parts.append((text[position:], True))
+    return [(span, translatable and any(ch.isalpha() for ch in span)) for span, translatable in parts]
+
+
+class SentenceAssembler:
+    """
+    Collects streamed text and releases it in complete sentences or lines.
+    Short fragments (list numbers, abbreviations) are held back until
+    min_chars have accumulated, and a code block is only released once
+    its closing fence has arrived so it is never split.
+    """
+
+    def __init__(self, min_chars: int = 24):
+        self.min_chars = min_chars
+        self._buffer = ''
+
+    def _next_cut(self) -> Optional[int]:
+        for match in STREAM_BOUNDARY.finditer(self._buffer):
+            cut = match.end()
+            if match.group() != '\n' and cut < self.min_chars:
+                continue
+            if len(FENCE_OPEN.findall(self._buffer, 0, cut)) % 2:
+                continue  # Inside a code block
+            return cut
+        return None
+
+    def feed(self, chunk: str) -> List[str]:
+        """Add streamed text; return the units that are now complete"""
+        self._buffer += chunk
+        units = []
+        cut = self._next_cut()
+        while cut is not None:
+            units.append(self._buffer[:cut])
+            self._buffer = self._buffer[cut:]
+            cut = self._next_cut()
+        return units
+
+    def flush(self) -> str:
+        """Return whatever is left once the stream has ended"""
+        rest, self._buffer = self._buffer, ''
+        return rest
+
 
 class TranslationService:
     """Handles translation of content to Urdu"""
     
     def __init__(self):
-        self.translator = GoogleTranslator(source='en', target='ur')
-        self.cache = {}  # Simple in-memory cache
+        self.target = 'ur'
+        self.backend = create_backend(self.target)  # TRANSLATION_BACKEND=google|local
+        self.cache = TranslationCache()  # Bounded, shared across workers
+        self.memory = TranslationMemory()  # Published textbook translations
+        self.max_chars = int(os.getenv("TRANSLATION_MAX_CHARS", 4500))  # Google Translate limit is 5000
+        self.max_concurrency = int(os.getenv("TRANSLATION_CONCURRENCY", 4))
+        # Backend calls get their own threads so they neither queue behind
+        # nor starve the default executor used for cache I/O
+        self.max_workers = int(os.getenv("TRANSLATION_WORKERS", 16))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stats = {"characters_requested": 0, "characters_sent": 0, "remote_requests": 0, "batch_retries": 0}
     
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="translation")
+        return self._executor
+
+    async def _translate_segments(self, segments: List[str]) -> List[Optional[str]]:
+        """
+        Translate segments concurrently on worker threads, preserving order.
+        A segment that fails comes back as None without affecting the others.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def translate_one(segment: str) -> Optional[str]:
+            core = segment.strip()
+            if not core:
+                return segment
+            # The translator trims whitespace, so restore it around the result
+            leading = segment[:len(segment) - len(segment.lstrip())]
+            trailing = segment[len(segment.rstrip()):]
+            async with semaphore:
+                try:
+                    self._stats["remote_requests"] += 1
+                    self._stats["characters_sent"] += len(core)
+                    # Copy the context so request-scoped state (profiles,
+                    # usage attribution) follows the call into the worker
+                    translated = await asyncio.get_running_loop().run_in_executor(
+                        self.executor, contextvars.copy_context().run, self._translate_backend, core
+                    )
+                    return leading + (translated or core) + trailing
+                except Exception as e:
+                    record_error("translation", "remote", e)
+                    ERRORS.inc(component="translation", stage="remote")
+                    return None
+
+        return await asyncio.gather(*[translate_one(segment) for segment in segments])
+
+    def _translate_backend(self, text: str) -> str:
+        with stage_timer("translation_remote"):
+            return self.backend.translate(text)
+
+    def _match_memory(self, text: str) -> List[Tuple[str, Optional[str]]]:
+        """
+        Resolve lines from the translation memory.
+        Returns (chunk, translation) pairs in order; consecutive unmatched
+        lines are merged into one chunk with translation None. Code blocks
+        are never looked up, and Markdown line markers are kept as they are.
+        """
+        chunks: List[Tuple[str, Optional[str]]] = []
+        in_fence = False
+        for line in text.splitlines(keepends=True):
+            match = None
+            if FENCE_LINE.match(line):
+                in_fence = not in_fence
+            elif not in_fence and line.strip():
+                prefix = LINE_MARKER.match(line).group()
+                body = line[len(prefix):]
+                urdu = self.memory.lookup(body.strip())
+                if urdu is not None:
+                    match = prefix + urdu + body[len(body.rstrip()):]
+
+            if match is not None:
+                chunks.append((line, match))
+            elif chunks and chunks[-1][1] is None:
+                chunks[-1] = (chunks[-1][0] + line, None)
+            else:
+                chunks.append((line, None))
+        return chunks or [(text, None)]
+
+    async def _translate_units(self, units: List[str]) -> List[Optional[str]]:
+        """
+        Translate single-line units, several per remote request.
+        Units are joined with newlines up to max_chars; a batch whose
+        line count does not survive translation is retried unit by unit.
+        """
+        batches: List[List[int]] = []
+        size = 0
+        for i, unit in enumerate(units):
+            length = len(unit.strip()) + 1
+            if not batches or size + length > self.max_chars:
+                batches.append([])
+                size = 0
+            batches[-1].append(i)
+            size += length
+
+        translated = await self._translate_segments(
+            ['\n'.join(units[i].strip() for i in batch) for batch in batches]
+        )
+
+        results: List[Optional[str]] = [None] * len(units)
+        retry: List[int] = []
+        for batch, result in zip(batches, translated):
+            if result is None:
+                continue
+            lines = [result.strip()] if len(batch) == 1 else result.strip().split('\n')
+            if len(lines) != len(batch):
+                retry.extend(batch)
+                continue
+            for i, line in zip(batch, lines):
+                unit = units[i]
+                results[i] = unit[:len(unit) - len(unit.lstrip())] + line.strip() + unit[len(unit.rstrip()):]
+
+        if retry:
+            self._stats["batch_retries"] += 1
+            for i, result in zip(retry, await self._translate_segments([units[i] for i in retry])):
+                results[i] = result
+        return results
+
+    async def _translate_remote(self, text: str, chunks: List[str], use_cache: bool) -> Tuple[List[str], bool]:
+        """
+        Translate the prose in chunks with the remote translator.
+        Returns the translated chunks and whether every unit succeeded.
+        """
+        # Code, URLs and markup stay in place; prose is cut into units
+        layouts = []
+        units: List[str] = []
+        for chunk in chunks:
+            layout = []
+            for span, translatable in split_markup(chunk):
+                if not translatable:
+                    layout.append((span, None))
+                    continue
+                packed = pack_segments(span, self.max_chars)
+                layout.append((span, [(len(units) + i, separator) for i, (_, separator) in enumerate(packed)]))
+                units.extend(segment for segment, _ in packed)
+            layouts.append(layout)
+        self._stats["characters_requested"] += sum(len(chunk) for chunk in chunks)
+
+        results: List[Optional[str]] = [None] * len(units)
+
+        # Units seen in earlier texts are served from the cache
+        unit_keys = [cache_key(unit, self.target, self.backend.name) for unit in units]
+        use_unit_cache = use_cache and units != [text]
+        if use_unit_cache and units:
+            results = await asyncio.to_thread(lambda: [self.cache.get(key) for key in unit_keys])
+
+        pending = [i for i, result in enumerate(results) if result is None]
+        translated = await self._translate_units([units[i] for i in pending]) if pending else []
+        for i, result in zip(pending, translated):
+            results[i] = result
+
+        if use_unit_cache and pending:
+            def store():
+                for i, result in zip(pending, translated):
+                    if result is not None:
+                        self.cache.set(unit_keys[i], result)
+            await asyncio.to_thread(store)
+
+        # Failed units fall back to the original English individually
+        failed = results.count(None)
+        if failed:
+            FALLBACKS.inc(failed, kind="untranslated_segment")
+        output = []
+        for layout in layouts:
+            parts = []
+            for span, indices in layout:
+                if indices is None:
+                    parts.append(span)
+                    continue
+                for i, separator in indices:
+                    parts.append((results[i] if results[i] is not None else units[i]) + separator)
+            output.append(''.join(parts))
+        return output, None not in results
+
     async def translate_to_urdu(self, text: str, use_cache: bool = True) -> str:
         """
         Translate English text to Urdu
@@ -24,39 +340,78 @@ class TranslationService:
         Returns:
             Translated Urdu text
         """
-        # Check cache first
-        if use_cache and text in self.cache:
-            return self.cache[text]
-        
+        # Check the whole text first; memory hits never leave the event loop
+        text_key = cache_key(text, self.target, self.backend.name)
+        if use_cache:
+            cached = self.cache.get_memory(text_key)
+            if cached is None:
+                cached = await asyncio.to_thread(self.cache.get, text_key)
+            if cached is not None:
+                return cached
+
+        # Lines from the published textbook are translated locally
+        chunks = await asyncio.to_thread(self._match_memory, text)
+        unmatched = [chunk for chunk, match in chunks if match is None]
+        translated, complete = await self._translate_remote(text, unmatched, use_cache) if unmatched else ([], True)
+
+        remote = iter(translated)
+        urdu_text = ''.join(match if match is not None else next(remote) for _, match in chunks)
+
+        # Cache the result unless part of it is still untranslated
+        if use_cache and complete:
+            await asyncio.to_thread(self.cache.set, text_key, urdu_text)
+
+        return urdu_text
+
+    async def translate_stream(self, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+        """
+        Translate text that arrives in pieces, such as an LLM stream.
+        Each completed sentence starts translating as soon as it arrives,
+        while later ones are still being generated; results are yielded
+        in order. Errors from the source stream are re-raised.
+        """
+        assembler = SentenceAssembler()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def translate_unit(unit: str) -> str:
+            async with semaphore:
+                return await self.translate_to_urdu(unit)
+
+        async def produce():
+            try:
+                async for chunk in chunks:
+                    for unit in assembler.feed(chunk):
+                        queue.put_nowait(asyncio.ensure_future(translate_unit(unit)))
+                rest = assembler.flush()
+                if rest:
+                    queue.put_nowait(asyncio.ensure_future(translate_unit(rest)))
+            finally:
+                queue.put_nowait(None)
+
+        producer = asyncio.ensure_future(produce())
         try:
-            # Split large text into chunks (Google Translate has 5000 char limit)
-            if len(text) > 4500:
-                # Split by sentences
-                sentences = text.split('. ')
-                translated_sentences = []
-                
-                for sentence in sentences:
-                    if sentence.strip():
-                        translated = self.translator.translate(sentence)
-                        translated_sentences.append(translated)
-                
-                urdu_text = '. '.join(translated_sentences)
-            else:
-                urdu_text = self.translator.translate(text)
-            
-            # Cache the result
-            if use_cache:
-                self.cache[text] = urdu_text
-            
-            return urdu_text
-        
-        except Exception as e:
-            print(f"Translation error: {e}")
-            return text  # Return original text if translation fails
+            while True:
+                task = await queue.get()
+                if task is None:
+                    break
+                yield await task
+            await producer
+        finally:
+            producer.cancel()
+            while not queue.empty():
+                task = queue.get_nowait()
+                if task is not None:
+                    task.cancel()
+
+    def stats(self) -> Dict:
+        """Character volume sent to the remote translator versus requested, and backend metrics"""
+        stats = dict(self._stats)
+        requested = stats["characters_requested"]
+        stats["sent_ratio"] = round(stats["characters_sent"] / requested, 4) if requested else 0.0
+        stats["backend"] = self.backend.stats()
+        return stats
     
     def clear_cache(self):
         """Clear translation cache"""
         self.cache.clear()
-
-# Global translator instance
-translator_service = TranslationService()
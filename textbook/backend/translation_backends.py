@@ -0,0 +1,162 @@
+"""
+Translation Backends
+Remote and local machine-translation providers behind one interface,
+with per-backend throughput and latency metrics
+"""
+
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Dict, Type
+
+
+class TranslationError(Exception):
+    """Raised by a backend when a translation request fails"""
+
+
+class TranslationBackend(ABC):
+    """
+    Base class for translation providers.
+    Subclasses implement _translate(); translate() wraps it with metrics.
+    Calls are blocking and may come from several threads at once.
+    """
+
+    name = "base"
+
+    def __init__(self, source: str = "en", target: str = "ur"):
+        self.source = source
+        self.target = target
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)  # Recent successful calls, for percentiles
+        self._first_call = None
+        self._in_flight = 0
+        self._stats = {
+            "requests": 0,
+            "errors": 0,
+            "characters": 0,
+            "seconds_total": 0.0,
+            "max_in_flight": 0,
+        }
+
+    @abstractmethod
+    def _translate(self, text: str) -> str:
+        """Translate one text (blocking); raise on failure"""
+
+    def translate(self, text: str) -> str:
+        """Translate one text, recording latency, volume and concurrency"""
+        with self._lock:
+            self._first_call = self._first_call or time.monotonic()
+            self._in_flight += 1
+            self._stats["max_in_flight"] = max(self._stats["max_in_flight"], self._in_flight)
+
+        started = time.perf_counter()
+        failed = False
+        try:
+            return self._translate(text)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._in_flight -= 1
+                self._stats["requests"] += 1
+                self._stats["characters"] += len(text)
+                self._stats["seconds_total"] += elapsed
+                if failed:
+                    self._stats["errors"] += 1
+                else:
+                    self._latencies.append(elapsed)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            latencies = sorted(self._latencies)
+            in_flight = self._in_flight
+            window = time.monotonic() - self._first_call if self._first_call else 0.0
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+        requests = stats["requests"]
+        return {
+            "backend": self.name,
+            **stats,
+            "seconds_total": round(stats["seconds_total"], 3),
+            "in_flight": in_flight,
+            "error_rate": round(stats["errors"] / requests, 4) if requests else 0.0,
+            "latency_ms_p50": percentile(0.50),
+            "latency_ms_p95": percentile(0.95),
+            "latency_ms_p99": percentile(0.99),
+            "requests_per_second": round(requests / window, 2) if window else 0.0,
+            "characters_per_second": round(stats["characters"] / window, 1) if window else 0.0,
+        }
+
+
+class GoogleBackend(TranslationBackend):
+    """Google Translate through deep_translator (network required)"""
+
+    name = "google"
+
+    def __init__(self, source: str = "en", target: str = "ur"):
+        super().__init__(source, target)
+        self._translator = None  # Created on first translation
+
+    def _translate(self, text: str) -> str:
+        if self._translator is None:
+            # Imported lazily to keep deep_translator off the startup path
+            from deep_translator import GoogleTranslator
+            self._translator = GoogleTranslator(source=self.source, target=self.target)
+        return self._translator.translate(text) or text
+
+
+class LocalBackend(TranslationBackend):
+    """
+    Deterministic offline stand-in for benchmarks, load tests and CI.
+    Tags every line with the target language (so line structure survives
+    like it does with a real translator) after sleeping for a configurable
+    base plus per-character latency. A seeded fraction of calls fails.
+    """
+
+    name = "local"
+
+    def __init__(self, source: str = "en", target: str = "ur"):
+        super().__init__(source, target)
+        self.latency_ms = float(os.getenv("TRANSLATION_LOCAL_LATENCY_MS", 0))
+        self.latency_per_char_ms = float(os.getenv("TRANSLATION_LOCAL_LATENCY_PER_CHAR_MS", 0))
+        self.jitter_ms = float(os.getenv("TRANSLATION_LOCAL_JITTER_MS", 0))
+        self.error_rate = float(os.getenv("TRANSLATION_LOCAL_ERROR_RATE", 0))
+        self._random = random.Random(int(os.getenv("TRANSLATION_LOCAL_SEED", 0)))
+        self._random_lock = threading.Lock()
+
+    def _translate(self, text: str) -> str:
+        with self._random_lock:
+            jitter = self._random.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0
+            fail = self.error_rate > 0 and self._random.random() < self.error_rate
+
+        delay_ms = self.latency_ms + self.latency_per_char_ms * len(text) + jitter
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000)
+        if fail:
+            raise TranslationError("Simulated translation failure")
+
+        return "\n".join(f"[{self.target}] {line}" if line.strip() else line for line in text.split("\n"))
+
+
+BACKENDS: Dict[str, Type[TranslationBackend]] = {
+    GoogleBackend.name: GoogleBackend,
+    LocalBackend.name: LocalBackend,
+}
+
+
+def create_backend(target: str = "ur") -> TranslationBackend:
+    """Build the backend named by TRANSLATION_BACKEND (default: google)"""
+    name = os.getenv("TRANSLATION_BACKEND", "google").lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown TRANSLATION_BACKEND '{name}' (expected one of: {', '.join(BACKENDS)})")
+    return BACKENDS[name](source="en", target=target)
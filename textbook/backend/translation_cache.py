@@ -0,0 +1,234 @@
+"""
+Translation Cache
+Size-bounded in-memory LRU backed by a SQLite file shared by all workers
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "translations.sqlite3")
+
+
+def cache_key(text: str, target: str, backend: str) -> str:
+    """
+    Stable key for a source text, target language and backend, so switching
+    TRANSLATION_BACKEND never serves another provider's output
+    """
+    return hashlib.sha256(f"{backend}\0{target}\0{text}".encode("utf-8")).hexdigest()
+
+
+class TranslationCache:
+    """
+    Two-level translation cache.
+    The memory level is an LRU bounded by entry count and bytes. The
+    persistent level is a SQLite database in WAL mode, so every uvicorn
+    worker reads what the others wrote and translations survive deploys.
+    It is pruned least recently used first; hits on either level update
+    last_used in batches, written from the blocking paths.
+    Set TRANSLATION_CACHE_PATH to an empty string to disable persistence.
+    """
+
+    def __init__(self):
+        self.max_entries = int(os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", 5000))
+        self.max_bytes = int(os.getenv("TRANSLATION_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+        self.max_disk_entries = int(os.getenv("TRANSLATION_CACHE_MAX_DISK_ENTRIES", 200000))
+        self.path = os.getenv("TRANSLATION_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.touch_batch_size = int(os.getenv("TRANSLATION_CACHE_TOUCH_BATCH_SIZE", 256))
+        self.touch_interval_seconds = float(os.getenv("TRANSLATION_CACHE_TOUCH_INTERVAL_SECONDS", 30))
+
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes_since_prune = 0
+        # Keys hit since the last flush -> time of the latest hit
+        self._touched: Dict[str, float] = {}
+        self._touched_flushed_at = time.monotonic()
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "disk_errors": 0,
+        }
+
+        if self.path:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                connection = self._connection()
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS translations ("
+                    "key TEXT PRIMARY KEY, translation TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL)"
+                )
+                columns = {row[1] for row in connection.execute("PRAGMA table_info(translations)")}
+                if "last_used" not in columns:
+                    # Stores written before hits were tracked
+                    connection.execute("ALTER TABLE translations ADD COLUMN last_used REAL")
+                    connection.execute("UPDATE translations SET last_used = created_at")
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS ix_translations_last_used ON translations (last_used)"
+                )
+            except sqlite3.Error as e:
+                print(f"Translation cache: persistence disabled: {e}")
+                self.path = ""
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread; SQLite connections are not shareable"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _entry_bytes(key: str, value: str) -> int:
+        return len(key) + len(value.encode("utf-8"))
+
+    def _remember(self, key: str, value: str):
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= self._entry_bytes(key, previous)
+            self._memory[key] = value
+            self._memory_bytes += self._entry_bytes(key, value)
+
+            while self._memory and (len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes):
+                evicted_key, evicted_value = self._memory.popitem(last=False)
+                self._memory_bytes -= self._entry_bytes(evicted_key, evicted_value)
+                self._stats["evictions"] += 1
+
+    def get_memory(self, key: str) -> Optional[str]:
+        """Memory-only lookup; cheap enough to call on the event loop"""
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                if self.path:
+                    self._touched[key] = time.time()
+            return value
+
+    def get(self, key: str) -> Optional[str]:
+        """Look up memory, then the shared store (blocking disk I/O)"""
+        value = self.get_memory(key)
+        if value is None and self.path:
+            try:
+                row = self._connection().execute(
+                    "SELECT translation FROM translations WHERE key = ?", (key,)
+                ).fetchone()
+            except sqlite3.Error:
+                self._count("disk_errors")
+                row = None
+            if row is not None:
+                value = row[0]
+                self._remember(key, value)
+                with self._lock:
+                    self._stats["disk_hits"] += 1
+                    self._touched[key] = time.time()
+
+        if value is None:
+            self._count("misses")
+        if self.path:
+            self._flush_touched()
+        return value
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _flush_touched(self, force: bool = False):
+        """Write pending last_used updates once a batch is full or the interval has passed"""
+        with self._lock:
+            due = bool(self._touched) and (
+                force
+                or len(self._touched) >= self.touch_batch_size
+                or time.monotonic() - self._touched_flushed_at >= self.touch_interval_seconds
+            )
+            if not due:
+                return
+            touched, self._touched = self._touched, {}
+            self._touched_flushed_at = time.monotonic()
+
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute("BEGIN")
+                connection.executemany(
+                    "UPDATE translations SET last_used = MAX(last_used, ?) WHERE key = ?",
+                    [(used_at, key) for key, used_at in touched.items()]
+                )
+        except sqlite3.Error:
+            self._count("disk_errors")
+
+    def set(self, key: str, value: str):
+        """Store a translation in memory and in the shared store (blocking disk I/O)"""
+        self._remember(key, value)
+        if not self.path:
+            return
+
+        try:
+            connection = self._connection()
+            now = time.time()
+            connection.execute(
+                "INSERT OR REPLACE INTO translations (key, translation, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            with self._lock:
+                self._writes_since_prune += 1
+                prune = self._writes_since_prune >= 1000
+                if prune:
+                    self._writes_since_prune = 0
+            if prune:
+                self._prune(connection)
+        except sqlite3.Error:
+            self._count("disk_errors")
+        self._flush_touched()
+
+    def _prune(self, connection: sqlite3.Connection):
+        """Drop the least recently used rows once the store exceeds max_disk_entries"""
+        # Pending hits must land before deciding what was least recently used
+        self._flush_touched(force=True)
+        count = connection.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        excess = count - self.max_disk_entries
+        if excess > 0:
+            connection.execute(
+                "DELETE FROM translations WHERE key IN "
+                "(SELECT key FROM translations ORDER BY last_used LIMIT ?)",
+                (excess,)
+            )
+
+    def clear(self):
+        """Clear both levels"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            self._touched.clear()
+        if self.path:
+            try:
+                self._connection().execute("DELETE FROM translations")
+            except sqlite3.Error:
+                self._count("disk_errors")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            entries = len(self._memory)
+            memory_bytes = self._memory_bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        return {
+            **stats,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": entries,
+            "memory_bytes": memory_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "persistent": bool(self.path),
+        }
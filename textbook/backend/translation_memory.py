@@ -0,0 +1,271 @@
+"""
+Translation Memory
+Aligned English/Urdu segments from the published textbook, used to
+translate known passages locally before falling back to the remote translator
+"""
+
+import difflib
+import html
+import json
+import os
+import re
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+BACKEND_DIR = Path(__file__).resolve().parent
+DEFAULT_DOCS_DIR = BACKEND_DIR.parent / "docs"
+DEFAULT_I18N_DIR = BACKEND_DIR.parent / "i18n" / "ur" / "docusaurus-plugin-content-docs" / "current"
+
+# Block-level JSX elements whose text makes up one aligned segment
+JSX_BLOCK = re.compile(r'<(h[1-6]|p|li|td|th|summary|figcaption)\b[^>]*>(.*?)</\1>', re.DOTALL)
+JSX_CODE = re.compile(r'<pre\b.*?</pre>', re.DOTALL)
+TAG = re.compile(r'<[^>]+>')
+JSX_EXPRESSION = re.compile(r"\{\s*(['\"`])(.*?)\1\s*\}", re.DOTALL)
+WHITESPACE = re.compile(r'\s+')
+MARKDOWN_MARKERS = re.compile(r'^(#{1,6}\s+|[-*+]\s+|\d+[.)]\s+|>\s*)')
+MARKDOWN_INLINE = re.compile(r'(\*\*|__|`)')
+NON_WORD = re.compile(r'[\W_]+', re.UNICODE)
+# A closing question or exclamation mark, possibly followed by markup or emoji
+TERMINAL_MARK = re.compile(r'([?!؟])[^\w?!؟]*$', re.UNICODE)
+
+
+def normalize(text: str) -> str:
+    """Key for exact lookups: whitespace collapsed"""
+    return WHITESPACE.sub(' ', text).strip()
+
+
+def loose_key(text: str) -> str:
+    """
+    Key for near-exact lookups: case, punctuation, emoji and markdown
+    ignored, except a closing ? or !, which turns a statement into a
+    question or an exclamation
+    """
+    key = NON_WORD.sub(' ', text.lower()).strip()
+    terminal = TERMINAL_MARK.search(text)
+    if terminal and key:
+        key += ' ' + ('?' if terminal.group(1) == '؟' else terminal.group(1))
+    return key
+
+
+def _clean_jsx(fragment: str) -> str:
+    fragment = JSX_EXPRESSION.sub(lambda m: m.group(2), fragment)
+    return normalize(html.unescape(TAG.sub('', fragment)))
+
+
+def _jsx_blocks(source: str) -> List[Tuple[str, str]]:
+    """(tag, text) for every block element, skipping code listings"""
+    source = JSX_CODE.sub('', source)
+    return [(m.group(1), _clean_jsx(m.group(2))) for m in JSX_BLOCK.finditer(source)]
+
+
+def _markdown_blocks(source: str) -> List[Tuple[str, str]]:
+    """(kind, text) for every heading, list item and paragraph outside code fences"""
+    if source.startswith('---'):
+        end = source.find('\n---', 3)
+        source = source[end + 4:] if end != -1 else source
+
+    blocks: List[Tuple[str, str]] = []
+    in_fence = False
+    paragraph: List[str] = []
+
+    def flush():
+        if paragraph:
+            blocks.append(('p', normalize(' '.join(paragraph))))
+            paragraph.clear()
+
+    for line in source.splitlines():
+        stripped = line.strip()
+        if stripped.startswith('```'):
+            flush()
+            in_fence = not in_fence
+            continue
+        if in_fence or stripped.startswith(('import ', 'export ', '<', '|')):
+            flush()
+            continue
+        if not stripped:
+            flush()
+            continue
+
+        marker = MARKDOWN_MARKERS.match(stripped)
+        if marker:
+            flush()
+            kind = 'h' if stripped.startswith('#') else 'li'
+            blocks.append((kind, normalize(MARKDOWN_INLINE.sub('', stripped[marker.end():]))))
+        else:
+            paragraph.append(MARKDOWN_INLINE.sub('', stripped))
+    flush()
+    return [(kind, text) for kind, text in blocks if text]
+
+
+def _align(english: List[Tuple[str, str]], urdu: List[Tuple[str, str]]) -> Iterable[Tuple[str, str]]:
+    """Pair blocks wherever both sides have the same run of element types"""
+    matcher = difflib.SequenceMatcher(None, [kind for kind, _ in english], [kind for kind, _ in urdu], autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            for (_, en), (_, ur) in zip(english[i1:i2], urdu[j1:j2]):
+                if en and ur and en != ur:
+                    yield en, ur
+
+
+def extract_bilingual_pairs(source: str) -> List[Tuple[str, str]]:
+    """
+    Pairs from a page that renders both languages itself:
+    `if (isUrdu) { return (<Urdu JSX>); } return (<English JSX>);`
+    """
+    start = source.find('if (isUrdu)')
+    if start == -1:
+        return []
+    split = source.rfind('return (')
+    if split <= start:
+        return []
+    return list(_align(_jsx_blocks(source[split:]), _jsx_blocks(source[start:split])))
+
+
+def extract_parallel_pairs(english_source: str, urdu_source: str) -> List[Tuple[str, str]]:
+    """Pairs from an English doc and its translated copy under i18n/ur"""
+    if '<' in english_source and 'return (' in english_source:
+        return list(_align(_jsx_blocks(english_source), _jsx_blocks(urdu_source)))
+    return list(_align(_markdown_blocks(english_source), _markdown_blocks(urdu_source)))
+
+
+def english_blocks(source: str) -> List[str]:
+    """English headings, paragraphs and list items of a page, without code or markup"""
+    if '<' in source and 'return (' in source:
+        if 'if (isUrdu)' in source:
+            # Bilingual page: the English JSX is the final return
+            source = source[source.rfind('return ('):]
+        blocks = _jsx_blocks(source)
+    else:
+        blocks = _markdown_blocks(source)
+    return [text for _, text in blocks if text]
+
+
+class TranslationMemory:
+    """
+    Exact and near-exact lookup of English segments.
+    Built lazily from the textbook sources on first use, or loaded from a
+    JSON export (TRANSLATION_MEMORY_PATH) when the backend is deployed
+    without the docs. There is deliberately no fuzzy matching: a similar
+    sentence ("is required" / "is not required") can mean the opposite,
+    so anything that is not a near-exact match goes to the remote translator.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("TRANSLATION_MEMORY_ENABLED", "true").lower() != "false"
+        self.docs_dir = Path(os.getenv("TRANSLATION_MEMORY_DOCS_DIR", str(DEFAULT_DOCS_DIR)))
+        self.i18n_dir = Path(os.getenv("TRANSLATION_MEMORY_I18N_DIR", str(DEFAULT_I18N_DIR)))
+        self.export_path = os.getenv("TRANSLATION_MEMORY_PATH", "")
+
+        self._exact: Dict[str, str] = {}
+        self._loose: Dict[str, str] = {}
+        self._built = False
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "near_hits": 0, "misses": 0}
+        self.sources = 0
+
+    def _ensure_built(self):
+        if self._built:
+            return
+        with self._lock:
+            if self._built:
+                return
+            pairs = self._load_pairs()
+            for english, urdu in pairs:
+                self.add(english, urdu)
+            self._built = True
+            print(f"Translation memory: {len(self._exact)} segments from {self.sources} sources")
+
+    def _load_pairs(self) -> List[Tuple[str, str]]:
+        if self.export_path and os.path.exists(self.export_path):
+            with open(self.export_path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.sources = data.get("sources", 0)
+            return [tuple(pair) for pair in data["pairs"]]
+
+        pairs: List[Tuple[str, str]] = []
+        if not self.docs_dir.is_dir():
+            print(f"Translation memory: docs not found at {self.docs_dir}")
+            return pairs
+
+        for path in sorted(self.docs_dir.rglob("*.md*")):
+            if path.suffix not in (".md", ".mdx"):
+                continue
+            source = path.read_text(encoding="utf-8")
+            found = extract_bilingual_pairs(source)
+
+            translated = self.i18n_dir / path.relative_to(self.docs_dir)
+            if translated.is_file():
+                translated_source = translated.read_text(encoding="utf-8")
+                if translated_source != source:
+                    found += extract_parallel_pairs(source, translated_source)
+
+            if found:
+                self.sources += 1
+                pairs.extend(found)
+        return pairs
+
+    def add(self, english: str, urdu: str):
+        """Register one aligned pair; the first translation seen for a segment wins"""
+        key = normalize(english)
+        if not key or key in self._exact:
+            return
+        self._exact[key] = urdu
+        loose = loose_key(key)
+        if loose and loose not in self._loose:
+            self._loose[loose] = urdu
+
+    def lookup(self, text: str) -> Optional[str]:
+        """Urdu for an English segment, or None if the memory has no match"""
+        if not self.enabled:
+            return None
+        self._ensure_built()
+
+        key = normalize(text)
+        if not key:
+            return None
+
+        result = self._exact.get(key)
+        if result is not None:
+            self._stats["exact_hits"] += 1
+            return result
+
+        loose = loose_key(key)
+        result = self._loose.get(loose) if loose else None
+        if result is not None:
+            self._stats["near_hits"] += 1
+            return result
+
+        self._stats["misses"] += 1
+        return None
+
+    def export(self, path: str):
+        """Write the aligned pairs to JSON for deployments without the docs"""
+        self._ensure_built()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"sources": self.sources, "pairs": list(self._exact.items())}, f, ensure_ascii=False, indent=1)
+
+    def stats(self) -> Dict:
+        stats = dict(self._stats)
+        lookups = sum(stats.values())
+        hits = lookups - stats["misses"]
+        return {
+            **stats,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "segments": len(self._exact),
+            "sources": self.sources,
+            "built": self._built,
+            "enabled": self.enabled,
+        }
+
+
+if __name__ == "__main__":
+    # python translation_memory.py [export.json]
+    memory = TranslationMemory()
+    if len(sys.argv) > 1:
+        memory.export(sys.argv[1])
+        print(f"Wrote {sys.argv[1]}")
+    else:
+        memory._ensure_built()
+        print(json.dumps(memory.stats(), indent=2))
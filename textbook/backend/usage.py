@@ -0,0 +1,416 @@
+"""
+Usage Accounting
+Token and cost tracking for every LLM and embedding call, aggregated in
+memory, flushed to the usage table in batches, with optional budgets
+
+Rollups (from textbook/backend):
+    python usage.py --group-by user --days 7
+    python usage.py --group-by feature --days 1
+"""
+
+import asyncio
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import func
+
+from cache import TTLCache
+from database import SessionLocal, UsageRecord
+from tracing import record_error
+
+# USD per million tokens as prompt/completion; override with USAGE_PRICES
+DEFAULT_PRICES = "openai/gpt-3.5-turbo=0.5/1.5,text-embedding-3-small=0.02/0"
+
+
+class UsageContext(NamedTuple):
+    """Who and what a call is attributed to"""
+    feature: str
+    user_id: Optional[str] = None
+    session_id: Optional[str] = None
+    level: Optional[str] = None
+
+
+# Callers without a verified token are attributed and budgeted per client address
+ANONYMOUS_PREFIX = "anonymous:"
+
+
+def usage_user_id(verified_user_id: Optional[str], client_host: Optional[str]) -> Optional[str]:
+    """
+    The id spend is recorded and budgeted under. Only a verified token
+    names a user: a user_id in the request body is not trusted, since
+    changing it per request would sidestep the daily budget.
+    """
+    if verified_user_id:
+        return verified_user_id
+    return f"{ANONYMOUS_PREFIX}{client_host}" if client_host else None
+
+
+_current: ContextVar[Optional[UsageContext]] = ContextVar("usage_context", default=None)
+
+
+@contextmanager
+def usage_scope(context: UsageContext):
+    """
+    Attribute calls made inside the block to context.
+    Context variables follow run_in_threadpool into worker threads.
+    Restores the previous value rather than resetting a token, so a
+    streaming generator finalized in another context does not raise.
+    """
+    previous = _current.get()
+    _current.set(context)
+    try:
+        yield
+    finally:
+        _current.set(previous)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for providers that do not report usage"""
+    return max(1, len(text) // 4)
+
+
+def _load_prices(config: str) -> Dict[str, Tuple[float, float]]:
+    prices = {}
+    for entry in config.split(","):
+        if not entry.strip():
+            continue
+        model, sep, rates = entry.strip().rpartition("=")
+        prompt, _, completion = rates.partition("/")
+        if not sep or not model:
+            raise ValueError("USAGE_PRICES entries must look like model=prompt/completion")
+        prices[model] = (float(prompt), float(completion or 0))
+    return prices
+
+
+class UsageTracker:
+    """
+    Records usage per call and keeps running totals by feature, model and
+    level. Records are buffered and written by a background task every
+    USAGE_FLUSH_INTERVAL_SECONDS, or sooner once USAGE_FLUSH_BATCH_SIZE
+    records are waiting.
+
+    Budgets (0 disables): USAGE_USER_DAILY_TOKEN_BUDGET for signed-in
+    users, USAGE_ANONYMOUS_DAILY_TOKEN_BUDGET per client address for
+    everyone else, and USAGE_SESSION_TOKEN_BUDGET. Over budget, budget_action() returns
+    USAGE_BUDGET_ACTION: "fallback" (cheaper model) or "degraded" (no LLM).
+    Spend is read from the database once per USAGE_BUDGET_REFRESH_SECONDS
+    and counted in memory in between, so limits are shared across workers
+    with a short lag.
+    """
+
+    def __init__(self):
+        self.prices = _load_prices(os.getenv("USAGE_PRICES", DEFAULT_PRICES))
+        self.enabled = os.getenv("USAGE_TRACKING_ENABLED", "true").lower() != "false"
+        self.flush_interval_seconds = float(os.getenv("USAGE_FLUSH_INTERVAL_SECONDS", 10))
+        self.flush_batch_size = int(os.getenv("USAGE_FLUSH_BATCH_SIZE", 200))
+        self.max_buffer = int(os.getenv("USAGE_MAX_BUFFER", 10000))
+        self.user_daily_budget = int(os.getenv("USAGE_USER_DAILY_TOKEN_BUDGET", 0))
+        self.anonymous_daily_budget = int(os.getenv("USAGE_ANONYMOUS_DAILY_TOKEN_BUDGET", 0))
+        self.session_budget = int(os.getenv("USAGE_SESSION_TOKEN_BUDGET", 0))
+        self.budget_action_name = os.getenv("USAGE_BUDGET_ACTION", "fallback")
+        if self.budget_action_name not in ("fallback", "degraded"):
+            raise ValueError("USAGE_BUDGET_ACTION must be 'fallback' or 'degraded'")
+        refresh_seconds = float(os.getenv("USAGE_BUDGET_REFRESH_SECONDS", 60))
+
+        self._lock = threading.Lock()
+        self._buffer: List[Dict] = []
+        self._totals: Dict[Tuple[str, str, str], Dict] = {}
+        self._levels: Dict[str, int] = {}
+        # Tokens spent per (user, day) and per session, seeded from the database
+        self._user_spend = TTLCache("usage_user_spend", 50000, refresh_seconds)
+        self._session_spend = TTLCache("usage_session_spend", 50000, refresh_seconds)
+        self._task: Optional[asyncio.Task] = None
+        self._flush_requested: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stats = {
+            "flushes": 0,
+            "records_flushed": 0,
+            "records_dropped": 0,
+            "flush_errors": 0,
+            "budget_fallbacks": 0,
+            "budget_degraded": 0,
+            "last_error": None,
+        }
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        prompt_price, completion_price = self.prices.get(model, (0.0, 0.0))
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+    def record(self, kind: str, model: str, prompt_tokens: int, completion_tokens: int = 0,
+               estimated: bool = False):
+        """Record one call, attributed to the current usage_scope"""
+        if not self.enabled:
+            return
+        context = _current.get() or UsageContext(feature="unattributed")
+        cost = self.cost(model, prompt_tokens, completion_tokens)
+        tokens = prompt_tokens + completion_tokens
+        now = datetime.utcnow()
+
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                self._buffer.pop(0)
+                self._stats["records_dropped"] += 1
+            self._buffer.append({
+                "created_at": now,
+                "user_id": context.user_id,
+                "session_id": context.session_id,
+                "feature": context.feature,
+                "level": context.level,
+                "kind": kind,
+                "model": model,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "cost_usd": cost,
+                "estimated": estimated,
+            })
+            totals = self._totals.setdefault((context.feature, kind, model), {
+                "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0
+            })
+            totals["calls"] += 1
+            totals["prompt_tokens"] += prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+            totals["cost_usd"] += cost
+            if context.level:
+                self._levels[context.level] = self._levels.get(context.level, 0) + tokens
+            buffered = len(self._buffer)
+
+        # Only spend already seeded from the database is counted here;
+        # anything else is picked up by the next seed
+        if context.user_id:
+            key = (context.user_id, now.date())
+            spent = self._user_spend.get(key)
+            if spent is not None:
+                self._user_spend.set(key, spent + tokens)
+        if context.session_id:
+            spent = self._session_spend.get(context.session_id)
+            if spent is not None:
+                self._session_spend.set(context.session_id, spent + tokens)
+
+        if buffered >= self.flush_batch_size and self._flush_requested is not None:
+            self._loop.call_soon_threadsafe(self._flush_requested.set)
+
+    def _unflushed_tokens(self, field: str, value: str, since: Optional[datetime]) -> int:
+        with self._lock:
+            return sum(
+                row["prompt_tokens"] + row["completion_tokens"]
+                for row in self._buffer
+                if row[field] == value and (since is None or row["created_at"] >= since)
+            )
+
+    def _seed(self, column, value: str, since: Optional[datetime] = None) -> int:
+        """Tokens already recorded in the database plus the unflushed buffer"""
+        db = SessionLocal()
+        try:
+            query = db.query(
+                func.coalesce(func.sum(UsageRecord.prompt_tokens + UsageRecord.completion_tokens), 0)
+            ).filter(column == value)
+            if since is not None:
+                query = query.filter(UsageRecord.created_at >= since)
+            stored = int(query.scalar() or 0)
+        finally:
+            db.close()
+        return stored + self._unflushed_tokens(column.key, value, since)
+
+    def user_tokens_today(self, user_id: str) -> int:
+        today = datetime.utcnow().date()
+        key = (user_id, today)
+        spent = self._user_spend.get(key)
+        if spent is None:
+            spent = self._seed(UsageRecord.user_id, user_id, datetime.combine(today, datetime.min.time()))
+            self._user_spend.set(key, spent)
+        return spent
+
+    def session_tokens(self, session_id: str) -> int:
+        spent = self._session_spend.get(session_id)
+        if spent is None:
+            spent = self._seed(UsageRecord.session_id, session_id)
+            self._session_spend.set(session_id, spent)
+        return spent
+
+    def budget_action(self) -> Optional[str]:
+        """
+        "fallback" or "degraded" when the current user or session is over
+        budget, otherwise None. Blocking (may query the database).
+        """
+        if not self.enabled or not (self.user_daily_budget or self.anonymous_daily_budget or self.session_budget):
+            return None
+        context = _current.get()
+        if context is None:
+            return None
+
+        daily_budget = None
+        if context.user_id:
+            anonymous = context.user_id.startswith(ANONYMOUS_PREFIX)
+            daily_budget = self.anonymous_daily_budget if anonymous else self.user_daily_budget
+
+        try:
+            over = (
+                (daily_budget
+                 and self.user_tokens_today(context.user_id) >= daily_budget)
+                or (self.session_budget and context.session_id
+                    and self.session_tokens(context.session_id) >= self.session_budget)
+            )
+        except Exception as e:
+            # Never fail a chat because the budget could not be checked
+            record_error("usage", "budget", e)
+            return None
+
+        if not over:
+            return None
+        self._stats["budget_fallbacks" if self.budget_action_name == "fallback" else "budget_degraded"] += 1
+        return self.budget_action_name
+
+    def flush(self) -> int:
+        """Write buffered records in one batch (blocking). Returns the number written."""
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return 0
+
+        db = SessionLocal()
+        try:
+            db.bulk_insert_mappings(UsageRecord, rows)
+            db.commit()
+            self._stats["flushes"] += 1
+            self._stats["records_flushed"] += len(rows)
+            self._stats["last_error"] = None
+            return len(rows)
+        except Exception as e:
+            db.rollback()
+            self._stats["flush_errors"] += 1
+            self._stats["last_error"] = str(e)
+            # Put the batch back in front, within the buffer bound
+            with self._lock:
+                self._buffer = (rows + self._buffer)[-self.max_buffer:]
+            raise
+        finally:
+            db.close()
+
+    async def _run_forever(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), self.flush_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                print(f"Usage flush error: {e}")
+
+    def start(self):
+        """Start the background flush loop on the running event loop"""
+        if self.enabled and self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._flush_requested = asyncio.Event()
+            self._task = self._loop.create_task(self._run_forever())
+
+    async def stop(self):
+        """Stop the flush loop and write whatever is still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._flush_requested = None
+        try:
+            await asyncio.to_thread(self.flush)
+        except Exception as e:
+            print(f"Usage flush error: {e}")
+
+    def stats(self) -> Dict:
+        def add(groups: Dict[str, Dict], key: str, totals: Dict):
+            entry = groups.setdefault(key, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0})
+            for field in entry:
+                entry[field] += totals[field]
+
+        by_feature: Dict[str, Dict] = {}
+        by_model: Dict[str, Dict] = {}
+        with self._lock:
+            for (feature, _, model), totals in self._totals.items():
+                add(by_feature, feature, totals)
+                add(by_model, model, totals)
+            levels = dict(self._levels)
+            buffered = len(self._buffer)
+
+        for groups in (by_feature, by_model):
+            for entry in groups.values():
+                entry["cost_usd"] = round(entry["cost_usd"], 6)
+                entry["avg_prompt_tokens"] = round(entry["prompt_tokens"] / entry["calls"], 1)
+
+        return {
+            **self._stats,
+            "enabled": self.enabled,
+            "buffered": buffered,
+            "by_feature": by_feature,
+            "by_model": by_model,
+            "tokens_by_level": levels,
+            "user_daily_budget": self.user_daily_budget,
+            "anonymous_daily_budget": self.anonymous_daily_budget,
+            "session_budget": self.session_budget,
+        }
+
+
+def rollup(db, group_by: str, since: Optional[datetime] = None, limit: int = 50) -> List[Dict]:
+    """Usage totals from the database grouped by user, session, feature, level or model"""
+    columns = {
+        "user": UsageRecord.user_id,
+        "session": UsageRecord.session_id,
+        "feature": UsageRecord.feature,
+        "level": UsageRecord.level,
+        "model": UsageRecord.model,
+    }
+    if group_by not in columns:
+        raise ValueError(f"group_by must be one of: {', '.join(columns)}")
+
+    column = columns[group_by]
+    total_tokens = func.sum(UsageRecord.prompt_tokens + UsageRecord.completion_tokens)
+    query = db.query(
+        column,
+        func.count(UsageRecord.id),
+        func.sum(UsageRecord.prompt_tokens),
+        func.sum(UsageRecord.completion_tokens),
+        func.sum(UsageRecord.cost_usd),
+    )
+    if since is not None:
+        query = query.filter(UsageRecord.created_at >= since)
+    rows = query.group_by(column).order_by(total_tokens.desc()).limit(limit).all()
+
+    return [
+        {
+            group_by: key,
+            "calls": calls,
+            "prompt_tokens": int(prompt or 0),
+            "completion_tokens": int(completion or 0),
+            "cost_usd": round(float(cost or 0), 6),
+        }
+        for key, calls, prompt, completion, cost in rows
+    ]
+
+
+# Global usage tracker instance
+usage_tracker = UsageTracker()
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Summarize recorded token usage")
+    parser.add_argument("--group-by", default="user", help="user, session, feature, level or model")
+    parser.add_argument("--days", type=float, default=1.0, help="Look back this many days (0 for all time)")
+    parser.add_argument("--limit", type=int, default=50, help="Rows to show")
+    args = parser.parse_args()
+
+    since = datetime.utcnow() - timedelta(days=args.days) if args.days else None
+    session = SessionLocal()
+    try:
+        print(json.dumps(rollup(session, args.group_by, since, args.limit), indent=2, default=str))
+    finally:
+        session.close()
@@ -72,6 +72,22 @@ export default function ChatWidget() {
         }
     };
 
+    const clearStoredToken = () => {
+        const currentUser = (window as any).currentUser;
+        if (currentUser) {
+            delete currentUser.token;
+        }
+        try {
+            const savedUser = localStorage.getItem('user');
+            if (savedUser) {
+                const { token, ...rest } = JSON.parse(savedUser);
+                localStorage.setItem('user', JSON.stringify(rest));
+            }
+        } catch (error) {
+            console.error('Error clearing stored token:', error);
+        }
+    };
+
     const sendMessage = async () => {
         if (!input.trim() || !sessionId) return;
 
@@ -92,6 +108,8 @@ export default function ChatWidget() {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
+                    // Signed token lets the backend personalize without a profile lookup
+                    ...(currentUser?.token ? { Authorization: `Bearer ${currentUser.token}` } : {}),
                 },
                 body: JSON.stringify({
                     session_id: sessionId,
@@ -103,6 +121,15 @@ export default function ChatWidget() {
                 }),
             });
 
+            if (response.headers.get('X-Token-Status') === 'rejected') {
+                // Expired or legacy token: the backend answered anonymously,
+                // so forget the token until the user signs in again
+                clearStoredToken();
+            }
+            if (!response.ok) {
+                throw new Error(`Chat request failed with status ${response.status}`);
+            }
+
             const data = await response.json();
 
             const assistantMessage: Message = {